@@ -61,6 +61,7 @@ __all__ = [
     'NUMBA_CUDA_AVAIL',
     'TARGET',
     'OMP_NUM_THREADS',
+    'MEMCACHE_MAX_BYTES',
     'FTYPE',
     'HASH_SIGFIGS',
     'EPSILON',
@@ -117,6 +118,15 @@ if 'OMP_NUM_THREADS' in os.environ:
     assert OMP_NUM_THREADS >= 1
 
 
+MEMCACHE_MAX_BYTES = None
+"""Budget (in bytes) for the contents of all in-memory caches of a process
+(see `pisa.utils.cache.MemoryCache`); None for no limit"""
+
+if 'PISA_MEMCACHE_MAX_BYTES' in os.environ:
+    MEMCACHE_MAX_BYTES = int(float(os.environ['PISA_MEMCACHE_MAX_BYTES']))
+    assert MEMCACHE_MAX_BYTES >= 0
+
+
 NUMBA_AVAIL = False
 def dummy_func(x):
     """Decorate to to see if Numba actually works"""
@@ -6,25 +6,29 @@ Common tools for performing an analysis collected into a single class
 
 from __future__ import absolute_import, division
 
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 from collections import OrderedDict 
 from copy import deepcopy
 from itertools import product
+import multiprocessing
 import re
 import sys
 import time
+import weakref
 
 import numpy as np
 import scipy.optimize as optimize
 
 from pisa import EPSILON, FTYPE, ureg
-from pisa.core.detectors import Detectors
+from pisa.core.detectors import Detectors, reset_after_fork
 from pisa.core.map import Map, MapSet
 from pisa.core.param import ParamSet
 from pisa.utils.comparisons import recursiveEquality
 from pisa.utils.log import logging
 from pisa.utils.fileio import to_file
-from pisa.utils.stats import METRICS_TO_MAXIMIZE, METRICS_TO_MINIMIZE
+from pisa.utils.hash import hash_obj
+from pisa.utils.stats import (GRADIENT_METRICS, METRICS_TO_MAXIMIZE,
+                              METRICS_TO_MINIMIZE, metric_gradient)
 
 
 __all__ = ['MINIMIZERS_USING_SYMM_GRAD',
@@ -292,6 +296,86 @@ def get_separate_t23_octant_params(hypo_maker,inflection_point) :
     return theta23_orig,theta23_case1,theta23_case2
 
 
+def set_free_param_values(hypo_maker, start_params):
+    """Move the free params of `hypo_maker` to the values in `start_params`,
+    e.g. to seed a fit with the result of a previous one.
+
+    Params in `start_params` that are not free in `hypo_maker`, or whose value
+    lies outside the param's current range, are left untouched.
+
+    Parameters
+    ----------
+    hypo_maker : DistributionMaker or Detectors
+
+    start_params : ParamSet, Mapping, or fit_info OrderedDict
+        If a fit_info (as returned by `Analysis.fit_hypo`), its 'params' are
+        used; a Mapping is interpreted as {param name: value}.
+
+    Returns
+    -------
+    set_names : list of str
+        Names of the params whose values were set
+
+    """
+    if isinstance(start_params, Mapping) and 'params' in start_params:
+        start_params = start_params['params']
+    if isinstance(start_params, ParamSet):
+        start_params = start_params.name_val_dict
+
+    free_params = hypo_maker.params.free
+    set_names = []
+    for name, value in start_params.items():
+        if name not in free_params.names:
+            continue
+        param = hypo_maker.params[name]
+        try:
+            param.value = value
+        except ValueError:
+            logging.debug(
+                'Not seeding param %s: start value %s not in range %s',
+                name, value, param.range
+            )
+            continue
+        set_names.append(name)
+    return set_names
+
+
+_JAC_WORKER_STATE = None
+"""Per-process copy of what is needed to evaluate the metric in a gradient
+worker, set by `_init_jac_worker`"""
+
+
+def _init_jac_worker(analysis, hypo_maker, data_dist, metric, blind,
+                     external_priors_penalty):
+    """Initializer of the processes computing finite-difference gradients"""
+    global _JAC_WORKER_STATE # pylint: disable=global-statement
+    # thread pools of the (forked) makers have no threads in this process
+    reset_after_fork()
+    if hasattr(hypo_maker, 'set_derivative_params'):
+        # workers only evaluate the metric; no need for derivatives
+        hypo_maker.set_derivative_params([])
+    _JAC_WORKER_STATE = (analysis, hypo_maker, data_dist, metric, blind,
+                         external_priors_penalty)
+
+
+def _eval_jac_point(scaled_param_vals):
+    """Evaluate the minimizer objective at `scaled_param_vals` in a gradient
+    worker"""
+    (analysis, hypo_maker, data_dist, metric, blind,
+     external_priors_penalty) = _JAC_WORKER_STATE
+    return analysis._minimizer_callable( # pylint: disable=protected-access
+        scaled_param_vals=scaled_param_vals,
+        hypo_maker=hypo_maker,
+        data_dist=data_dist,
+        metric=metric,
+        counter=Counter(),
+        fit_history=[],
+        pprint=False,
+        blind=blind,
+        external_priors_penalty=external_priors_penalty
+    )
+
+
 # TODO: move this to a central location prob. in utils
 class Counter(object):
     """Simple counter object for use as a minimizer callback."""
@@ -327,15 +411,128 @@ class Analysis(object):
         `distribution_maker` to fit its output (as closely as possible) to the
         data distribution is provided. See [minimizer_settings] for
 
+    Parameters
+    ----------
+    fit_memo_size : int
+        Number of completed `fit_hypo` results to remember. A fit that is
+        requested again for the same data distribution, hypothesis (hypo
+        maker, param selections, fixed param values, free param ranges and
+        priors), starting point, metric(s), and minimizer settings is then
+        returned from memory instead of being recomputed. The least recently
+        used entry is dropped once the memo is full. 0 disables memoization.
+
+    num_jac_workers : int
+        For minimizers in `MINIMIZERS_USING_SYMM_GRAD`, compute the
+        (symmetric) finite-difference gradient of the metric by evaluating
+        the 2N displaced points of the N free params concurrently in this many
+        processes, each holding a copy of the hypo maker forked at the start of
+        the fit. 1 leaves the gradient to the minimizer (evaluating all points
+        in sequence).
+
+    analytic_gradients : bool
+        For minimizers in `MINIMIZERS_USING_SYMM_GRAD` and metrics in
+        `GRADIENT_METRICS`, obtain the gradient of the metric w.r.t. those free
+        params whose derivatives the stages of the hypo maker propagate
+        analytically (see `DistributionMaker.set_derivative_params`) from a
+        single evaluation of the hypo maker, via the chain rule. The gradient
+        w.r.t. all other free params is still computed from finite differences
+        (making use of `num_jac_workers`).
+
     """
-    def __init__(self):
+    def __init__(self, fit_memo_size=0, num_jac_workers=1,
+                 analytic_gradients=False):
         self._nit = 0
+        assert fit_memo_size >= 0
+        self.fit_memo_size = fit_memo_size
+        self._fit_memo = OrderedDict()
+        self._maker_hashes = {}
+        assert num_jac_workers >= 1
+        self.num_jac_workers = num_jac_workers
+        self.analytic_gradients = analytic_gradients
+
+    def clear_fit_memo(self):
+        """Forget all memoized fits."""
+        self._fit_memo.clear()
+        self._maker_hashes.clear()
+
+    def _maker_hash(self, hypo_maker):
+        """Hash identifying `hypo_maker` (its pipelines and stages), taken
+        the first time the maker is seen. Param values enter the fit memo key
+        separately, while the maker's hash also varies with how its param
+        values were last set."""
+        ref, maker_hash = self._maker_hashes.get(id(hypo_maker), (None, None))
+        if ref is None or ref() is not hypo_maker:
+            maker_hash = hypo_maker.hash
+            self._maker_hashes[id(hypo_maker)] = (weakref.ref(hypo_maker),
+                                                  maker_hash)
+        return maker_hash
+
+    @staticmethod
+    def dist_hash(data_dist):
+        """Hash on the contents of a data distribution (irrespective of any
+        hash value assigned to the maps themselves, which is not set e.g. for
+        pseudo-data).
+
+        Parameters
+        ----------
+        data_dist : MapSet or sequence of MapSets
+
+        Returns
+        -------
+        hash : int
+
+        """
+        if isinstance(data_dist, MapSet):
+            data_dist = [data_dist]
+        return hash_obj([
+            [(m.name, m.binning.hash, hash_obj(m.nominal_values),
+              hash_obj(m.std_devs)) for m in map_set]
+            for map_set in data_dist
+        ])
+
+    def _fit_memo_key(self, data_dist, hypo_maker, hypo_param_selections,
+                      metric, minimizer_settings, **fit_kwargs):
+        """Key identifying a `fit_hypo` call; `hypo_maker` must have its
+        params selected and free params set to the starting point. The
+        maker's hash identifies its pipelines and stages (their source code and
+        settings), such that distinct makers with equal param values do not
+        share fits."""
+        if isinstance(hypo_param_selections, str):
+            hypo_param_selections = [hypo_param_selections]
+        if hypo_param_selections is not None:
+            hypo_param_selections = tuple(hypo_param_selections)
+        free_params = hypo_maker.params.free
+        free_state = [
+            OrderedDict((k, v) for k, v in p.state.items() if k != 'value')
+            for p in free_params
+        ]
+        # `set_minimizer_defaults` may modify the passed settings in place
+        minimizer_settings = set_minimizer_defaults(deepcopy(minimizer_settings))
+        other_kwargs = []
+        for name in sorted(fit_kwargs):
+            val = fit_kwargs[name]
+            if isinstance(val, list):
+                val = tuple(val)
+            other_kwargs.append((name, val))
+        return (
+            self.dist_hash(data_dist),
+            self._maker_hash(hypo_maker),
+            hypo_param_selections,
+            hypo_maker.params.fixed.values_hash,
+            hash_obj(free_state),
+            free_params.values_hash,
+            tuple(metric),
+            minimizer_settings['method']['value'].lower(),
+            hash_obj(sorted(minimizer_settings['options']['value'].items())),
+            tuple(other_kwargs)
+        )
 
     def fit_hypo(self, data_dist, hypo_maker, hypo_param_selections, metric,
                  minimizer_settings, reset_free=True, 
                  check_octant=True, fit_octants_separately=False,
                  check_ordering=False, other_metrics=None,
-                 blind=False, pprint=True, external_priors_penalty=None):
+                 blind=False, pprint=True, external_priors_penalty=None,
+                 start_params=None):
         """Fitter "outer" loop: If `check_octant` is True, run
         `fit_hypo_inner` starting in each octant of theta23 (assuming that
         is a param in the `hypo_maker`). Otherwise, just run the inner
@@ -343,7 +540,11 @@ class Analysis(object):
 
         Note that prior to running the fit, the `hypo_maker` has
         `hypo_param_selections` applied and its free parameters are reset to
-        their nominal values.
+        their nominal values (if `reset_free` is True) and then moved to
+        `start_params` (if specified).
+
+        If the `Analysis` was instantiated with `fit_memo_size` > 0, an
+        identical fit performed before is returned from memory.
 
         Parameters
         ----------
@@ -405,6 +606,13 @@ class Analysis(object):
             User defined prior penalty function. Adds an extra penalty
             to the metric that is minimized, depending on the input function.
 
+        start_params : None, ParamSet, Mapping, or fit_info OrderedDict
+            Start the minimizer from these free param values instead of the
+            nominal (or current) ones, e.g. from the best fit at a neighbouring
+            scan point or from the Asimov fit of the same hypothesis. If a
+            `fit_info` is passed, its 'params' are used. See
+            `set_free_param_values`.
+
 
         Returns
         -------
@@ -419,6 +627,38 @@ class Analysis(object):
         if ( not check_octant ) and fit_octants_separately :
             raise ValueError("If 'check_octant' is False, 'fit_octants_separately' must be False")
 
+        memo_key = None
+        if self.fit_memo_size > 0:
+            hypo_maker.select_params(hypo_param_selections)
+            if reset_free:
+                hypo_maker.reset_free()
+            if start_params is not None:
+                set_free_param_values(hypo_maker, start_params)
+            memo_key = self._fit_memo_key(
+                data_dist=data_dist,
+                hypo_maker=hypo_maker,
+                hypo_param_selections=hypo_param_selections,
+                metric=metric,
+                minimizer_settings=minimizer_settings,
+                check_octant=check_octant,
+                fit_octants_separately=fit_octants_separately,
+                check_ordering=check_ordering,
+                other_metrics=other_metrics,
+                blind=blind,
+                external_priors_penalty=external_priors_penalty
+            )
+            if memo_key in self._fit_memo:
+                logging.info('Fit found in memo, not fitting again.')
+                self._fit_memo.move_to_end(memo_key)
+                best_fit_info, alternate_fits = deepcopy(
+                    self._fit_memo[memo_key]
+                )
+                if blind:
+                    hypo_maker.reset_free()
+                else:
+                    set_free_param_values(hypo_maker, best_fit_info)
+                return best_fit_info, alternate_fits
+
         if check_ordering:
             if 'nh' in hypo_param_selections or 'ih' in hypo_param_selections:
                 raise ValueError('One of the orderings has already been '
@@ -445,9 +685,10 @@ class Analysis(object):
             # Reset free parameters to nominal values
             if reset_free:
                 hypo_maker.reset_free()
-            else:
-                # Saves the current minimizer start values for the octant check
-                minimizer_start_params = hypo_maker.params
+            if start_params is not None:
+                set_free_param_values(hypo_maker, start_params)
+            # Save the minimizer start values for the octant check
+            minimizer_start_values = hypo_maker.params.free.name_val_dict
 
             # Determine if checking theta23 octant
             peforming_octant_check = check_octant and ( 'theta23' in hypo_maker.params.free.names )
@@ -479,11 +720,9 @@ class Analysis(object):
             # Decide whether fit for other octant is necessary
             if peforming_octant_check :
                 logging.debug('checking other octant of theta23')
-                if reset_free:
-                    hypo_maker.reset_free()
-                else:
-                    for param in minimizer_start_params:
-                        hypo_maker.params[param.name].value = param.value
+                if fit_octants_separately:
+                    minimizer_start_values.pop('theta23', None)
+                set_free_param_values(hypo_maker, minimizer_start_values)
 
                 #Determine new values for theta23 parameter in the other octant
                 if fit_octants_separately :
@@ -578,6 +817,11 @@ class Analysis(object):
                     theta23_orig.value = hypo_maker.params.theta23.value
                     hypo_maker.update_params(theta23_orig)
 
+        if memo_key is not None:
+            self._fit_memo[memo_key] = deepcopy((best_fit_info, alternate_fits))
+            while len(self._fit_memo) > self.fit_memo_size:
+                self._fit_memo.popitem(last=False)
+
         return best_fit_info, alternate_fits
 
     def fit_hypo_inner(self, data_dist, hypo_maker, metric, minimizer_settings,
@@ -720,18 +964,75 @@ class Analysis(object):
 
             sys.stdout.write(hdr)
 
+        analytic_params = ()
+        if (minimizer_method in MINIMIZERS_USING_SYMM_GRAD
+                and self.analytic_gradients
+                and self._check_analytic_gradients_possible(hypo_maker,
+                                                            metric)):
+            analytic_params = hypo_maker.set_derivative_params(
+                hypo_maker.params.free.names
+            )
+            logging.debug('Analytic derivatives w.r.t. params %s',
+                          analytic_params)
+
+        jac_pool = None
+        jac = None
+        if (minimizer_method in MINIMIZERS_USING_SYMM_GRAD
+                and self.num_jac_workers > 1
+                and len(analytic_params) < len(x0)
+                and self._check_jac_workers_possible(hypo_maker)):
+            jac_pool = multiprocessing.get_context('fork').Pool(
+                self.num_jac_workers,
+                initializer=_init_jac_worker,
+                initargs=(self, hypo_maker, data_dist, metric, blind,
+                          external_priors_penalty)
+            )
+
+        # scipy passes the same `args` to `jac` as to `fun`
+        if analytic_params:
+            def jac(scaled_param_vals, *args): # pylint: disable=unused-argument
+                return self._analytic_minimizer_gradient(
+                    scaled_param_vals=scaled_param_vals,
+                    hypo_maker=hypo_maker,
+                    data_dist=data_dist,
+                    metric=metric,
+                    sign=sign,
+                    analytic_params=analytic_params,
+                    pool=jac_pool,
+                    step_size=step_size,
+                    counter=counter,
+                    blind=blind,
+                    external_priors_penalty=external_priors_penalty
+                )
+        elif jac_pool is not None:
+            def jac(scaled_param_vals, *args): # pylint: disable=unused-argument
+                return self._minimizer_gradient(
+                    scaled_param_vals=scaled_param_vals,
+                    pool=jac_pool,
+                    step_size=step_size,
+                    counter=counter
+                )
+
         # reset number of iterations before each minimization
         self._nit = 0
-        optimize_result = optimize.minimize(
-            fun=self._minimizer_callable,
-            x0=x0,
-            args=(hypo_maker, data_dist, metric, counter, fit_history, pprint,
-                  blind, external_priors_penalty),
-            bounds=bounds,
-            method=minimizer_settings['method']['value'],
-            options=minimizer_settings['options']['value'],
-            callback=self._minimizer_callback
-        )
+        try:
+            optimize_result = optimize.minimize(
+                fun=self._minimizer_callable,
+                x0=x0,
+                args=(hypo_maker, data_dist, metric, counter, fit_history,
+                      pprint, blind, external_priors_penalty),
+                jac=jac,
+                bounds=bounds,
+                method=minimizer_settings['method']['value'],
+                options=minimizer_settings['options']['value'],
+                callback=self._minimizer_callback
+            )
+        finally:
+            if jac_pool is not None:
+                jac_pool.terminate()
+                jac_pool.join()
+            if analytic_params:
+                hypo_maker.set_derivative_params([])
         end_t = time.time()
         if pprint:
             # clear the line
@@ -1084,6 +1385,206 @@ class Analysis(object):
             
         return sign*metric_val
 
+    @staticmethod
+    def _check_jac_workers_possible(hypo_maker):
+        """Whether gradient worker processes can be forked for `hypo_maker`"""
+        if multiprocessing.current_process().daemon:
+            logging.warning(
+                'Cannot start gradient worker processes from a daemonic'
+                ' process (e.g. a trial worker); computing the gradient'
+                ' serially.'
+            )
+            return False
+        if isinstance(hypo_maker, Detectors):
+            dist_makers = hypo_maker.distribution_makers
+        else:
+            dist_makers = [hypo_maker]
+        if any(getattr(dm, 'parallel', None) == 'processes'
+               for dm in dist_makers):
+            raise ValueError(
+                'Distribution makers with parallel="processes" cannot be'
+                ' shared by forked gradient workers; use parallel="threads"'
+                ' or `num_jac_workers` = 1.'
+            )
+        return True
+
+    @staticmethod
+    def _check_analytic_gradients_possible(hypo_maker, metric):
+        """Whether the gradient of `metric` can be obtained from derivatives
+        propagated through `hypo_maker`"""
+        if isinstance(hypo_maker, Detectors):
+            logging.warning('Analytic gradients are not supported for'
+                            ' Detectors; using finite differences.')
+            return False
+        if not hasattr(hypo_maker, 'set_derivative_params'):
+            return False
+        if len(metric) != 1 or metric[0] not in GRADIENT_METRICS:
+            logging.warning(
+                'Analytic gradients are only available for metrics %s, not'
+                ' %s; using finite differences.', GRADIENT_METRICS, metric
+            )
+            return False
+        return True
+
+    @staticmethod
+    def _minimizer_gradient(scaled_param_vals, pool, step_size, counter,
+                            param_indices=None):
+        """Symmetric finite-difference gradient of the minimizer objective,
+        evaluating all displaced points concurrently in the processes of
+        `pool` (see `_init_jac_worker`).
+
+        Parameters
+        ----------
+        scaled_param_vals : sequence of floats
+            Point (in the [0, 1]-scaled free param space) at which to compute
+            the gradient
+
+        pool : multiprocessing.pool.Pool
+
+        step_size : float
+            Displacement in each scaled param on either side of the point
+
+        counter : Counter
+            Incremented by the number of distributions generated
+
+        param_indices : None or sequence of int
+            Only compute the gradient components of these params (all others
+            are returned as zero); defaults to all params
+
+        Returns
+        -------
+        gradient : numpy.ndarray
+
+        """
+        x = np.asarray(scaled_param_vals, dtype=np.float64)
+        if param_indices is None:
+            param_indices = range(len(x))
+        param_indices = list(param_indices)
+        gradient = np.zeros(len(x))
+        if not param_indices:
+            return gradient
+        displacements = step_size * np.eye(len(x))[param_indices]
+        points = np.concatenate([x + displacements, x - displacements])
+        vals = np.array(pool.map(_eval_jac_point, points, chunksize=1))
+        counter += len(points)
+        n = len(param_indices)
+        gradient[param_indices] = (vals[:n] - vals[n:]) / (2 * step_size)
+        return gradient
+
+    def _analytic_minimizer_gradient(self, scaled_param_vals, hypo_maker,
+                                     data_dist, metric, sign, analytic_params,
+                                     pool, step_size, counter, blind,
+                                     external_priors_penalty=None):
+        """Gradient of the minimizer objective, using the derivatives of the
+        hypo maker's outputs w.r.t. `analytic_params` (see
+        `DistributionMaker.get_output_derivatives`) and `metric_gradient` for
+        the components of those params, and symmetric finite differences
+        (computed in `pool` if it is not None) for all others.
+
+        Parameters
+        ----------
+        scaled_param_vals : sequence of floats
+            Point (in the [0, 1]-scaled free param space) at which to compute
+            the gradient
+
+        hypo_maker : DistributionMaker
+            With derivatives propagated w.r.t. `analytic_params`
+
+        data_dist : MapSet
+
+        metric : sequence of one string
+            One of `GRADIENT_METRICS`
+
+        sign : int
+            Sign that the metric is multiplied with in the minimizer objective
+
+        analytic_params : sequence of str
+
+        pool : None or multiprocessing.pool.Pool
+
+        step_size : float
+            Displacement in each scaled param on either side of the point for
+            finite differences
+
+        counter : Counter
+            Incremented by the number of distributions generated
+
+        blind : bool
+
+        external_priors_penalty : func
+            User defined prior penalty function
+
+        Returns
+        -------
+        gradient : numpy.ndarray
+
+        """
+        x = np.asarray(scaled_param_vals, dtype=np.float64)
+        hypo_maker._set_rescaled_free_params(x) # pylint: disable=protected-access
+        hypo_asimov_dist = hypo_maker.get_outputs(return_sum=True)
+        derivatives = hypo_maker.get_output_derivatives(return_sum=True)
+
+        gradient = np.zeros(len(x))
+        numerical_indices = []
+        for i, param in enumerate(hypo_maker.params.free):
+            if param.name not in analytic_params:
+                numerical_indices.append(i)
+                continue
+            dmetric = 0.
+            for deriv_map in derivatives[param.name]:
+                dmetric += np.sum(
+                    metric_gradient(
+                        metric[0],
+                        data_dist[deriv_map.name].nominal_values,
+                        hypo_asimov_dist[deriv_map.name].nominal_values
+                    ) * deriv_map.nominal_values
+                )
+            # the prior only depends on the param itself; differentiate it
+            # numerically in the scaled param (which is cheap)
+            scaled_val = param._rescaled_value # pylint: disable=protected-access
+            penalties = []
+            for displaced_val in (scaled_val + step_size,
+                                  scaled_val - step_size):
+                param._rescaled_value = displaced_val # pylint: disable=protected-access
+                penalties.append(param.prior_penalty(metric=metric[0]))
+            param._rescaled_value = scaled_val # pylint: disable=protected-access
+            # chain rule for the rescaling to [0, 1]
+            width = (param.range[1] - param.range[0]).m_as(param.units)
+            gradient[i] = sign * (
+                dmetric * width + (penalties[0] - penalties[1]) / (2*step_size)
+            )
+
+        if numerical_indices and pool is not None:
+            gradient += self._minimizer_gradient(
+                scaled_param_vals=x,
+                pool=pool,
+                step_size=step_size,
+                counter=counter,
+                param_indices=numerical_indices
+            )
+        elif numerical_indices:
+            for i in numerical_indices:
+                vals = []
+                for displacement in (+step_size, -step_size):
+                    displaced_x = x.copy()
+                    displaced_x[i] += displacement
+                    vals.append(self._minimizer_callable(
+                        scaled_param_vals=displaced_x,
+                        hypo_maker=hypo_maker,
+                        data_dist=data_dist,
+                        metric=metric,
+                        counter=counter,
+                        fit_history=[],
+                        pprint=False,
+                        blind=blind,
+                        external_priors_penalty=external_priors_penalty
+                    ))
+                gradient[i] = (vals[0] - vals[1]) / (2 * step_size)
+            hypo_maker._set_rescaled_free_params(x) # pylint: disable=protected-access
+
+        counter += 1
+        return gradient
+
     def _minimizer_callback(self, xk): # pylint: disable=unused-argument
         """Passed as `callback` parameter to `optimize.minimize`, and is called
         after each iteration. Keeps track of number of iterations.
@@ -1106,7 +1607,7 @@ class Analysis(object):
     def scan(self, data_dist, hypo_maker, metric, hypo_param_selections=None,
              param_names=None, steps=None, values=None, only_points=None,
              outer=True, profile=True, minimizer_settings=None, outfile=None,
-             debug_mode=1, **kwargs):
+             debug_mode=1, batch_size=None, warm_start=False, **kwargs):
         """Set hypo maker parameters named by `param_names` according to
         either values specified by `values` or number of steps specified by
         `steps`, and return the `metric` indicating how well the data
@@ -1219,6 +1720,17 @@ class Analysis(object):
             detailed enough for some simple debugging (1). Any other value for
             `debug_mode` will be set to 2.
 
+        batch_size : None or int
+            If not profiling, let `hypo_maker` precompute what it can (e.g.
+            oscillation probabilities) for this many scan points at once via
+            its `compute_batch` method. None disables batching.
+
+        warm_start : bool
+            If profiling, start the fit at each scan point from the best fit
+            found at the previous point instead of from the nominal values of
+            the free parameters. For fine scans, neighbouring best fits are
+            close and the fits converge in far fewer iterations.
+
         """
 
         if debug_mode not in (0, 1, 2):
@@ -1294,86 +1806,106 @@ class Analysis(object):
         # Fix the parameters to be scanned if `profile` is set to True
         params.fix(param_names)
 
+        points = [pos for i, pos in enumerate(loopfunc(*steplist))
+                  if not points_acc or i in points_acc]
+
+        batch = (batch_size is not None
+                 and (not profile or not hypo_maker.params.free)
+                 and hasattr(hypo_maker, 'compute_batch'))
+
         results = {'steps': {}, 'results': []}
         results['steps'] = {pname: [] for pname in param_names}
-        for i, pos in enumerate(loopfunc(*steplist)):
-            if points_acc and i not in points_acc:
-                continue
+        prev_fit_params = None
+        try:
+            for i, pos in enumerate(points):
+                if batch and i % batch_size == 0:
+                    hypo_maker.compute_batch([
+                        OrderedDict((pname, ureg.Quantity(val))
+                                    for pname, val in batch_pos)
+                        for batch_pos in points[i:i + batch_size]
+                    ])
 
-            msg = ''
-            for (pname, val) in pos:
-                params[pname].value = val
-                results['steps'][pname].append(val)
-                if isinstance(val, float):
-                    msg += '%s = %.2f '%(pname, val)
-                elif isinstance(val, ureg.Quantity):
-                    msg += '%s = %.2f '%(pname, val.magnitude)
+                msg = ''
+                for (pname, val) in pos:
+                    params[pname].value = val
+                    results['steps'][pname].append(val)
+                    if isinstance(val, float):
+                        msg += '%s = %.2f '%(pname, val)
+                    elif isinstance(val, ureg.Quantity):
+                        msg += '%s = %.2f '%(pname, val.magnitude)
+                    else:
+                        raise TypeError("val is of type %s which I don't know "
+                                        "how to deal with in the output "
+                                        "messages."% type(val))
+                logging.info('Working on point ' + msg)
+                hypo_maker.update_params(params)
+
+                # TODO: consistent treatment of hypo_param_selections and scanning
+                if not profile or not hypo_maker.params.free:
+                    logging.info('Not optimizing since `profile` set to False or'
+                                 ' no free parameters found...')
+                    best_fit = self.nofit_hypo(
+                        data_dist=data_dist,
+                        hypo_maker=hypo_maker,
+                        hypo_param_selections=hypo_param_selections,
+                        hypo_asimov_dist=hypo_maker.get_outputs(return_sum=True),
+                        metric=metric,
+                        **{k: v for k,v in kwargs.items() if k not in ["pprint","reset_free","check_octant"]}
+                    )
                 else:
-                    raise TypeError("val is of type %s which I don't know "
-                                    "how to deal with in the output "
-                                    "messages."% type(val))
-            logging.info('Working on point ' + msg)
-            hypo_maker.update_params(params)
-
-            # TODO: consistent treatment of hypo_param_selections and scanning
-            if not profile or not hypo_maker.params.free:
-                logging.info('Not optimizing since `profile` set to False or'
-                             ' no free parameters found...')
-                best_fit = self.nofit_hypo(
-                    data_dist=data_dist,
-                    hypo_maker=hypo_maker,
-                    hypo_param_selections=hypo_param_selections,
-                    hypo_asimov_dist=hypo_maker.get_outputs(return_sum=True),
-                    metric=metric,
-                    **{k: v for k,v in kwargs.items() if k not in ["pprint","reset_free","check_octant"]}
-                )
-            else:
-                logging.info('Starting optimization since `profile` requested.')
-                best_fit, _ = self.fit_hypo(
-                    data_dist=data_dist,
-                    hypo_maker=hypo_maker,
-                    hypo_param_selections=hypo_param_selections,
-                    metric=metric,
-                    minimizer_settings=minimizer_settings,
-                    **kwargs
-                )
-                # TODO: serialisation!
-                for k in best_fit['minimizer_metadata']:
-                    if k in ['hess', 'hess_inv']:
-                        logging.debug("deleting %s", k)
-                        del best_fit['minimizer_metadata'][k]
-
-            best_fit['params'] = deepcopy(
-                best_fit['params'].serializable_state
-            )
-            if isinstance(best_fit['hypo_asimov_dist'], Sequence):
-                best_fit['hypo_asimov_dist'] = [deepcopy(
-                    best_fit['hypo_asimov_dist'][i].serializable_state
-                ) for i in range(len(best_fit['hypo_asimov_dist']))]
-            else:
-                best_fit['hypo_asimov_dist'] = deepcopy(
-                    best_fit['hypo_asimov_dist'].serializable_state
+                    logging.info('Starting optimization since `profile` requested.')
+                    best_fit, _ = self.fit_hypo(
+                        data_dist=data_dist,
+                        hypo_maker=hypo_maker,
+                        hypo_param_selections=hypo_param_selections,
+                        metric=metric,
+                        minimizer_settings=minimizer_settings,
+                        start_params=prev_fit_params,
+                        **kwargs
+                    )
+                    if warm_start:
+                        prev_fit_params = deepcopy(best_fit['params'])
+                    # TODO: serialisation!
+                    for k in best_fit['minimizer_metadata']:
+                        if k in ['hess', 'hess_inv']:
+                            logging.debug("deleting %s", k)
+                            del best_fit['minimizer_metadata'][k]
+
+                best_fit['params'] = deepcopy(
+                    best_fit['params'].serializable_state
                 )
+                if isinstance(best_fit['hypo_asimov_dist'], Sequence):
+                    best_fit['hypo_asimov_dist'] = [deepcopy(
+                        best_fit['hypo_asimov_dist'][i].serializable_state
+                    ) for i in range(len(best_fit['hypo_asimov_dist']))]
+                else:
+                    best_fit['hypo_asimov_dist'] = deepcopy(
+                        best_fit['hypo_asimov_dist'].serializable_state
+                    )
 
-            # decide which information to retain based on chosen debug mode
-            if debug_mode == 0 or debug_mode == 1:
-                try:
-                    del best_fit['fit_history']
-                    del best_fit['hypo_asimov_dist']
-                except KeyError:
-                    pass
-
-            if debug_mode == 0:
-                # torch the woods!
-                try:
-                    del best_fit['minimizer_metadata']
-                    del best_fit['minimizer_time']
-                except KeyError:
-                    pass
-
-            results['results'].append(best_fit)
-            if outfile is not None:
-                # store intermediate results
-                to_file(results, outfile)
+                # decide which information to retain based on chosen debug mode
+                if debug_mode == 0 or debug_mode == 1:
+                    try:
+                        del best_fit['fit_history']
+                        del best_fit['hypo_asimov_dist']
+                    except KeyError:
+                        pass
+
+                if debug_mode == 0:
+                    # torch the woods!
+                    try:
+                        del best_fit['minimizer_metadata']
+                        del best_fit['minimizer_time']
+                    except KeyError:
+                        pass
+
+                results['results'].append(best_fit)
+                if outfile is not None:
+                    # store intermediate results
+                    to_file(results, outfile)
+        finally:
+            # also discard precomputed results if the scan fails
+            if batch:
+                hypo_maker.clear_batch()
 
         return results
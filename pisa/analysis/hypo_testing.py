@@ -17,6 +17,7 @@ from collections import OrderedDict
 from copy import copy
 import getpass
 from itertools import chain, product
+import multiprocessing
 import os
 import random
 import re
@@ -24,14 +25,15 @@ import socket
 import string
 import sys
 import time
-from traceback import format_exception
+from traceback import format_exc, format_exception
 
 import numpy as np
+from numpy.random import SeedSequence
 
 from pisa import ureg, _version, __version__
 from pisa.analysis.analysis import Analysis
 from pisa.core.distribution_maker import DistributionMaker
-from pisa.core.detectors import Detectors
+from pisa.core.detectors import Detectors, reset_after_fork
 from pisa.core.map import MapSet
 from pisa.utils.comparisons import normQuant
 from pisa.utils.fileio import from_file, get_valid_filename, mkdir, to_file
@@ -62,6 +64,43 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
  limitations under the License.'''
 
 
+_TRIAL_WORKER_HYPO_TESTING = None
+"""HypoTesting object of a worker process started by
+`HypoTesting.run_trials_parallel`"""
+
+
+def _init_trial_worker(hypo_testing):
+    """Initializer of the trial worker processes"""
+    global _TRIAL_WORKER_HYPO_TESTING # pylint: disable=global-statement
+    # thread pools of the (forked) makers have no threads in this process
+    reset_after_fork()
+    _TRIAL_WORKER_HYPO_TESTING = hypo_testing
+    hypo_testing.fitted_data_ind = None
+
+
+def _run_trial_block(block):
+    """Run the fits of one block of trials (see `HypoTesting.trial_blocks`) in
+    a worker process"""
+    data_ind, fid_inds = block
+    hypo_testing = _TRIAL_WORKER_HYPO_TESTING
+    try:
+        # Consecutive blocks of the same data trial need only one data fit
+        if hypo_testing.fitted_data_ind != data_ind:
+            hypo_testing.fitted_data_ind = None
+            hypo_testing.data_ind = data_ind
+            hypo_testing.generate_data()
+            hypo_testing.fit_hypos_to_data()
+            hypo_testing.fitted_data_ind = data_ind
+        for hypo_testing.fid_ind in fid_inds:
+            hypo_testing.produce_fid_data()
+            hypo_testing.fit_hypos_to_fid()
+    except Exception: # pylint: disable=broad-except
+        # the original exception might not be picklable
+        raise RuntimeError('Trial block %s failed in worker process:\n%s'
+                           % (block, format_exc()))
+    return data_ind, fid_inds
+
+
 class Labels(object):
     """Derive file labels and naming scheme for data and directories produced
     by the HypoTesting class.
@@ -285,6 +324,20 @@ class HypoTesting(Analysis):
         updates in-place as the fit proceeds. If False, this information is
         output as a separate line for each iteration.
 
+    num_workers : int >= 1
+        Number of worker processes over which `run_analysis` distributes the
+        trials. Workers are forked once from this process, so that the
+        distribution makers are set up only once, and then receive only trial
+        indices. Results of a trial depend only on its indices (and not on the
+        number of workers) as long as `reset_free` is True. Trials already
+        recorded to disk are skipped.
+
+    fit_memo_size : int >= 0
+        Number of fits to remember (see `Analysis`), e.g. such that the fits
+        of the hypotheses to unfluctuated (Asimov) fiducial data are reused
+        across trials instead of being repeated. Each worker process keeps its
+        own memo. 0 disables memoization.
+
 
     Notes
     -----
@@ -341,11 +394,13 @@ class HypoTesting(Analysis):
                  check_ordering=False,
                  allow_dirty=False, allow_no_git_info=False,
                  blind=False, store_minimizer_history=True, pprint=False,
-                 reset_free=True, shared_params=None):
-        super().__init__()
+                 reset_free=True, shared_params=None, num_workers=1,
+                 fit_memo_size=0):
+        super().__init__(fit_memo_size=fit_memo_size)
 
         assert num_data_trials >= 1
         assert num_fid_trials >= 1
+        assert num_workers >= 1
         assert data_start_ind >= 0
         assert fid_start_ind >= 0
         
@@ -543,6 +598,7 @@ class HypoTesting(Analysis):
         self.pprint = pprint
 
         self.shared_params = shared_params
+        self.num_workers = num_workers
 
         # Storage for most recent Asimov (un-fluctuated) distributions
         self.toy_data_asimov_dist = None
@@ -615,61 +671,11 @@ class HypoTesting(Analysis):
         self.write_minimizer_settings()
         self.write_run_info()
 
-        t0 = time.time()
         try:
-            # Loop for multiple (if fluctuated) data distributions
-            for self.data_ind in range(self.data_start_ind,
-                                        self.data_start_ind
-                                        + self.num_data_trials):
-                data_trials_complete = self.data_ind-self.data_start_ind
-                pct_data_complete = (
-                    100.*(data_trials_complete)/self.num_data_trials
-                )
-                logging.info(
-                    'Working on %s set ID %d (will stop after ID %d).'
-                    ' %0.2f%s of %s sets completed.',
-                    self.labels.data_disp,
-                    self.data_ind,
-                    self.data_start_ind+self.num_data_trials-1,
-                    pct_data_complete,
-                    '%',
-                    self.labels.data_disp
-                )
-
-                self.generate_data()
-                self.fit_hypos_to_data()
-
-                # Loop for multiple (if fluctuated) fiducial data distributions
-                for self.fid_ind in range(self.fid_start_ind,
-                                           self.fid_start_ind
-                                           + self.num_fid_trials):
-                    fid_trials_complete = self.fid_ind-self.fid_start_ind
-                    pct_fid_dist_complete = (
-                        100*(fid_trials_complete)/self.num_fid_trials
-                    )
-
-                    dt = time.time() - t0
-                    total_complete = (self.num_fid_trials*data_trials_complete
-                                      + fid_trials_complete)
-                    trials_to_go = (self.num_data_trials*self.num_fid_trials
-                                    - total_complete)
-
-                    ts_remaining = '???'
-                    if total_complete > 0:
-                        sec_per_fid = dt / total_complete
-                        time_to_go = sec_per_fid * trials_to_go
-                        ts_remaining = timediff(time_to_go, sec_decimals=0,
-                                                hms_always=True)
-
-                    logging.info(
-                        ('Working on {data_disp} set ID %d / {fid_disp} set ID'
-                         ' %d. %d trials to go, est time remaining: %s'
-                         %(self.data_ind, self.fid_ind, trials_to_go,
-                           ts_remaining)).format(**self.labels.dict)
-                    )
-
-                    self.produce_fid_data()
-                    self.fit_hypos_to_fid()
+            if self.num_workers > 1:
+                self.run_trials_parallel()
+            else:
+                self.run_trials()
         except: # pylint: disable=bare-except
             exc = sys.exc_info()
         else:
@@ -698,6 +704,166 @@ class HypoTesting(Analysis):
             if exc[0] is not None:
                 raise exc[0](exc[1]).with_traceback(exc[2])
 
+    def run_trials(self):
+        """Run all data and fiducial trials one after another in this
+        process"""
+        t0 = time.time()
+        # Loop for multiple (if fluctuated) data distributions
+        for self.data_ind in range(self.data_start_ind,
+                                    self.data_start_ind
+                                    + self.num_data_trials):
+            data_trials_complete = self.data_ind-self.data_start_ind
+            pct_data_complete = (
+                100.*(data_trials_complete)/self.num_data_trials
+            )
+            logging.info(
+                'Working on %s set ID %d (will stop after ID %d).'
+                ' %0.2f%s of %s sets completed.',
+                self.labels.data_disp,
+                self.data_ind,
+                self.data_start_ind+self.num_data_trials-1,
+                pct_data_complete,
+                '%',
+                self.labels.data_disp
+            )
+
+            self.generate_data()
+            self.fit_hypos_to_data()
+
+            # Loop for multiple (if fluctuated) fiducial data distributions
+            for self.fid_ind in range(self.fid_start_ind,
+                                       self.fid_start_ind
+                                       + self.num_fid_trials):
+                fid_trials_complete = self.fid_ind-self.fid_start_ind
+                pct_fid_dist_complete = (
+                    100*(fid_trials_complete)/self.num_fid_trials
+                )
+
+                dt = time.time() - t0
+                total_complete = (self.num_fid_trials*data_trials_complete
+                                  + fid_trials_complete)
+                trials_to_go = (self.num_data_trials*self.num_fid_trials
+                                - total_complete)
+
+                ts_remaining = '???'
+                if total_complete > 0:
+                    sec_per_fid = dt / total_complete
+                    time_to_go = sec_per_fid * trials_to_go
+                    ts_remaining = timediff(time_to_go, sec_decimals=0,
+                                            hms_always=True)
+
+                logging.info(
+                    ('Working on {data_disp} set ID %d / {fid_disp} set ID'
+                     ' %d. %d trials to go, est time remaining: %s'
+                     %(self.data_ind, self.fid_ind, trials_to_go,
+                       ts_remaining)).format(**self.labels.dict)
+                )
+
+                self.produce_fid_data()
+                self.fit_hypos_to_fid()
+
+    def run_trials_parallel(self):
+        """Run all data and fiducial trials in `num_workers` worker processes.
+
+        The workers are forked from this process (and so start off with the
+        distribution makers set up) and receive blocks of fiducial trials of
+        the same data trial, such that the fits to a (pseudo)data distribution
+        are repeated at most once per block. Trials which are recorded to disk
+        already are skipped, so an interrupted run can be resumed by running
+        it again.
+
+        """
+        if not self.reset_free:
+            logging.warning(
+                'Fits are not reset between trials (`reset_free` is False);'
+                ' results of a trial depend on which trials the same worker'
+                ' process ran before it.'
+            )
+        for maker in (self.h0_maker, self.h1_maker, self.data_maker):
+            if maker is None:
+                continue
+            if isinstance(maker, Detectors):
+                dist_makers = maker.distribution_makers
+            else:
+                dist_makers = [maker]
+            if any(dm.parallel == 'processes' for dm in dist_makers):
+                raise ValueError(
+                    'Distribution makers with parallel="processes" cannot be'
+                    ' shared by forked trial workers; use parallel="threads"'
+                    ' or `num_workers` = 1.'
+                )
+
+        blocks = self.trial_blocks()
+        num_trials = sum(len(fid_inds) for _, fid_inds in blocks)
+        logging.info(
+            'Running %d of %d trials in %d worker processes (others are'
+            ' recorded already).', num_trials,
+            self.num_data_trials*self.num_fid_trials, self.num_workers
+        )
+
+        t0 = time.time()
+        trials_complete = 0
+        context = multiprocessing.get_context('fork')
+        with context.Pool(self.num_workers, initializer=_init_trial_worker,
+                          initargs=(self,)) as pool:
+            for data_ind, fid_inds in pool.imap_unordered(_run_trial_block,
+                                                          blocks):
+                trials_complete += len(fid_inds)
+                trials_to_go = num_trials - trials_complete
+                time_to_go = (time.time() - t0) / trials_complete * trials_to_go
+                logging.info(
+                    ('Finished {data_disp} set ID %d / {fid_disp} set IDs'
+                     ' %d-%d. %d trials to go, est time remaining: %s'
+                     %(data_ind, fid_inds[0], fid_inds[-1], trials_to_go,
+                       timediff(time_to_go, sec_decimals=0, hms_always=True))
+                    ).format(**self.labels.dict)
+                )
+
+        self.data_ind = self.data_start_ind + self.num_data_trials - 1
+        self.fid_ind = self.fid_start_ind + self.num_fid_trials - 1
+
+    def trial_blocks(self):
+        """Group the trials which are not yet recorded to disk into blocks for
+        `run_trials_parallel`.
+
+        Returns
+        -------
+        blocks : list of (data_ind, list of fid_ind)
+
+        """
+        todo = []
+        for data_ind in range(self.data_start_ind,
+                              self.data_start_ind + self.num_data_trials):
+            fid_inds = [
+                fid_ind for fid_ind in range(
+                    self.fid_start_ind, self.fid_start_ind + self.num_fid_trials
+                ) if not self.trial_recorded(data_ind, fid_ind)
+            ]
+            if fid_inds:
+                todo.append((data_ind, fid_inds))
+
+        # Split the fiducial trials of each data trial into enough blocks to
+        # balance the load among the workers
+        num_splits = -(-4*self.num_workers // max(1, len(todo)))
+        blocks = []
+        for data_ind, fid_inds in todo:
+            for split in np.array_split(fid_inds,
+                                        min(num_splits, len(fid_inds))):
+                blocks.append((data_ind, [int(fid_ind) for fid_ind in split]))
+        return blocks
+
+    def trial_recorded(self, data_ind, fid_ind):
+        """Whether all fits of fiducial trial `fid_ind` of data trial
+        `data_ind` are recorded to disk"""
+        dirpath = self.data_dirpath
+        if self.fluctuate_data:
+            dirpath += '_' + format(data_ind, 'd')
+        self.labels.derive_fid_fits_names(fid_ind=fid_ind)
+        labels = [self.labels.h0_fit_to_h0_fid, self.labels.h0_fit_to_h1_fid,
+                  self.labels.h1_fit_to_h0_fid, self.labels.h1_fit_to_h1_fid]
+        return all(os.path.isfile(os.path.join(dirpath, label + '.json.bz2'))
+                   for label in labels)
+
     def generate_data(self):
         """Geneerate "data" distribution"""
         logging.info('Generating %s distributions.', self.labels.data_disp)
@@ -728,7 +894,8 @@ class HypoTesting(Analysis):
 
         if self.fluctuate_data:
             assert self.data_ind is not None
-            # Random state for data trials is defined by:
+            # Random state for data trials is defined by the seed sequence
+            # (independent streams for any number of trials):
             #   * data vs fid-dist = 0  : data part (outer loop)
             #   * data trial = data_ind : data trial number (use same for data
             #                             and and fid data trials, since on the
@@ -740,10 +907,13 @@ class HypoTesting(Analysis):
                 self.data_dist = []
                 for i in range(len(self.toy_data_asimov_dist)):
                     self.data_dist.append(self.toy_data_asimov_dist[i].fluctuate(
-                        method='poisson', random_state=get_random_state([0, self.data_ind, 0]))
+                        method='poisson', random_state=get_random_state(
+                            SeedSequence([0, self.data_ind, 0])))
                     )
             else:
-                data_random_state = get_random_state([0, self.data_ind, 0])             
+                data_random_state = get_random_state(
+                    SeedSequence([0, self.data_ind, 0])
+                )
                 self.data_dist = self.toy_data_asimov_dist.fluctuate(
                     method='poisson', random_state=data_random_state
                 )
@@ -885,7 +1055,7 @@ class HypoTesting(Analysis):
         # Retrieve event-rate maps for best fit to data with each hypo
 
         if self.fluctuate_fid:
-            # Random state for data trials is defined by:
+            # Random state for data trials is defined by the seed sequence:
             #   * data vs fid-dist = 1     : fid data part (inner loop)
             #   * data trial = data_ind    : data trial number (use same for
             #                                data and and fid data trials,
@@ -893,8 +1063,9 @@ class HypoTesting(Analysis):
             #   * fid trial = fid_ind      : always 0 since data stays the same
             #                                for all fid trials in this data
             #                                trial
-            fid_random_state = get_random_state([1, self.data_ind,
-                                                 self.fid_ind])
+            fid_random_state = get_random_state(
+                SeedSequence([1, self.data_ind, self.fid_ind])
+            )
 
             # Fluctuate h0 fid Asimov
             self.h0_fid_dist = self.h0_fid_asimov_dist.fluctuate(
@@ -1473,6 +1644,8 @@ class HypoTesting(Analysis):
         run_info.append('store_minimizer_history = %s'
                         %self.store_minimizer_history)
         run_info.append('pprint = %s' %self.pprint)
+        run_info.append('num_workers = %d' %self.num_workers)
+        run_info.append('fit_memo_size = %d' %self.fit_memo_size)
         for env_var in ['PISA_FTYPE', 'PISA_RESOURCES',
                         'MKL_NUM_THREADS', 'OMP_NUM_THREADS',
                         'CUDA_VISIBLE_DEVICES',
@@ -1559,8 +1732,14 @@ class HypoTesting(Analysis):
             if isinstance(v, ureg.Quantity):
                 v = str(v)
             info[k] = v
-        to_file(info, os.path.join(dirpath, label + '.json.bz2'),
-                sort_keys=False)
+        # Write to a temporary file first such that an interrupted run never
+        # leaves behind a partial file (which would be taken for a recorded
+        # fit when resuming)
+        fpath = os.path.join(dirpath, label + '.json.bz2')
+        tmp_fpath = os.path.join(dirpath,
+                                 '.%s.%d.json.bz2' % (label, os.getpid()))
+        to_file(info, tmp_fpath, sort_keys=False)
+        os.replace(tmp_fpath, fpath)
 
     def set_param_ranges(self, selection, test_name, rangetuple, inj_units):
         """Give the parameter in hypo_testing selected by selection
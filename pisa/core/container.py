@@ -10,6 +10,7 @@ from __future__ import absolute_import, print_function
 
 from collections.abc import Sequence
 from collections import OrderedDict
+import mmap
 
 import numpy as np
 from numba import SmartArray
@@ -17,7 +18,8 @@ from numba import SmartArray
 from pisa import FTYPE
 from pisa.core.binning import OneDimBinning, MultiDimBinning
 from pisa.core.map import Map, MapSet
-from pisa.core.translation import histogram, lookup, resample
+from pisa.core.translation import histogram, flat_bin_index, lookup, resample
+from pisa.utils.hash import hash_obj
 from pisa.utils.log import logging
 
 
@@ -203,6 +205,16 @@ class VirtualContainer(object):
             else:
                 container.binned_data[key] = self.containers[0].binned_data[key]
 
+    def invalidate_flat_index(self, key):
+        '''
+        forget cached flat bin indices in all linked containers
+        '''
+        for container in self:
+            container.invalidate_flat_index(key)
+
+    def has_data(self, key):
+        return self.containers[0].has_data(key)
+
     @property
     def size(self):
         '''
@@ -242,6 +254,8 @@ class Container(object):
         self.binned_data = OrderedDict()
         self.data_specs = data_specs
         self.linked = False
+        # flat bin index of each event per binning, see `get_flat_index`
+        self.flat_index_cache = OrderedDict()
 
     @property
     def data_mode(self):
@@ -263,6 +277,18 @@ class Container(object):
         else:
             raise ValueError('Need to set data specs first')
 
+    def has_data(self, key):
+        '''
+        whether array data (in events mode) or binned data (in binned mode)
+        exists for `key`
+        '''
+        if self.data_mode == 'events':
+            return key in self.array_data
+        elif self.data_mode == 'binned':
+            return key in self.binned_data
+        else:
+            raise ValueError('Need to set data specs first')
+
     @ property
     def size(self):
         '''
@@ -296,15 +322,63 @@ class Container(object):
             identifier
 
         data : ndarray
+            copied, unless it is memory-mapped from a file (see
+            `pisa.core.events_pi.load_columnar_events`)
 
         '''
 
-        if isinstance(data, np.ndarray):
+        if isinstance(data, np.memmap) and isinstance(data.base, mmap.mmap):
+            # adopt the file's pages (shared with other processes) via a
+            # private copy-on-write mapping, such that in-place modifications
+            # neither reach the file nor other holders of `data`
+            data = SmartArray(
+                np.memmap(data.filename, dtype=data.dtype, mode='c',
+                          shape=data.shape, offset=data.offset),
+                copy=False
+            )
+        elif isinstance(data, np.ndarray):
             data = SmartArray(data)
         if self.array_length is None:
             self.array_length = data.get('host').shape[0]
         assert data.get('host').shape[0] == self.array_length
         self.array_data[key] = data
+        self.invalidate_flat_index(key)
+
+    def get_flat_index(self, binning):
+        '''
+        flat bin index of each event into `binning` (-1 for events outside of
+        it), cached such that repeated translations with the same binning
+        don't have to find the bins again
+
+        Parameters
+        ----------
+
+        binning : MultiDimBinning
+
+        Returns
+        -------
+
+        flat_index : SmartArray of int64
+
+        '''
+        key = (tuple(binning.names),
+               hash_obj([edges.magnitude for edges in binning.bin_edges]))
+        flat_index = self.flat_index_cache.get(key)
+        if flat_index is None:
+            sample = [self.array_data[n] for n in binning.names]
+            flat_index = flat_bin_index(sample, binning)
+            self.flat_index_cache[key] = flat_index
+        return flat_index
+
+    def invalidate_flat_index(self, key):
+        '''
+        forget cached flat bin indices of binnings with a dimension `key`; to
+        be called whenever the array `key` is modified in place (e.g. by a
+        stage shifting a binning variable), as this is not detected
+        '''
+        for cache_key in list(self.flat_index_cache.keys()):
+            if key in cache_key[0]:
+                del self.flat_index_cache[cache_key]
 
     def add_binned_data(self, key, data, flat=True):
         ''' add data to binned_data
@@ -379,7 +453,7 @@ class Container(object):
         '''
         return iter(self.keys())
 
-    def array_to_binned(self, key, binning, averaged=True):
+    def array_to_binned(self, key, binning, averaged=True, sumw2_key=None):
         '''
         histogram data array into binned data
 
@@ -396,18 +470,26 @@ class Container(object):
             probabilities are translated.....otherwise we end up with probability*count
             per bin
 
+        sumw2_key : str or None
+            if specified, the sum of the squared array values per bin is
+            stored as binned data under this key as well (at no extra cost)
 
-        right now CPU only
-
-        ToDo: make work for n-dim
+        The bin of each event is cached (see `get_flat_index`), such that
+        repeated calls only need a single pass over the events to sum up the
+        values.
 
         '''
         logging.debug('Transforming %s array to binned data'%(key))
         weights = self.array_data[key]
         sample = [self.array_data[n] for n in binning.names]
 
-        hist = histogram(sample, weights, binning, averaged)
+        hist = histogram(sample, weights, binning, averaged,
+                         flat_index=self.get_flat_index(binning),
+                         return_sumw2=sumw2_key is not None)
 
+        if sumw2_key is not None:
+            hist, sumw2 = hist
+            self.add_binned_data(sumw2_key, (binning, sumw2))
         self.add_binned_data(key, (binning, hist))
 
     def binned_to_array(self, key):
@@ -425,7 +507,8 @@ class Container(object):
                 raise ValueError('Key `%s` does not exist in container `%s`'%(key,self.name))
         logging.debug('Transforming %s binned to array data'%(key))
         sample = [self.array_data[n] for n in binning.names]
-        self.add_array_data(key, lookup(sample, hist, binning))
+        self.add_array_data(key, lookup(sample, hist, binning,
+                                        flat_index=self.get_flat_index(binning)))
 
     def binned_to_binned(self, key, new_binning):
         '''
@@ -563,6 +646,47 @@ def test_container():
     print(container.get_array_data('w').get('host'))
 
 
+def test_flat_index_cache():
+    n_evts = 1000
+    rand = np.random.RandomState(0)
+    container = Container('test')
+    container.data_specs = 'events'
+    container['x'] = rand.uniform(0, 100, n_evts).astype(FTYPE)
+    container['y'] = rand.uniform(0, 100, n_evts).astype(FTYPE)
+    container['w'] = rand.uniform(0, 1, n_evts).astype(FTYPE)
+
+    binning_x = OneDimBinning(name='x', num_bins=10, is_lin=True, domain=[0, 100])
+    binning_y = OneDimBinning(name='y', num_bins=5, is_lin=True, domain=[0, 50])
+    binning = MultiDimBinning([binning_x, binning_y])
+    bin_edges = [edges.magnitude for edges in binning.bin_edges]
+
+    def check():
+        sample = [container['x'].get('host'), container['y'].get('host')]
+        w = container['w'].get('host')
+        ref, _ = np.histogramdd(sample, bins=bin_edges, weights=w)
+        ref_sumw2, _ = np.histogramdd(sample, bins=bin_edges, weights=w**2)
+        container.array_to_binned('w', binning, averaged=False, sumw2_key='w2')
+        assert np.allclose(container.binned_data['w'][1].get('host'), ref.ravel())
+        assert np.allclose(container.binned_data['w2'][1].get('host'), ref_sumw2.ravel())
+
+    check()
+    flat_index = container.get_flat_index(binning)
+    check()
+    assert container.get_flat_index(binning) is flat_index
+
+    # shift a binning variable in place
+    container['y'].get('host')[:] -= 20
+    container.invalidate_flat_index('y')
+    check()
+    assert container.get_flat_index(binning) is not flat_index
+
+    # replacing an array invalidates automatically
+    flat_index = container.get_flat_index(binning)
+    container['x'] = rand.uniform(0, 100, n_evts).astype(FTYPE)
+    check()
+    assert container.get_flat_index(binning) is not flat_index
+
+
 def test_container_set():
     container1 = Container('test1')
     container2 = Container('test2')
@@ -578,4 +702,5 @@ def test_container_set():
 
 if __name__ == '__main__':
     test_container()
+    test_flat_index_cache()
     test_container_set()
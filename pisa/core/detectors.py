@@ -12,17 +12,22 @@ from __future__ import absolute_import
 
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import inspect
 from itertools import product
+import multiprocessing
 import os
 from copy import deepcopy
+import weakref
 
 import numpy as np
 
 from pisa import ureg
 from pisa.core.map import MapSet
 from pisa.core.pipeline import Pipeline
-from pisa.core.distribution_maker import DistributionMaker
+from pisa.core.distribution_maker import (
+    DistributionMaker, reset_after_fork as reset_dist_makers_after_fork
+)
 from pisa.core.param import ParamSet, Param
 from pisa.utils.config_parser import PISAConfigParser
 from pisa.utils.fileio import expand, mkdir, to_file
@@ -31,7 +36,26 @@ from pisa.utils.log import set_verbosity, logging
 from pisa.utils.random_numbers import get_random_state
 
 
-__all__ = ['Detectors', 'parse_args', 'main']
+__all__ = ['Detectors', 'reset_after_fork', 'test_fork_safety', 'parse_args',
+           'main']
+
+
+_INSTANCES = weakref.WeakSet()
+"""All Detectors of this process, see `reset_after_fork`"""
+
+
+def reset_after_fork():
+    """A forked process has none of the threads of its parent's thread pools;
+    forget these (in all Detectors and DistributionMakers) such that new ones
+    are created when needed. This is done automatically upon forking where
+    `os.register_at_fork` is available."""
+    for detectors in list(_INSTANCES):
+        detectors._executor = None # pylint: disable=protected-access
+    reset_dist_makers_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
 
 
 class Detectors(object):
@@ -46,10 +70,18 @@ class Detectors(object):
         
     shared_params : Parameter to be treated the same way in all the
         distribution_makers that contain them.
+
+    parallel : None, 'threads', or 'processes'
+        Passed on to each DistributionMaker. If not None, the distribution
+        makers are additionally run concurrently (in threads, each of which
+        dispatches its pipelines according to `parallel`).
     """
-    def __init__(self, pipelines, label=None, shared_params=None):
+    def __init__(self, pipelines, label=None, shared_params=None, parallel=None):
         self.label = label
         self._source_code_hash = None
+        self.parallel = parallel
+        self._executor = None
+        _INSTANCES.add(self)
         
         if shared_params == None:
             self.shared_params = []
@@ -76,7 +108,9 @@ class Detectors(object):
             raise NameError('At least one of the used pipelines has no detector_name.')
 
         for i, pipelines in enumerate(self._distribution_makers):
-            self._distribution_makers[i] = DistributionMaker(pipelines=pipelines)
+            self._distribution_makers[i] = DistributionMaker(
+                pipelines=pipelines, parallel=parallel
+            )
             
         for sp in self.shared_params:
             n = 0
@@ -102,9 +136,31 @@ class Detectors(object):
         List of MapSets if `return_sum=True` or list of lists of MapSets if `return_sum=False`
 
         """
-        outputs = [distribution_maker.get_outputs(**kwargs) for distribution_maker in self]
+        if self.parallel is None or len(self._distribution_makers) == 1:
+            outputs = [distribution_maker.get_outputs(**kwargs) for distribution_maker in self]
+            return outputs
+
+        # Fork any worker processes here, not concurrently in the pool threads
+        for distribution_maker in self:
+            distribution_maker.start_workers()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(self._distribution_makers)
+            )
+        futures = [self._executor.submit(distribution_maker.get_outputs, **kwargs)
+                   for distribution_maker in self]
+        outputs = [future.result() for future in futures]
         return outputs
 
+    def close(self):
+        """Shut down the threads and worker processes used for parallel
+        execution, if any. These are re-created when needed."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for distribution_maker in self:
+            distribution_maker.close()
+
     def update_params(self, params):
         for distribution_maker in self:
             distribution_maker.update_params(params)
@@ -271,6 +327,43 @@ class Detectors(object):
                 self._distribution_makers[i]._set_rescaled_free_params(rp)
 
 
+_FORK_TEST_DETECTORS = None
+"""Detectors used by `test_fork_safety` in the forked process"""
+
+
+def _fork_test_outputs():
+    """Nominal values of the outputs of `_FORK_TEST_DETECTORS`"""
+    return [[m.nominal_values for m in mapset]
+            for mapsets in _FORK_TEST_DETECTORS.get_outputs()
+            for mapset in mapsets]
+
+
+def test_fork_safety():
+    """Detectors (and DistributionMakers) running their pipelines in threads
+    must keep working in processes forked after their thread pools were
+    started, as are e.g. trial and gradient workers"""
+    global _FORK_TEST_DETECTORS # pylint: disable=global-statement
+    pipelines = []
+    for det_name in ['det0', 'det0', 'det1']:
+        pipeline = Pipeline('settings/pipeline/example.cfg')
+        pipeline._detector_name = det_name # pylint: disable=protected-access
+        pipelines.append(pipeline)
+    _FORK_TEST_DETECTORS = Detectors(pipelines, parallel='threads')
+    try:
+        # start the thread pools before forking
+        ref_outputs = _fork_test_outputs()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(1) as pool:
+            outputs = pool.apply_async(_fork_test_outputs).get(timeout=300)
+        for ref_mapset, mapset in zip(ref_outputs, outputs):
+            for ref_values, values in zip(ref_mapset, mapset):
+                assert np.array_equal(ref_values, values)
+    finally:
+        _FORK_TEST_DETECTORS.close()
+        _FORK_TEST_DETECTORS = None
+    logging.info('<< PASS : test_fork_safety >>')
+
+
 def parse_args():
     """Get command line arguments"""
     parser = ArgumentParser(
@@ -299,6 +392,10 @@ def parse_args():
         pipelines as a single map (as opposed to a list of MapSets, one per
         pipeline)'''
     )
+    parser.add_argument(
+        '--parallel', choices=['threads', 'processes'], default=None,
+        help='Run the detectors and their pipelines concurrently'
+    )
     parser.add_argument(
         '--outdir', type=str, action='store',
         help='Directory into which to store the output'
@@ -331,7 +428,8 @@ def main(return_outputs=False):
     if args.png:
         plot_formats.append('png')
         
-    detectors = Detectors(args.pipeline,shared_params=args.shared_params)
+    detectors = Detectors(args.pipeline,shared_params=args.shared_params,
+                          parallel=args.parallel)
     Names = detectors.det_names
     if args.select is not None:
         detectors.select_params(args.select)
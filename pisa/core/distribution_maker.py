@@ -9,10 +9,14 @@ from __future__ import absolute_import
 
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 import inspect
 from itertools import product
+import multiprocessing
 import os
+import traceback
+import weakref
 
 import numpy as np
 
@@ -27,7 +31,9 @@ from pisa.utils.log import set_verbosity, logging
 from pisa.utils.random_numbers import get_random_state
 
 
-__all__ = ['DistributionMaker', 'test_DistributionMaker', 'parse_args', 'main']
+__all__ = ['PARALLEL_MODES', 'DistributionMaker', 'reset_after_fork',
+           'test_DistributionMaker',
+           'test_parallel', 'parse_args', 'main']
 
 __author__ = 'J.L. Lanfranchi, P. Eller'
 
@@ -46,6 +52,102 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
  limitations under the License.'''
 
 
+PARALLEL_MODES = (None, 'threads', 'processes')
+"""Ways in which a DistributionMaker can run its pipelines, see
+`DistributionMaker`"""
+
+_INSTANCES = weakref.WeakSet()
+"""All DistributionMakers of this process, see `reset_after_fork`"""
+
+
+def reset_after_fork():
+    """A forked process (e.g. a trial or gradient worker) has none of the
+    threads of its parent's thread pools, which hence would never run the
+    tasks submitted to them, nor may it use the parent's pipeline workers.
+    Forget these (without shutting them down, which is up to the parent), such
+    that new ones are created when needed."""
+    for distribution_maker in list(_INSTANCES):
+        distribution_maker._executor = None # pylint: disable=protected-access
+        distribution_maker._workers = None # pylint: disable=protected-access
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+class _PipelineWorker(object):
+    """Persistent worker process running a pipeline.
+
+    The process is forked from the current one and hence starts off with the
+    pipeline's full state (including its loaded events, shared with this
+    process copy-on-write). Subsequently, only the values of the pipeline's
+    params are sent to the worker, and only the outputs are sent back.
+
+    Parameters
+    ----------
+    pipeline : Pipeline
+
+    """
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        context = multiprocessing.get_context('fork')
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_pipeline_worker_loop, args=(pipeline, child_conn)
+        )
+        self._process.daemon = True
+        self._process.start()
+        child_conn.close()
+
+    def submit(self, kwargs):
+        """Start computing the outputs for the current param values"""
+        values = [(param.name, param.value) for param in self.pipeline.params]
+        self._conn.send((values, kwargs))
+
+    def result(self):
+        """Wait for and return (success, outputs or exception)"""
+        return self._conn.recv()
+
+    def close(self):
+        """Stop the worker process"""
+        if self._process.is_alive():
+            try:
+                self._conn.send(None)
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+            self._process.join(timeout=10)
+            if self._process.is_alive():
+                self._process.terminate()
+        self._conn.close()
+
+
+def _pipeline_worker_loop(pipeline, conn):
+    """Target of the `_PipelineWorker` processes: update the params and send
+    back the outputs until told to stop (by receiving `None`)"""
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        values, kwargs = msg
+        try:
+            params = pipeline.params
+            for name, value in values:
+                params[name].value = value
+            outputs = pipeline.get_outputs(**kwargs)
+        except Exception: # pylint: disable=broad-except
+            # the original exception might not be picklable
+            conn.send((False, RuntimeError(
+                'Pipeline with stages %s failed in worker process:\n%s'
+                % (pipeline.stage_names, traceback.format_exc())
+            )))
+        else:
+            conn.send((True, outputs))
+    conn.close()
+
+
 class DistributionMaker(object):
     """Container for one or more pipelines; the outputs from all contained
     pipelines are added together to create the distribution.
@@ -57,6 +159,18 @@ class DistributionMaker(object):
         are already-instantiated Pipelines and anything interpret-able by the
         Pipeline init method.
 
+    parallel : None, 'threads', or 'processes'
+        How to run the pipelines in `get_outputs`:
+          * None: one after the other (default)
+          * 'threads': concurrently in a thread pool. This only pays off to
+            the extent that the pipelines' kernels release the GIL (e.g.
+            numba functions compiled with `nogil=True` or with
+            `target='parallel'`, and numpy).
+          * 'processes': concurrently in one persistent worker process per
+            pipeline, forked upon the first call to `get_outputs` (see
+            `close`). Only param values and outputs are exchanged with the
+            workers. Not available with the CUDA target.
+
     Notes
     -----
     Free params with the same name in two pipelines are updated at the same
@@ -72,12 +186,27 @@ class DistributionMaker(object):
     except if using a minimizer, since, e.g., units are stripped and values and
     intervals are non-physical.
 
+    With `parallel='processes'`, the worker processes hold copies of the
+    pipelines as they were when the workers were started. Only param values
+    are synchronized, so call `close` after modifying pipelines in any other
+    way (new workers are started as needed). The `*_batch` methods always run
+    in the calling process.
+
     """
-    def __init__(self, pipelines, label=None):
+    def __init__(self, pipelines, label=None, parallel=None):
 
         self.label = label
         self._source_code_hash = None
 
+        if parallel not in PARALLEL_MODES:
+            raise ValueError('`parallel` must be one of %s, got "%s"'
+                             % (PARALLEL_MODES, parallel))
+        self.parallel = parallel
+        self._executor = None
+        self._workers = None
+        self._derivative_params = ()
+        _INSTANCES.add(self)
+
         self._pipelines = []
         if isinstance(pipelines, (str, PISAConfigParser, OrderedDict,
                                   Pipeline)):
@@ -123,17 +252,178 @@ class DistributionMaker(object):
         MapSet if `return_sum=True` or list of MapSets if `return_sum=False`
 
         """
-        outputs = [pipeline.get_outputs(**kwargs) for pipeline in self] # pylint: disable=redefined-outer-name
+        outputs = self._run_pipelines(kwargs) # pylint: disable=redefined-outer-name
+        if return_sum:
+            outputs = self._sum_outputs(outputs, sum_map_name, sum_map_tex_name)
+        return outputs
+
+    def _run_pipelines(self, kwargs):
+        """Get the outputs of all pipelines according to `self.parallel`"""
+        if self.parallel is None or len(self._pipelines) == 1:
+            return [pipeline.get_outputs(**kwargs) for pipeline in self]
+
+        if self.parallel == 'threads':
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=len(self._pipelines)
+                )
+            futures = [self._executor.submit(pipeline.get_outputs, **kwargs)
+                       for pipeline in self]
+            return [future.result() for future in futures]
+
+        self.start_workers()
+        for worker in self._workers:
+            worker.submit(kwargs)
+        # collect all results before raising, such that no worker is left
+        # with an unread result
+        results = [worker.result() for worker in self._workers]
+        outputs = []
+        for success, result in results:
+            if not success:
+                raise result
+            outputs.append(result)
+        return outputs
+
+    def start_workers(self):
+        """Fork the worker processes for `parallel='processes'` unless running
+        already (this otherwise happens upon the next `get_outputs`). Forking
+        is only safe from a single thread at a time, so call this before
+        running `get_outputs` in other threads."""
+        if (self.parallel != 'processes' or len(self._pipelines) == 1
+                or self._workers is not None):
+            return
+        self._workers = [_PipelineWorker(pipeline) for pipeline in self]
+
+    def close(self):
+        """Shut down the thread pool or worker processes used for running the
+        pipelines in parallel, if any. These are re-created when needed."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._workers is not None:
+            for worker in self._workers:
+                worker.close()
+            self._workers = None
+
+    def compute_batch(self, param_points):
+        """Let each pipeline precompute what it can for a batch of param
+        points at once; see `Pipeline.compute_batch`."""
+        for pipeline in self:
+            pipeline.compute_batch(param_points)
+
+    def clear_batch(self):
+        """Discard anything precomputed via `compute_batch`"""
+        for pipeline in self:
+            pipeline.clear_batch()
+
+    def get_outputs_batch(self, param_points, return_sum=False,
+                          sum_map_name='total', sum_map_tex_name='Total',
+                          **kwargs):
+        """Compute and return the outputs for each of a batch of param points,
+        see `Pipeline.get_outputs_batch`.
+
+        Parameters
+        ----------
+        param_points : sequence of mappings
+            Each maps param names to values (quantities)
+
+        return_sum, sum_map_name, sum_map_tex_name
+            See `get_outputs`
+
+        **kwargs
+            Passed on to each pipeline's `get_outputs_batch` method.
+
+        Returns
+        -------
+        list with one element (as returned by `get_outputs`) per point
+
+        """
+        outputs = [pipeline.get_outputs_batch(param_points, **kwargs)
+                   for pipeline in self]
+        # one list of pipeline outputs per point
+        outputs = [list(point_outputs) for point_outputs in zip(*outputs)]
         if return_sum:
-            if len(outputs) > 1:
-                outputs = reduce(lambda x, y: sum(x) + sum(y), outputs)
-            else:
-                outputs = sum(sum(outputs))
-            outputs.name = sum_map_name
-            outputs.tex = sum_map_tex_name
-            outputs = MapSet(outputs)
+            outputs = [self._sum_outputs(point_outputs, sum_map_name,
+                                         sum_map_tex_name)
+                       for point_outputs in outputs]
         return outputs
 
+    def set_derivative_params(self, names):
+        """Propagate derivatives of the outputs w.r.t. the params `names`
+        through the pipelines as far as possible, see
+        `Pipeline.set_derivative_params`. Not supported if the pipelines run
+        in separate processes.
+
+        Parameters
+        ----------
+        names : sequence of str
+
+        Returns
+        -------
+        derivative_params : tuple of str
+            Those of `names` for which all pipelines having the param
+            propagate derivatives
+
+        """
+        if self.parallel == 'processes':
+            return ()
+        pipeline_derivative_params = [pipeline.set_derivative_params(names)
+                                      for pipeline in self]
+        derivative_params = tuple(
+            name for name in names
+            if all(name in pipeline_params
+                   for pipeline, pipeline_params in zip(
+                       self, pipeline_derivative_params)
+                   if name in pipeline.params.names)
+            and any(name in pipeline.params.names for pipeline in self)
+        )
+        for pipeline in self:
+            pipeline.set_derivative_params(
+                [name for name in derivative_params
+                 if name in pipeline.params.names]
+            )
+        self._derivative_params = derivative_params
+        return derivative_params
+
+    def get_output_derivatives(self, return_sum=False, sum_map_name='total',
+                               sum_map_tex_name='Total'):
+        """Derivatives of the outputs produced by the last call to
+        `get_outputs` w.r.t. the params set via `set_derivative_params`.
+
+        Parameters
+        ----------
+        return_sum, sum_map_name, sum_map_tex_name
+            See `get_outputs`
+
+        Returns
+        -------
+        derivatives : OrderedDict
+            Param name -> derivatives of the outputs (in the form returned by
+            `get_outputs`) w.r.t. the magnitude of the param in its own units
+
+        """
+        derivatives = OrderedDict()
+        for name in self._derivative_params:
+            outputs = [pipeline.get_output_derivatives(names=[name])[name]
+                       for pipeline in self]
+            if return_sum:
+                outputs = self._sum_outputs(outputs, sum_map_name,
+                                            sum_map_tex_name)
+            derivatives[name] = outputs
+        return derivatives
+
+    @staticmethod
+    def _sum_outputs(outputs, sum_map_name, sum_map_tex_name):
+        """Add up all maps in a list of MapSets (one per pipeline) into a
+        MapSet holding a single map"""
+        if len(outputs) > 1:
+            outputs = reduce(lambda x, y: sum(x) + sum(y), outputs)
+        else:
+            outputs = sum(sum(outputs))
+        outputs.name = sum_map_name
+        outputs.tex = sum_map_tex_name
+        return MapSet(outputs)
+
     def update_params(self, params):
         for pipeline in self:
             pipeline.update_params(params)
@@ -330,6 +620,27 @@ def test_DistributionMaker():
         current_mat = new_mat
 
 
+def test_parallel():
+    """Outputs must not depend on how the pipelines are run"""
+    configs = ['settings/pipeline/example.cfg', 'settings/pipeline/example.cfg']
+    ref_dm = DistributionMaker(configs)
+    for parallel in PARALLEL_MODES[1:]:
+        dm = DistributionMaker(configs, parallel=parallel)
+        try:
+            for aeff_scale in [1.0, 1.2]:
+                for pipeline in list(ref_dm) + list(dm):
+                    pipeline.params.aeff_scale.value = aeff_scale * ureg.dimensionless
+                ref_outputs = ref_dm.get_outputs()
+                outputs = dm.get_outputs()
+                for ref_mapset, test_mapset in zip(ref_outputs, outputs):
+                    for ref_map, test_map in zip(ref_mapset, test_mapset):
+                        assert np.array_equal(ref_map.nominal_values,
+                                              test_map.nominal_values), parallel
+        finally:
+            dm.close()
+    logging.info('<< PASS : test_parallel >>')
+
+
 def parse_args():
     """Get command line arguments"""
     parser = ArgumentParser(
@@ -353,6 +664,10 @@ def parse_args():
         pipelines as a single map (as opposed to a list of MapSets, one per
         pipeline)'''
     )
+    parser.add_argument(
+        '--parallel', choices=PARALLEL_MODES[1:], default=None,
+        help='Run the pipelines concurrently in threads or processes'
+    )
     parser.add_argument(
         '--outdir', type=str, action='store',
         help='Directory into which to store the output'
@@ -385,7 +700,7 @@ def main(return_outputs=False):
     if args.png:
         plot_formats.append('png')
 
-    distribution_maker = DistributionMaker(pipelines=args.pipeline) # pylint: disable=redefined-outer-name
+    distribution_maker = DistributionMaker(pipelines=args.pipeline, parallel=args.parallel) # pylint: disable=redefined-outer-name
     if args.select is not None:
         distribution_maker.select_params(args.select)
 
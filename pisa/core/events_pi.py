@@ -6,13 +6,18 @@ import argparse
 from collections.abc import Mapping, Iterable
 from collections import OrderedDict 
 import copy
+import json
+import os
+import shutil
+import tempfile
 
 import numpy as np
 
 from pisa import FTYPE
 from pisa.core.binning import OneDimBinning, MultiDimBinning
-from pisa.utils.fileio import from_file
+from pisa.utils.fileio import from_file, mkdir
 from pisa.utils.log import logging
+from pisa.utils.resources import find_resource
 
 
 __all__ = [
@@ -20,9 +25,13 @@ __all__ = [
     "NU_INTERACTIONS",
     "OUTPUT_NUFLAVINT_KEYS",
     "LEGACY_FLAVKEY_XLATION",
+    "COLUMNAR_INDEX_FILENAME",
     "EventsPi",
+    "is_columnar_events_dir",
+    "load_columnar_events",
     "split_nu_events_by_flavor_and_interaction",
     "fix_oppo_flux",
+    "test_columnar_events",
     "main",
 ]
 
@@ -65,6 +74,10 @@ LEGACY_FLAVKEY_XLATION = dict(
     nutau_bar="nutaubar",
 )
 
+COLUMNAR_INDEX_FILENAME = "columnar_events.json"
+"""Name of the file indexing the contents of a columnar events directory, see
+`EventsPi.save_columnar`"""
+
 
 class EventsPi(OrderedDict):
     """
@@ -121,7 +134,9 @@ class EventsPi(OrderedDict):
         ----------
         events_file : string or mapping
             If string, interpret as a path and load file at that path; the
-            loaded object should be a mapping. If already a mapping, take and
+            loaded object should be a mapping. The path can also point to a
+            columnar events directory (see `save_columnar`), whose arrays are
+            memory-mapped rather than read. If already a mapping, take and
             interpret events from that.
 
         variable_mapping : mapping, optional
@@ -162,7 +177,9 @@ class EventsPi(OrderedDict):
                         " an iterable of strings"
                     )
 
-        if isinstance(events_file, str):
+        if isinstance(events_file, str) and is_columnar_events_dir(events_file):
+            input_data = load_columnar_events(events_file)
+        elif isinstance(events_file, str):
             input_data = from_file(events_file)
             if not isinstance(input_data, Mapping):
                 raise TypeError(
@@ -216,6 +233,11 @@ class EventsPi(OrderedDict):
         # Should be organised under a single layer of keys, each representing
         # some category of input data
 
+        # Arrays loaded from a file are not referenced elsewhere, hence need
+        # not be copied if they already have the right dtype (in particular,
+        # memory-mapped arrays are kept as such)
+        copy_arrays = not isinstance(events_file, str)
+
         # Loop over the input types
         for data_key in input_data.keys():
             if data_key in self:
@@ -246,7 +268,9 @@ class EventsPi(OrderedDict):
                 for var in var_src:
                     if var in input_data[data_key]:
                         array_data_to_stack.append(
-                            input_data[data_key][var].astype(FTYPE)
+                            input_data[data_key][var].astype(
+                                FTYPE, copy=copy_arrays
+                            )
                         )
                     else:
                         raise KeyError(
@@ -255,8 +279,13 @@ class EventsPi(OrderedDict):
                         )
 
                 # Note `squeeze` removes the extraneous 2nd dim in case of a
-                # single `src`
-                array_data = np.squeeze(np.stack(array_data_to_stack, axis=1))
+                # single `src`; avoid the copy made by `stack` in this case
+                if len(array_data_to_stack) == 1:
+                    array_data = array_data_to_stack[0]
+                    if array_data.ndim > 1:
+                        array_data = np.squeeze(array_data)
+                else:
+                    array_data = np.squeeze(np.stack(array_data_to_stack, axis=1))
 
                 # Add each array to the event
                 # TODO Memory copies?
@@ -335,11 +364,10 @@ class EventsPi(OrderedDict):
                 )
             mask = eval(crit_str)  # pylint: disable=eval-used
 
-            # Fill a new container with the post-cut data
+            # Fill a new container with the post-cut data (boolean indexing
+            # already returns a copy)
             for variable_name in variables:
-                cut_data[key][variable_name] = copy.deepcopy(
-                    self[key][variable_name][mask]
-                )
+                cut_data[key][variable_name] = self[key][variable_name][mask]
 
         # TODO update to GPUs?
 
@@ -377,6 +405,64 @@ class EventsPi(OrderedDict):
         # Apply the cut
         return self.apply_cut(bin_edge_cuts)
 
+    def save_columnar(self, output_dir, overwrite=False):
+        """Write the events to a columnar events directory, i.e. one `.npy`
+        file per category and variable, which `load_events_file` can
+        memory-map. Processes mapping the same files share their pages in the
+        OS page cache rather than each holding their own copy of the events.
+
+        Note that variables are stored as they are currently held, i.e. after
+        any variable mapping, stacking, down-sampling and cuts; loading the
+        directory without a `variable_mapping` (or with one only selecting
+        variables) therefore reproduces these events without any copying.
+
+        Parameters
+        ----------
+        output_dir : string
+            Path of the directory to create
+
+        overwrite : bool
+            Whether to replace an existing columnar events directory
+
+        """
+        output_dir = os.path.expandvars(os.path.expanduser(output_dir))
+        if os.path.exists(output_dir):
+            if not (overwrite and is_columnar_events_dir(output_dir)):
+                raise IOError(
+                    'Cannot write columnar events to existing path "%s"'
+                    % output_dir
+                )
+
+        index = OrderedDict()
+        index["name"] = self.name
+        index["ftype"] = np.dtype(FTYPE).name
+        index["categories"] = OrderedDict()
+
+        # Write to a temporary directory first such that readers never see a
+        # partially-written directory
+        parent_dir = os.path.dirname(os.path.abspath(output_dir))
+        mkdir(parent_dir, warn=False)
+        tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+        try:
+            for key, variables in self.items():
+                index["categories"][key] = []
+                mkdir(os.path.join(tmp_dir, key), warn=False)
+                for var, array_data in variables.items():
+                    np.save(
+                        os.path.join(tmp_dir, key, var + ".npy"),
+                        np.ascontiguousarray(array_data),
+                    )
+                    index["categories"][key].append(var)
+            with open(os.path.join(tmp_dir, COLUMNAR_INDEX_FILENAME), "w") as f:
+                json.dump(index, f, indent=2)
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.rename(tmp_dir, output_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        logging.info('Wrote columnar events to "%s"', output_dir)
+
     def __str__(self):  # TODO Handle non-array data cases
         string = "-----------------------------\n"
         string += "EventsPi container %s :" % self.name
@@ -402,6 +488,54 @@ class EventsPi(OrderedDict):
         return string
 
 
+def is_columnar_events_dir(path):
+    """Whether `path` points to a columnar events directory, as written by
+    `EventsPi.save_columnar`"""
+    try:
+        path = find_resource(path)
+    except IOError:
+        return False
+    return os.path.isfile(os.path.join(path, COLUMNAR_INDEX_FILENAME))
+
+
+def load_columnar_events(path, mmap_mode="r"):
+    """Memory-map the arrays in a columnar events directory.
+
+    Parameters
+    ----------
+    path : string
+        Columnar events directory, as written by `EventsPi.save_columnar`
+
+    mmap_mode : string
+        Passed to `numpy.load`. With the default, 'r', arrays are read-only
+        and the data of a variable is only read from disk (and shared between
+        processes) once accessed.
+
+    Returns
+    -------
+    input_data : OrderedDict
+        {category: {variable: numpy.memmap}}
+
+    """
+    path = find_resource(path)
+    with open(os.path.join(path, COLUMNAR_INDEX_FILENAME)) as f:
+        index = json.load(f, object_pairs_hook=OrderedDict)
+    if index["ftype"] != np.dtype(FTYPE).name:
+        logging.warning(
+            'Columnar events in "%s" are stored as %s but FTYPE is %s; arrays'
+            " will be converted (and hence copied) upon loading",
+            path, index["ftype"], np.dtype(FTYPE).name
+        )
+    input_data = OrderedDict()
+    for key, variables in index["categories"].items():
+        input_data[key] = OrderedDict()
+        for var in variables:
+            input_data[key][var] = np.load(
+                os.path.join(path, key, var + ".npy"), mmap_mode=mmap_mode
+            )
+    return input_data
+
+
 def split_nu_events_by_flavor_and_interaction(input_data):
     """Split neutrino events by nu vs nubar, and CC vs NC.
 
@@ -513,12 +647,87 @@ def fix_oppo_flux(input_data):
             val["nominal_numubar_flux"] = val.pop("neutrino_oppo_numu_flux")
 
 
+def test_columnar_events():
+    """Unit test for writing and memory-mapping columnar events"""
+    rand = np.random.RandomState(0)
+    input_data = OrderedDict()
+    for key in ("numu_cc", "nue_nc"):
+        input_data[key] = OrderedDict(
+            [
+                ("true_energy", rand.uniform(1, 100, 1000)),
+                ("true_coszen", rand.uniform(-1, 1, 1000)),
+                ("pid", rand.uniform(0, 1, 1000)),
+                ("weighted_aeff", rand.uniform(0, 1e-4, 1000)),
+            ]
+        )
+    variable_mapping = OrderedDict(
+        [
+            ("true_energy", "true_energy"),
+            ("true_coszen", "true_coszen"),
+            ("pid", "pid"),
+            ("stacked", ["pid", "weighted_aeff"]),
+        ]
+    )
+
+    ref = EventsPi(name="test")
+    ref.load_events_file(input_data, variable_mapping=variable_mapping)
+    ref = ref.apply_cut("true_energy < 50")
+
+    testdir = tempfile.mkdtemp()
+    try:
+        store = os.path.join(testdir, "events")
+        ref.save_columnar(store)
+        assert is_columnar_events_dir(store)
+        assert not is_columnar_events_dir(testdir)
+
+        events = EventsPi(name="test")
+        events.load_events_file(store)
+        assert list(events.keys()) == list(ref.keys())
+        for key in ref:
+            assert list(events[key].keys()) == list(ref[key].keys())
+            for var, array_data in ref[key].items():
+                loaded = events[key][var]
+                assert isinstance(loaded, np.memmap), (key, var)
+                assert loaded.dtype == FTYPE
+                assert np.all(loaded == array_data)
+
+        # Selecting a subset of variables does not copy either
+        events = EventsPi(name="test")
+        events.load_events_file(store, variable_mapping={"e": "true_energy"})
+        assert list(events["numu_cc"].keys()) == ["e"]
+        assert isinstance(events["numu_cc"]["e"], np.memmap)
+
+        # Refuse to overwrite unless asked to
+        try:
+            ref.save_columnar(store)
+        except IOError:
+            pass
+        else:
+            raise AssertionError("Existing columnar events were overwritten")
+        ref.save_columnar(store, overwrite=True)
+        assert sorted(os.listdir(testdir)) == ["events"]
+    finally:
+        shutil.rmtree(testdir, ignore_errors=True)
+
+    logging.info("<< PASS : test_columnar_events >>")
+
+
 def main():
-    """Load an events file and print the contents"""
+    """Load an events file and print the contents, optionally converting it to
+    a columnar events directory"""
     parser = argparse.ArgumentParser(description="Events parsing")
     parser.add_argument(
         "-i","--input-file", type=str, required=True, help="Input HDF5 events file"
     )
+    parser.add_argument(
+        "--columnar-output", type=str, default=None,
+        help="""Write the events to this columnar events directory, which can
+        subsequently be memory-mapped in place of the input file"""
+    )
+    parser.add_argument(
+        "--mc-cuts", type=str, default=None,
+        help="Cut to apply to the events before writing columnar output"
+    )
     args = parser.parse_args()
 
     events = EventsPi()
@@ -526,8 +735,14 @@ def main():
 
     print("Loaded events from : %s" % args.input_file)
 
+    if args.mc_cuts:
+        events = events.apply_cut(args.mc_cuts)
+
     print(events)
 
+    if args.columnar_output is not None:
+        events.save_columnar(args.columnar_output)
+
 
 if __name__ == "__main__":
     main()
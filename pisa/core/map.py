@@ -43,7 +43,8 @@ from pisa.utils import stats
 
 
 __all__ = ['type_error', 'reduceToHist', 'rebin', 'valid_nominal_values',
-           'Map', 'MapSet', 'test_Map', 'test_MapSet']
+           'Map', 'MapSet', 'test_Map', 'test_error_propagation',
+           'test_fluctuate_batch', 'test_MapSet']
 
 __author__ = 'J.L. Lanfranchi'
 
@@ -96,19 +97,24 @@ def reduceToHist(obj):
     TypeError if `obj` is an unhandled type
 
     """
-    if isinstance(obj, np.ndarray):
-        hist = obj
-    elif isinstance(obj, Map):
-        hist = obj.hist
-    elif isinstance(obj, MapSet):
-        hist = sum(obj).hist
-    elif isinstance(obj, Iterable):
-        hist = sum([reduceToHist(x) for x in obj])
-    else:
-        raise TypeError('Unhandled type for `obj`: %s' % type(obj))
+    hist = _reduce(obj)
+    if isinstance(hist, Map):
+        hist = hist.hist
     return hist
 
 
+def _reduce(obj):
+    """Like `reduceToHist` but without converting a Map to its `hist` (and
+    hence without creating an object array for a Map with errors)"""
+    if isinstance(obj, (np.ndarray, Map)):
+        return obj
+    if isinstance(obj, MapSet):
+        return sum(obj)
+    if isinstance(obj, Iterable):
+        return sum([_reduce(x) for x in obj])
+    raise TypeError('Unhandled type for `obj`: %s' % type(obj))
+
+
 def rebin(hist, orig_binning, new_binning, normalize_values=True):
     """Rebin a histogram.
 
@@ -193,14 +199,28 @@ def _new_obj(original_function):
         args = args[2:]
         new_state = OrderedDict()
         state_updates = func(self, *args, **kwargs)
+        if state_updates is None:
+            state_updates = {}
+        # Nominal values ('hist') and 'variances' are always updated together
+        if 'hist' in state_updates:
+            variances = state_updates.get('variances', None)
+        else:
+            state_updates['hist'] = deepcopy(self._nominal_values)
+            variances = deepcopy(self._variances)
         for slot in self._state_attrs:
-            if state_updates is not None and slot in state_updates:
+            if slot in state_updates:
                 new_state[slot] = state_updates[slot]
             else:
                 new_state[slot] = deepcopy(getattr(self, slot))
         if len(new_state['binning']) == 0:
-            return np.asscalar(new_state['hist'])
-        return Map(**new_state)
+            if variances is None:
+                return np.asarray(new_state['hist']).item()
+            return ufloat(np.asarray(new_state['hist']).item(),
+                          np.sqrt(np.asarray(variances).item()))
+        new_map = Map(**new_state)
+        if variances is not None:
+            new_map._set_values(new_map._nominal_values, variances)
+        return new_map
     return decorate(original_function, new_function)
 
 
@@ -210,6 +230,37 @@ def valid_nominal_values(data_array):
     return np.ma.masked_invalid(unp.nominal_values(data_array))
 
 
+def _split_errors(value):
+    """Split `value` into nominal values and variances; variances are None if
+    `value` carries no uncertainties"""
+    if isinstance(value, Map):
+        return value._nominal_values, value._variances # pylint: disable=protected-access
+    if isinstance(value, uncertainties.core.AffineScalarFunc):
+        return value.nominal_value, value.std_dev**2
+    if isinstance(value, np.ndarray) and value.dtype == np.object_:
+        return unp.nominal_values(value), np.square(unp.std_devs(value))
+    return value, None
+
+
+def _sum_variances(*variances):
+    """Sum of the variances that are not None (None if all are None)"""
+    variances = [v for v in variances if v is not None]
+    if not variances:
+        return None
+    if len(variances) == 1:
+        return np.copy(variances[0])
+    return reduce(add, variances)
+
+
+def _scale_variance(variance, derivative):
+    """Propagate `variance` through a function with `derivative`, where
+    `derivative` is a callable such that it is only evaluated if needed"""
+    if variance is None:
+        return None
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return variance * np.square(derivative())
+
+
 # TODO: implement strategies for decreasing dimensionality (i.e.
 # projecting map onto subset of dimensions in the original map)
 
@@ -250,6 +301,21 @@ class Map(object):
         equality of this map with another. See `__eq__` method.
 
 
+    Notes
+    -----
+    Nominal values and variances (squared errors) are stored as two separate
+    float arrays, and errors are propagated through the arithmetic operations
+    to first order, vectorized over the bins. Operands are taken to be
+    uncorrelated, i.e., unlike `uncertainties`, correlations arising from
+    using the same map more than once in an expression (e.g. `m - m`) are not
+    accounted for.
+
+    An `uncertainties.unumpy` object array is only created upon accessing
+    `hist` of a map with errors. Since this is a new array every time,
+    assigning to its elements does not modify the map; assign to the map
+    instead (`m[idx] = value`).
+
+
     Examples
     --------
     >>> from pisa.core.binning import MultiDimBinning
@@ -266,7 +332,7 @@ class Map(object):
     >>> m0.binning
     energy: 4 logarithmically-uniform bins spanning [1.0, 80.0] GeV
     coszen: 5 equally-sized bins spanning [-1.0, 0.0]
-    >>> m0.hist[0:4, 0] = 1
+    >>> m0[0:4, 0] = 1
     >>> m0
     array([[ 1.,  0.,  0.,  0.,  0.],
            [ 1.,  0.,  0.,  0.,  0.],
@@ -319,9 +385,13 @@ class Map(object):
         # Do the work here to set read-only attributes
         super().__setattr__('_binning', binning)
         binning.assert_array_fits(hist)
-        super().__setattr__(
-            '_hist', np.ascontiguousarray(hist)
-        )
+        hist = np.asarray(hist)
+        if hist.dtype == np.object_:
+            # e.g. `uncertainties.unumpy.uarray`
+            self._set_values(unp.nominal_values(hist),
+                             np.square(unp.std_devs(hist)))
+        else:
+            self._set_values(hist, None)
         if error_hist is not None:
             self.set_errors(error_hist)
         self._normalize_values = True
@@ -390,7 +460,10 @@ class Map(object):
         z : Standard Python scalar object
 
         """
-        return self.hist.item(*args)
+        if self._variances is None:
+            return self._nominal_values.item(*args)
+        return ufloat(self._nominal_values.item(*args),
+                      np.sqrt(self._variances.item(*args)))
 
     def slice(self, **kwargs):
         """Slice the map, where each argument is the name of a dimension.
@@ -436,7 +509,7 @@ class Map(object):
         ... ])
         >>> ones = mdb.ones(name='ones')
         >>> sl = ones.slice(x=2)
-        >>> sl.hist[...] = 0
+        >>> sl[...] = 0
         >>> print sl.hist
         >>> print ones.hist
         [[ 1.  1.  1.  1.  1.  1.  1.  1.  1.  1.]
@@ -461,13 +534,32 @@ class Map(object):
         """
         return self[self.binning.indexer(**kwargs)]
 
+    def _set_values(self, nominal_values, variances):
+        """Set the nominal values and the variances (None for no errors) of
+        the map. Maps with errors hold double precision values."""
+        if variances is None:
+            nominal_values = np.ascontiguousarray(nominal_values)
+        else:
+            nominal_values = np.ascontiguousarray(nominal_values,
+                                                  dtype=np.float64)
+            variances = np.ascontiguousarray(variances, dtype=np.float64)
+            if variances.shape != nominal_values.shape:
+                variances = np.broadcast_to(variances,
+                                            nominal_values.shape).copy()
+            elif (not variances.flags.writeable
+                  or np.may_share_memory(variances, nominal_values)):
+                # both are modified in place by `__setitem__`
+                variances = variances.copy()
+        if not nominal_values.flags.writeable:
+            # e.g. the read-only `hist` or `nominal_values` of another map
+            nominal_values = nominal_values.copy()
+        super().__setattr__('_nominal_values', nominal_values)
+        super().__setattr__('_variances', variances)
+
     def set_poisson_errors(self):
         """Approximate poisson errors using sqrt(n)."""
-        nom_values = self.nominal_values
-        super().__setattr__(
-            '_hist',
-            unp.uarray(nom_values, np.sqrt(nom_values))
-        )
+        nom_values = self._nominal_values
+        self._set_values(nom_values, nom_values)
 
     def set_errors(self, error_hist):
         """Manually define the error with an array the same shape as the
@@ -482,15 +574,10 @@ class Map(object):
 
         """
         if error_hist is None:
-            super().__setattr__(
-                '_hist', self.nominal_values
-            )
+            self._set_values(self._nominal_values, None)
             return
         self.assert_compat(error_hist)
-        super().__setattr__(
-            '_hist',
-            unp.uarray(self._hist, np.ascontiguousarray(error_hist))
-        )
+        self._set_values(self._nominal_values, np.square(error_hist))
 
     # TODO: make this return an OrderedDict to organize all of the returned
     # objects
@@ -698,7 +785,7 @@ class Map(object):
         if fmt is not None and fname is None:
             fname = get_valid_filename(to_plot.name)
 
-        hist = valid_nominal_values(to_plot.hist)
+        hist = np.ma.masked_invalid(to_plot.nominal_values)
         if symm:
             cmap = cmap_div if cmap is None else cmap
             if vmin is None and vmax is None:
@@ -810,9 +897,14 @@ class Map(object):
                      for b in new_binning]
         # TODO: should this be a deepcopy rather than a simple veiw of the
         # original hist (the result of np.moveaxis)?
-        new_hist = np.moveaxis(self.hist, source=new_order,
+        new_hist = np.moveaxis(self._nominal_values, source=new_order,
                                destination=orig_order)
-        return {'hist': new_hist, 'binning': new_binning}
+        new_variances = None
+        if self._variances is not None:
+            new_variances = np.moveaxis(self._variances, source=new_order,
+                                        destination=orig_order)
+        return {'hist': new_hist, 'variances': new_variances,
+                'binning': new_binning}
 
     @_new_obj
     def squeeze(self):
@@ -825,8 +917,12 @@ class Map(object):
 
         """
         new_binning = self.binning.squeeze()
-        new_hist = self.hist.squeeze()
-        return {'hist': new_hist, 'binning': new_binning}
+        new_hist = self._nominal_values.squeeze()
+        new_variances = None
+        if self._variances is not None:
+            new_variances = self._variances.squeeze()
+        return {'hist': new_hist, 'variances': new_variances,
+                'binning': new_binning}
 
     @_new_obj
     def sum(self, axis=None, keepdims=False):
@@ -859,7 +955,12 @@ class Map(object):
             axis = [axis]
         # Note that the tuple is necessary here (I think...)
         sum_indices = tuple([self.binning.index(dim) for dim in axis])
-        new_hist = self.hist.sum(axis=sum_indices, keepdims=keepdims)
+        new_hist = self._nominal_values.sum(axis=sum_indices,
+                                            keepdims=keepdims)
+        new_variances = None
+        if self._variances is not None:
+            new_variances = self._variances.sum(axis=sum_indices,
+                                                keepdims=keepdims)
 
         new_binning = []
         for idx, dim in enumerate(self.binning.dims):
@@ -868,7 +969,8 @@ class Map(object):
                     new_binning.append(dim.downsample(len(dim)))
             else:
                 new_binning.append(dim)
-        return {'hist': new_hist, 'binning': new_binning}
+        return {'hist': new_hist, 'variances': new_variances,
+                'binning': new_binning}
 
     def project(self, axis, keepdims=False):
         """Project all dimensions onto a single `axis`.
@@ -919,10 +1021,16 @@ class Map(object):
         `pisa.core.map.rebin` : function called to do the work
 
         """
-        # TODO: put uncertainties in
-        new_hist = rebin(hist=self.hist, orig_binning=self.binning,
+        new_hist = rebin(hist=self._nominal_values, orig_binning=self.binning,
                          new_binning=new_binning)
-        return {'hist': new_hist, 'binning': new_binning}
+        new_variances = None
+        if self._variances is not None:
+            # variances of merged bins add up
+            new_variances = rebin(hist=self._variances,
+                                  orig_binning=self.binning,
+                                  new_binning=new_binning)
+        return {'hist': new_hist, 'variances': new_variances,
+                'binning': new_binning}
 
     def downsample(self, *args, **kwargs):
         """Downsample by integer factor(s), summing together merged bins'
@@ -949,8 +1057,8 @@ class Map(object):
         random_state : None or type accepted by utils.random_numbers.get_random_state
 
         jumpahead : int >= 0
-            After instantiating the random_state object, move `jumpahead`
-            positions forward in the Mersenne twister's finite state machine
+            Select the independent random number stream `jumpahead` derived
+            from `random_state`; see utils.random_numbers.get_random_state
 
         Returns
         -------
@@ -977,7 +1085,7 @@ class Map(object):
                 error_vals = np.empty_like(orig_hist, dtype=np.float64)
                 error_vals[valid_mask] = np.sqrt(orig_hist[valid_mask])
                 error_vals[nan_at] = np.nan
-            return {'hist': unp.uarray(hist_vals, error_vals)}
+            return {'hist': hist_vals, 'variances': np.square(error_vals)}
 
         elif method == 'gauss+poisson':
             random_state = get_random_state(random_state, jumpahead=jumpahead)
@@ -988,7 +1096,8 @@ class Map(object):
                 valid_mask = ~nan_at
                 gauss = np.empty_like(orig_hist, dtype=np.float64)
                 gauss[valid_mask] = norm.rvs(
-                    loc=orig_hist[valid_mask], scale=sigma[valid_mask]
+                    loc=orig_hist[valid_mask], scale=sigma[valid_mask],
+                    random_state=random_state
                 )
 
                 hist_vals = np.empty_like(orig_hist, dtype=np.float64)
@@ -1001,7 +1110,7 @@ class Map(object):
                 error_vals = np.empty_like(orig_hist, dtype=np.float64)
                 error_vals[valid_mask] = np.sqrt(orig_hist[valid_mask])
                 error_vals[nan_at] = np.nan
-            return {'hist': unp.uarray(hist_vals, error_vals)}
+            return {'hist': hist_vals, 'variances': np.square(error_vals)}
 
         elif method == 'gauss':
             random_state = get_random_state(random_state, jumpahead=jumpahead)
@@ -1012,12 +1121,13 @@ class Map(object):
                 valid_mask = ~nan_at
                 hist_vals = np.empty_like(orig_hist, dtype=np.float64)
                 hist_vals[valid_mask] = norm.rvs(loc=orig_hist[valid_mask],
-                                                 scale=sigma[valid_mask])
+                                                 scale=sigma[valid_mask],
+                                                 random_state=random_state)
                 hist_vals[nan_at] = np.nan
                 error_vals = np.empty_like(orig_hist, dtype=np.float64)
                 error_vals[valid_mask] = np.sqrt(orig_hist[valid_mask])
                 error_vals[nan_at] = np.nan
-            return {'hist': unp.uarray(hist_vals, error_vals)}
+            return {'hist': hist_vals, 'variances': np.square(error_vals)}
 
         elif method in ['', 'none']:
             return {}
@@ -1028,17 +1138,17 @@ class Map(object):
     @property
     def shape(self):
         """tuple : shape of the map, akin to `nump.ndarray.shape`"""
-        return self.hist.shape
+        return self._nominal_values.shape
 
     @property
     def size(self):
         """int : total number of elements"""
-        return self.hist.size
+        return self._nominal_values.size
 
     @property
     def num_entries(self):
         """int : total number of weighted entries in all bins"""
-        return np.sum(valid_nominal_values(self.hist))
+        return np.sum(np.ma.masked_invalid(self._nominal_values))
 
     @property
     def serializable_state(self):
@@ -1161,12 +1271,15 @@ class Map(object):
         """
         for i in range(self.size):
             idx_coord = self.binning.index2coord(i)
-            idx_view = [slice(x, x+1) for x in idx_coord]
+            idx_view = tuple(slice(x, x+1) for x in idx_coord)
             single_bin_map = Map(
-                name=self.name, hist=self.hist[idx_view],
+                name=self.name, hist=self._nominal_values[idx_view],
                 binning=self.binning[idx_coord], hash=None, tex=self.tex,
                 full_comparison=self.full_comparison
             )
+            if self._variances is not None:
+                single_bin_map._set_values(single_bin_map._nominal_values,
+                                           self._variances[idx_view])
             single_bin_map.parent_indexer = idx_coord
             yield single_bin_map
 
@@ -1200,11 +1313,17 @@ class Map(object):
         new_binning = self.binning[idx]
 
         new_map = Map(name=self.name,
-                      hist=np.reshape(self.hist[idx], new_binning.shape),
+                      hist=np.reshape(self._nominal_values[idx],
+                                      new_binning.shape),
                       binning=self.binning[idx],
                       hash=self.hash,
                       tex=self.tex,
                       full_comparison=self.full_comparison)
+        if self._variances is not None:
+            new_map._set_values(
+                new_map._nominal_values,
+                np.reshape(self._variances[idx], new_binning.shape)
+            )
         new_map.parent_indexer = idx
         return new_map
 
@@ -1272,7 +1391,8 @@ class Map(object):
         new_order.pop(dim_index)
         new_order = [dim_index] + new_order
         rearranged_map = self.reorder_dimensions(new_order)
-        rearranged_hist = rearranged_map.hist
+        rearranged_hist = rearranged_map._nominal_values
+        rearranged_variances = rearranged_map._variances
         rearranged_dims = rearranged_map.binning.dims
 
         # Take all dims except the one being split on
@@ -1311,11 +1431,13 @@ class Map(object):
 
             new_tex = self.tex + ',' + r'{\;}' + spliton_dim.tex + bin_tex
 
-            maps.append(
-                Map(name=new_name, hist=new_hist, binning=new_binning,
-                    hash=self.hash, tex=new_tex,
-                    full_comparison=self.full_comparison)
-            )
+            new_map = Map(name=new_name, hist=new_hist, binning=new_binning,
+                          hash=self.hash, tex=new_tex,
+                          full_comparison=self.full_comparison)
+            if rearranged_variances is not None:
+                new_map._set_values(new_map._nominal_values,
+                                    rearranged_variances[bin_index, ...])
+            maps.append(new_map)
 
         if singleton:
             assert len(maps) == 1
@@ -1350,14 +1472,14 @@ class Map(object):
         total_llh : float or binned_llh if binned=True
 
         """
-        expected_values = reduceToHist(expected_values)
+        expected_values = _reduce(expected_values)
 
         if binned:
-            return stats.llh(actual_values=self.hist,
+            return stats.llh(actual_values=self,
                              expected_values=expected_values)
 
-        return np.sum(stats.llh(actual_values=self.hist,
-                                expected_values=expected_values))
+        return stats.total(stats.llh(actual_values=self,
+                                     expected_values=expected_values))
     
     def mcllh_mean(self, expected_values, binned=False):
         """Calculate the total LMean log-likelihood value between this map and the
@@ -1376,14 +1498,14 @@ class Map(object):
         total_llh : float or binned_llh if binned=True
 
         """
-        expected_values = reduceToHist(expected_values)
+        expected_values = _reduce(expected_values)
 
         if binned:
-            return stats.mcllh_mean(actual_values=self.hist,
-                             expected_values=expected_values)
+            return stats.mcllh_mean(actual_values=self,
+                                    expected_values=expected_values)
 
-        return np.sum(stats.mcllh_mean(actual_values=self.hist,
-                                expected_values=expected_values))
+        return stats.total(stats.mcllh_mean(actual_values=self,
+                                            expected_values=expected_values))
 
 
     def mcllh_eff(self, expected_values, binned=False):
@@ -1403,14 +1525,14 @@ class Map(object):
         total_llh : float or binned_llh if binned=True
 
         """
-        expected_values = reduceToHist(expected_values)
+        expected_values = _reduce(expected_values)
 
         if binned:
-            return stats.mcllh_eff(actual_values=self.hist,
-                             expected_values=expected_values)
+            return stats.mcllh_eff(actual_values=self,
+                                   expected_values=expected_values)
 
-        return np.sum(stats.mcllh_eff(actual_values=self.hist,
-                                expected_values=expected_values))
+        return stats.total(stats.mcllh_eff(actual_values=self,
+                                           expected_values=expected_values))
 
     def conv_llh(self, expected_values, binned=False):
         """Calculate the total convoluted log-likelihood value between this map
@@ -1429,14 +1551,14 @@ class Map(object):
         total_conv_llh : float or binned_conv_llh if binned=True
 
         """
-        expected_values = reduceToHist(expected_values)
+        expected_values = _reduce(expected_values)
 
         if binned:
-            return stats.conv_llh(actual_values=self.hist,
+            return stats.conv_llh(actual_values=self,
                                   expected_values=expected_values)
 
-        return np.sum(stats.conv_llh(actual_values=self.hist,
-                                     expected_values=expected_values))
+        return stats.total(stats.conv_llh(actual_values=self,
+                                          expected_values=expected_values))
 
     def barlow_llh(self, expected_values, binned=False):
         """Calculate the total barlow log-likelihood value between this map and
@@ -1459,16 +1581,16 @@ class Map(object):
         # TODO: should this handle reduceToHist / expected_values as other
         # methods do, or should they handle these the way this method does?
         if isinstance(expected_values, (np.ndarray, Map, MapSet)):
-            expected_values = reduceToHist(expected_values)
+            expected_values = _reduce(expected_values)
         elif isinstance(expected_values, Iterable):
             expected_values = [reduceToHist(x) for x in expected_values]
 
         if binned:
-            return stats.barlow_llh(actual_values=self.hist,
+            return stats.barlow_llh(actual_values=self,
                                     expected_values=expected_values)
 
-        return np.sum(stats.barlow_llh(actual_values=self.hist,
-                                       expected_values=expected_values))
+        return stats.total(stats.barlow_llh(actual_values=self,
+                                            expected_values=expected_values))
 
     def mod_chi2(self, expected_values, binned=False):
         """Calculate the total modified chi2 value between this map and the map
@@ -1487,14 +1609,14 @@ class Map(object):
         total_mod_chi2 : float or binned_mod_chi2 if binned=True
 
         """
-        expected_values = reduceToHist(expected_values)
+        expected_values = _reduce(expected_values)
 
         if binned:
-            return stats.mod_chi2(actual_values=self.hist,
+            return stats.mod_chi2(actual_values=self,
                                   expected_values=expected_values)
 
-        return np.sum(stats.mod_chi2(actual_values=self.hist,
-                                     expected_values=expected_values))
+        return stats.total(stats.mod_chi2(actual_values=self,
+                                          expected_values=expected_values))
 
     def chi2(self, expected_values, binned=False):
         """Calculate the total chi-squared value between this map and the map
@@ -1513,17 +1635,19 @@ class Map(object):
         total_chi2 : float or binned_chi2 if binned=True
 
         """
-        expected_values = reduceToHist(expected_values)
+        expected_values = _reduce(expected_values)
 
         if binned:
-            return stats.chi2(actual_values=self.hist,
+            return stats.chi2(actual_values=self,
                               expected_values=expected_values)
 
-        return np.sum(stats.chi2(actual_values=self.hist,
-                                 expected_values=expected_values))
+        return stats.total(stats.chi2(actual_values=self,
+                                      expected_values=expected_values))
 
     def metric_total(self, expected_values, metric):
         # TODO: should this use reduceToHist as in chi2 and llh above?
+        if metric in stats.FAST_METRICS:
+            return stats.fast_metric(metric, self, _reduce(expected_values))
         if metric in stats.ALL_METRICS:
             return getattr(self, metric)(expected_values)
         else:
@@ -1531,7 +1655,13 @@ class Map(object):
                              % (metric, stats.ALL_METRICS))
 
     def __setitem__(self, idx, val):
-        return setitem(self.hist, idx, val)
+        nominal_values, variances = _split_errors(val)
+        if variances is not None and self._variances is None:
+            self._set_values(self._nominal_values, 0)
+        setitem(self._nominal_values, idx, nominal_values)
+        if self._variances is not None:
+            setitem(self._variances, idx,
+                    0 if variances is None else variances)
 
     @property
     def name(self):
@@ -1571,18 +1701,43 @@ class Map(object):
 
     @property
     def hist(self):
-        """numpy.ndarray : Histogram array underlying the Map"""
-        return self._hist
+        """numpy.ndarray : Read-only histogram array underlying the Map; for a
+        map with errors, a new `uncertainties.unumpy` object array. Modify the
+        map's values via indexing the map itself, e.g. `m[0:4, 0] = 1`."""
+        if self._variances is None:
+            hist = self._nominal_values.view()
+        else:
+            hist = unp.uarray(self._nominal_values, np.sqrt(self._variances))
+        hist.flags.writeable = False
+        return hist
 
     @property
     def nominal_values(self):
-        """numpy.ndarray : Bin values stripped of uncertainties"""
-        return unp.nominal_values(self._hist)
+        """numpy.ndarray : Read-only bin values stripped of uncertainties"""
+        nominal_values = self._nominal_values.view()
+        nominal_values.flags.writeable = False
+        return nominal_values
 
     @property
     def std_devs(self):
         """numpy.ndarray : Uncertainties (standard deviations) per bin"""
-        return unp.std_devs(self._hist)
+        if self._variances is None:
+            return np.zeros(self.shape)
+        return np.sqrt(self._variances)
+
+    @property
+    def variances(self):
+        """numpy.ndarray : Read-only squared uncertainties per bin"""
+        if self._variances is None:
+            return np.zeros(self.shape)
+        variances = self._variances.view()
+        variances.flags.writeable = False
+        return variances
+
+    @property
+    def has_errors(self):
+        """bool : Whether the map carries uncertainties"""
+        return self._variances is not None
 
     @property
     def binning(self):
@@ -1601,68 +1756,58 @@ class Map(object):
 
     # Common mathematical operators
 
+    @staticmethod
+    def _operand(other):
+        """Nominal values and variances of the operand `other`, raising a
+        TypeError for unhandled types"""
+        if not (np.isscalar(other)
+                or isinstance(other, (uncertainties.core.AffineScalarFunc,
+                                      np.ndarray, Map))):
+            type_error(other)
+        return _split_errors(other)
+
+    def _combined_full_comparison(self, other):
+        """State updates for the result of a binary operation with `other`"""
+        if isinstance(other, Map):
+            return {'full_comparison': (self.full_comparison or
+                                        other.full_comparison)}
+        return {}
+
     @_new_obj
     def __abs__(self):
         state_updates = {
-            #'name': "|%s|" % (self.name,),
-            #'tex': r"{\left| %s \right|}" % strip_outer_parens(self.tex),
-            'hist': np.abs(self.hist)
+            'hist': np.abs(self._nominal_values),
+            'variances': _sum_variances(self._variances),
         }
         return state_updates
 
     @_new_obj
     def __add__(self, other):
         """Add `other` to self"""
-        if np.isscalar(other) or type(other) is uncertainties.core.Variable:
-            state_updates = {
-                #'name': "(%s + %s)" % (self.name, other),
-                #'tex': r"{(%s + %s)}" % (self.tex, other),
-                'hist': self.hist + other
-            }
-        elif isinstance(other, np.ndarray):
-            state_updates = {
-                #'name': "(%s + array)" % self.name,
-                #'tex': r"{(%s + X)}" % self.tex,
-                'hist': self.hist + other
-            }
-        elif isinstance(other, Map):
-            state_updates = {
-                #'name': "(%s + %s)" % (self.name, other.name),
-                #'tex': r"{(%s + %s)}" % (self.tex, other.tex),
-                'hist': self.hist + other.hist,
-                'full_comparison': (self.full_comparison or
-                                    other.full_comparison),
-            }
-        else:
-            type_error(other)
+        other_values, other_variances = self._operand(other)
+        state_updates = {
+            'hist': self._nominal_values + other_values,
+            'variances': _sum_variances(self._variances, other_variances),
+        }
+        state_updates.update(self._combined_full_comparison(other))
         return state_updates
 
     #def __cmp__(self, other):
 
     @_new_obj
     def __div__(self, other):
-        if np.isscalar(other) or type(other) is uncertainties.core.Variable:
-            state_updates = {
-                #'name': "(%s / %s)" % (self.name, other),
-                #'tex': r"{(%s / %s)}" % (self.tex, other),
-                'hist': self.hist / other
-            }
-        elif isinstance(other, np.ndarray):
-            state_updates = {
-                #'name': "(%s / array)" % self.name,
-                #'tex': r"{(%s / X)}" % self.tex,
-                'hist': self.hist / other
-            }
-        elif isinstance(other, Map):
-            state_updates = {
-                #'name': "(%s / %s)" % (self.name, other.name),
-                #'tex': r"{(%s / %s)}" % (self.tex, other.tex),
-                'hist': self.hist / other.hist,
-                'full_comparison': (self.full_comparison or
-                                    other.full_comparison),
-            }
-        else:
-            type_error(other)
+        other_values, other_variances = self._operand(other)
+        new_hist = self._nominal_values / other_values
+        state_updates = {
+            'hist': new_hist,
+            'variances': _sum_variances(
+                _scale_variance(self._variances,
+                                lambda: np.divide(1., other_values)),
+                _scale_variance(other_variances,
+                                lambda: np.divide(new_hist, other_values))
+            ),
+        }
+        state_updates.update(self._combined_full_comparison(other))
         return state_updates
 
     def __truediv__(self, other):
@@ -1714,9 +1859,10 @@ class Map(object):
 
         """
         state_updates = {
-            #'name': "log(%s)" % self.name,
-            #'tex': r"\ln\left( %s \right)" % self.tex,
-            'hist': np.log(self.hist)
+            'hist': np.log(self._nominal_values),
+            'variances': _scale_variance(
+                self._variances, lambda: np.divide(1., self._nominal_values)
+            ),
         }
         return state_updates
 
@@ -1730,36 +1876,25 @@ class Map(object):
 
         """
         state_updates = {
-            #'name': "log10(%s)" % self.name,
-            #'tex': r"\log_{10}\left( %s \right)" % self.tex,
-            'hist': np.log10(self.hist)
+            'hist': np.log10(self._nominal_values),
+            'variances': _scale_variance(
+                self._variances,
+                lambda: np.divide(1., np.log(10) * self._nominal_values)
+            ),
         }
         return state_updates
 
     @_new_obj
     def __mul__(self, other):
-        if np.isscalar(other) or type(other) is uncertainties.core.Variable:
-            state_updates = {
-                #'name': "%s * %s" % (other, self.name),
-                #'tex': r"%s \cdot %s" % (other, self.tex),
-                'hist': self.hist * other
-            }
-        elif isinstance(other, np.ndarray):
-            state_updates = {
-                #'name': "array * %s" % self.name,
-                #'tex': r"X \cdot %s" % self.tex,
-                'hist': self.hist * other,
-            }
-        elif isinstance(other, Map):
-            state_updates = {
-                #'name': "%s * %s" % (self.name, other.name),
-                #'tex': r"%s \cdot %s" % (self.tex, other.tex),
-                'hist': self.hist * other.hist,
-                'full_comparison': (self.full_comparison or
-                                    other.full_comparison),
-            }
-        else:
-            type_error(other)
+        other_values, other_variances = self._operand(other)
+        state_updates = {
+            'hist': self._nominal_values * other_values,
+            'variances': _sum_variances(
+                _scale_variance(self._variances, lambda: other_values),
+                _scale_variance(other_variances, lambda: self._nominal_values)
+            ),
+        }
+        state_updates.update(self._combined_full_comparison(other))
         return state_updates
 
     def __ne__(self, other):
@@ -1768,37 +1903,31 @@ class Map(object):
     @_new_obj
     def __neg__(self):
         state_updates = {
-            #'name': "-%s" % self.name,
-            #'tex': r"-%s" % self.tex,
-            'hist': -self.hist,
+            'hist': -self._nominal_values,
+            'variances': _sum_variances(self._variances),
         }
         return state_updates
 
     @_new_obj
     def __pow__(self, other):
-        if np.isscalar(other) or type(other) is uncertainties.core.Variable:
-            state_updates = {
-                #'name': "%s**%s" % (self.name, other),
-                #'tex': "%s^{%s}" % (self.tex, other),
-                'hist': np.power(self.hist, other)
-            }
-        elif isinstance(other, np.ndarray):
-            state_updates = {
-                #'name': "%s**(array)" % self.name,
-                #'tex': r"%s^{X}" % self.tex,
-                'hist': np.power(self.hist, other),
-            }
-        elif isinstance(other, Map):
-            state_updates = {
-                #'name': "%s**(%s)" % (self.name,
-                #                      strip_outer_parens(other.name)),
-                #'tex': r"%s^{%s}" % (self.tex, strip_outer_parens(other.tex)),
-                'hist': np.power(self.hist, other.hist),
-                'full_comparison': (self.full_comparison or
-                                    other.full_comparison),
-            }
-        else:
-            type_error(other)
+        other_values, other_variances = self._operand(other)
+        new_hist = np.power(self._nominal_values, other_values)
+        # d(x**y)/dx = y * x**(y-1) and d(x**y)/dy = x**y * ln(x)
+        state_updates = {
+            'hist': new_hist,
+            'variances': _sum_variances(
+                _scale_variance(
+                    self._variances,
+                    lambda: (other_values
+                             * np.power(self._nominal_values, other_values - 1))
+                ),
+                _scale_variance(
+                    other_variances,
+                    lambda: new_hist * np.log(self._nominal_values)
+                )
+            ),
+        }
+        state_updates.update(self._combined_full_comparison(other))
         return state_updates
 
     def __radd__(self, other):
@@ -1811,20 +1940,20 @@ class Map(object):
 
     @_new_obj
     def __rdiv(self, other):
-        if np.isscalar(other) or type(other) is uncertainties.core.Variable:
-            state_updates = {
-                #'name': "(%s / %s)" % (other, self.name),
-                #'tex': "{(%s / %s)}" % (other, self.tex),
-                'hist': other / self.hist,
-            }
-        elif isinstance(other, np.ndarray):
-            state_updates = {
-                #'name': "array / %s" % self.name,
-                #'tex': "{(X / %s)}" % self.tex,
-                'hist': other / self.hist,
-            }
-        else:
+        if isinstance(other, Map):
             type_error(other)
+        other_values, other_variances = self._operand(other)
+        new_hist = other_values / self._nominal_values
+        state_updates = {
+            'hist': new_hist,
+            'variances': _sum_variances(
+                _scale_variance(other_variances,
+                                lambda: np.divide(1., self._nominal_values)),
+                _scale_variance(self._variances,
+                                lambda: np.divide(new_hist,
+                                                  self._nominal_values))
+            ),
+        }
         return state_updates
 
     def __rmul__(self, other):
@@ -1837,20 +1966,13 @@ class Map(object):
 
     @_new_obj
     def __rsub(self, other):
-        if np.isscalar(other) or type(other) is uncertainties.core.Variable:
-            state_updates = {
-                #'name': "(%s - %s)" % (other, self.name),
-                #'tex': "{(%s - %s)}" % (other, self.tex),
-                'hist': other - self.hist,
-            }
-        elif isinstance(other, np.ndarray):
-            state_updates = {
-                #'name': "(array - %s)" % self.name,
-                #'tex': "{(X - %s)}" % self.tex,
-                'hist': other - self.hist,
-            }
-        else:
+        if isinstance(other, Map):
             type_error(other)
+        other_values, other_variances = self._operand(other)
+        state_updates = {
+            'hist': other_values - self._nominal_values,
+            'variances': _sum_variances(other_variances, self._variances),
+        }
         return state_updates
 
     @_new_obj
@@ -1862,38 +1984,22 @@ class Map(object):
         sqrt_map : Map
 
         """
+        new_hist = np.sqrt(self._nominal_values)
         state_updates = {
-            #'name': "sqrt(%s)" % self.name,
-            #'tex': r"\sqrt{%s}" % self.tex,
-            #'hist': np.asarray(unp.sqrt(self.hist), dtype='float'),
-            'hist': unp.sqrt(self.hist),
+            'hist': new_hist,
+            'variances': _scale_variance(self._variances,
+                                         lambda: np.divide(0.5, new_hist)),
         }
         return state_updates
 
     @_new_obj
     def __sub__(self, other):
-        if np.isscalar(other) or type(other) is uncertainties.core.Variable:
-            state_updates = {
-                #'name': "(%s - %s)" % (self.name, other),
-                #'tex': "{(%s - %s)}" % (self.tex, other),
-                'hist': self.hist - other,
-            }
-        elif isinstance(other, np.ndarray):
-            state_updates = {
-                #'name': "(%s - array)" % self.name,
-                #'tex': "{(%s - X)}" % self.tex,
-                'hist': self.hist - other,
-            }
-        elif isinstance(other, Map):
-            state_updates = {
-                #'name': "%s - %s" % (self.name, other.name),
-                #'tex': "{(%s - %s)}" % (self.tex, other.tex),
-                'hist': self.hist - other.hist,
-                'full_comparison': (self.full_comparison or
-                                    other.full_comparison),
-            }
-        else:
-            type_error(other)
+        other_values, other_variances = self._operand(other)
+        state_updates = {
+            'hist': self._nominal_values - other_values,
+            'variances': _sum_variances(self._variances, other_variances),
+        }
+        state_updates.update(self._combined_full_comparison(other))
         return state_updates
 
 # TODO: instantiate individual maps from dicts if passed as such, so user
@@ -2757,13 +2863,18 @@ class MapSet(object):
                              % (metric, stats.ALL_METRICS))
 
     def metric_total(self, expected_values, metric):
-        return np.sum(self.metric_per_map(expected_values, metric).values())
+        if metric in stats.FAST_METRICS:
+            per_map = self.apply_to_maps('metric_total', expected_values,
+                                         metric)
+        else:
+            per_map = self.metric_per_map(expected_values, metric)
+        return stats.total(list(per_map.values()))
 
     def chi2_per_map(self, expected_values):
         return self.apply_to_maps('chi2', expected_values)
 
     def chi2_total(self, expected_values):
-        return np.sum(self.chi2_per_map(expected_values))
+        return stats.total(self.chi2_per_map(expected_values))
 
     def fluctuate(self, method, random_state=None, jumpahead=0):
         """Add fluctuations to the maps in the set and return as a new MapSet.
@@ -2781,11 +2892,93 @@ class MapSet(object):
         return MapSet(maps=new_maps, name=self.name, tex=self.tex, hash=None,
                       collate_by_name=self.collate_by_name)
 
+    def fluctuate_batch(self, n, method='poisson', random_state=None,
+                        jumpahead=0):
+        """Draw `n` fluctuated pseudo-data distributions of all maps in the
+        set at once, without creating any new maps.
+
+        Parameters
+        ----------
+        n : int
+            Number of pseudo-data distributions (trials) to draw
+
+        method : string
+            One of 'poisson', 'gauss', or 'gauss+poisson' (see
+            `Map.fluctuate`); for 'gauss+poisson', negative Gaussian draws
+            are clipped to zero before the Poisson draw.
+
+        random_state : None or type accepted by utils.random_numbers.get_random_state
+
+        jumpahead : int >= 0
+
+        Returns
+        -------
+        batch : numpy.ndarray of shape (n, n_bins)
+            One trial per row, holding the flattened values of the maps in
+            the order of the set; bins with nan expectation are nan. Use
+            `batch_metric_total` to evaluate metrics for all trials.
+
+        """
+        orig = method
+        method = str(method).strip().lower().replace(' ', '')
+        if method not in ('poisson', 'gauss', 'gauss+poisson'):
+            raise ValueError('unhandled `method` = %s' % orig)
+
+        random_state = get_random_state(random_state=random_state,
+                                        jumpahead=jumpahead)
+        nominal = self._flat('nominal_values')
+        valid = ~np.isnan(nominal)
+        size = (n, np.count_nonzero(valid))
+
+        values = nominal[valid]
+        if method in ('gauss', 'gauss+poisson'):
+            values = random_state.normal(
+                loc=values, scale=self._flat('std_devs')[valid], size=size
+            )
+        if method in ('poisson', 'gauss+poisson'):
+            values = random_state.poisson(
+                lam=np.clip(values, 0, None), size=size
+            )
+
+        batch = np.full((n, nominal.size), np.nan)
+        batch[:, valid] = values
+        return batch
+
+    def batch_metric_total(self, actual_values, metric):
+        """Evaluate the total `metric` for each of a batch of pseudo-data
+        distributions, taking the maps in this set as the (fixed) expected
+        values.
+
+        Parameters
+        ----------
+        actual_values : numpy.ndarray of shape (n_trials, n_bins)
+            E.g. as returned by `fluctuate_batch`
+
+        metric : str
+            One of `stats.ALL_METRICS`; `stats.FAST_METRICS` are evaluated
+            for all trials in a single compiled loop
+
+        Returns
+        -------
+        totals : numpy.ndarray of shape (n_trials,)
+
+        """
+        return stats.metric_batch(metric, actual_values,
+                                  self._flat('nominal_values'),
+                                  variances=self._flat('variances'))
+
+    def _flat(self, attr):
+        """Concatenation of the flattened `attr` array of all maps"""
+        return np.concatenate(
+            [np.asarray(getattr(m, attr), dtype=np.float64).ravel()
+             for m in self]
+        )
+
     def llh_per_map(self, expected_values):
         return self.apply_to_maps('llh', expected_values)
 
     def llh_total(self, expected_values):
-        return np.sum(self.llh(expected_values))
+        return stats.total(self.llh(expected_values))
 
     def set_poisson_errors(self):
         return self.apply_to_maps('set_poisson_errors')
@@ -2985,6 +3178,142 @@ def test_Map():
     logging.info(str(('<< PASS : test_Map >>')))
 
 
+def test_error_propagation():
+    """Compare error propagation and metrics of maps with errors against
+    `uncertainties`"""
+    binning = MultiDimBinning([
+        OneDimBinning(name='energy', num_bins=4, is_log=True,
+                      domain=[1, 80]*ureg.GeV),
+        OneDimBinning(name='coszen', num_bins=3, is_lin=True, domain=[-1, 1])
+    ])
+    rand = np.random.RandomState(0)
+    m1 = Map(name='m1', hist=rand.uniform(1, 10, binning.shape),
+             error_hist=rand.uniform(0.1, 1, binning.shape), binning=binning)
+    m2 = Map(name='m2', hist=rand.uniform(1, 10, binning.shape),
+             error_hist=rand.uniform(0.1, 1, binning.shape), binning=binning)
+    # independent variables, as are the bins of two different maps
+    u1, u2 = m1.hist, m2.hist
+    assert isinstance(m1.hist[0, 0], uncertainties.core.Variable)
+
+    for m, u in [(m1 + m2, u1 + u2), (m1 - m2, u1 - u2), (m1 * m2, u1 * u2),
+                 (m1 / m2, u1 / u2), (m1**2, u1**2), (m1**m2, u1**u2),
+                 (3 - m1, 3 - u1), (2 * m1 + 8, 2 * u1 + 8),
+                 (m1 + ufloat(1, 0.5), u1 + ufloat(1, 0.5)),
+                 (m1 * u2, u1 * u2), (-m1, -u1), (abs(-m1), u1),
+                 (m1.log(), unp.log(u1)), (m1.log10(), unp.log10(u1)),
+                 (m1.sqrt(), unp.sqrt(u1)),
+                 (m1.sum('energy'), u1.sum(axis=0))]:
+        assert np.allclose(m.nominal_values, unp.nominal_values(u))
+        assert np.allclose(m.std_devs, unp.std_devs(u))
+
+    rebinned = m1.rebin(binning.downsample(4, 3))
+    assert np.isclose(rebinned.nominal_values.item(), np.sum(u1).nominal_value)
+    assert np.isclose(rebinned.std_devs.item(), np.sum(u1).std_dev)
+
+    # assignment with and without errors
+    m = m2 * 1
+    m[0, 0] = ufloat(2, 3)
+    m[1, :] = 5
+    assert m.nominal_values[0, 0] == 2 and m.std_devs[0, 0] == 3
+    assert np.all(m.nominal_values[1] == 5) and np.all(m.std_devs[1] == 0)
+
+    # assignment after `set_poisson_errors`, whose variances start out equal
+    # to the values
+    m = Map(name='m', hist=np.ones(binning.shape), binning=binning)
+    m.set_poisson_errors()
+    m[0, 0] = 100.
+    m[0, 1] = ufloat(5, 1)
+    assert m.nominal_values[0, 0] == 100 and m.std_devs[0, 0] == 0
+    assert m.nominal_values[0, 1] == 5 and m.std_devs[0, 1] == 1
+    assert np.all(m.nominal_values[1] == 1) and np.all(m.std_devs[1] == 1)
+
+    # maps created from the (read-only) values of another map can be modified
+    # independently
+    m = Map(name='m', hist=m1.nominal_values, binning=binning)
+    m[0, 0] = -1
+    assert m1.nominal_values[0, 0] != -1
+
+    # `hist`, `nominal_values` and `variances` are read-only, with and without
+    # errors
+    for m in [m1, Map(name='m', hist=np.ones(binning.shape), binning=binning)]:
+        for attr in ['hist', 'nominal_values', 'variances']:
+            try:
+                getattr(m, attr)[0, 0] = 5
+            except ValueError:
+                pass
+            else:
+                if attr != 'variances' or m.has_errors:
+                    assert False, 'was able to modify read-only `%s`' % attr
+
+    data = Map(name='data', hist=rand.poisson(m2.nominal_values),
+               binning=binning)
+    for metric in stats.ALL_METRICS:
+        if metric == 'barlow_llh':
+            continue
+        assert np.isclose(data.metric_total(m2, metric),
+                          np.sum(getattr(stats, metric)(data.hist, m2.hist))), \
+                metric
+
+    logging.info('<< PASS : test_error_propagation >>')
+
+
+def test_fluctuate_batch():
+    """Batched pseudo-data and metrics must agree with their per-trial
+    counterparts"""
+    binning = MultiDimBinning([
+        OneDimBinning(name='energy', num_bins=4, is_log=True,
+                      domain=[1, 80]*ureg.GeV),
+        OneDimBinning(name='coszen', num_bins=3, is_lin=True, domain=[-1, 1])
+    ])
+    rand = np.random.RandomState(0)
+    maps = [Map(name=name, hist=rand.uniform(1, 20, binning.shape),
+                error_hist=rand.uniform(0.1, 1, binning.shape),
+                binning=binning)
+            for name in ('m1', 'm2')]
+    expected = MapSet(maps)
+    n_bins = 2 * binning.size
+
+    for method in ['poisson', 'gauss', 'gauss+poisson']:
+        batch = expected.fluctuate_batch(20000, method, random_state=0)
+        assert batch.shape == (20000, n_bins)
+        assert np.all(batch == expected.fluctuate_batch(20000, method,
+                                                        random_state=0))
+        nominal = expected._flat('nominal_values')
+        variance = {'poisson': nominal,
+                    'gauss': expected._flat('variances'),
+                    'gauss+poisson': nominal + expected._flat('variances')}
+        assert np.all(np.abs(batch.mean(axis=0) - nominal)
+                      < 5*np.sqrt(variance[method] / 20000)), method
+
+    m = deepcopy(maps[0])
+    m[0, 0] = np.nan
+    batch = MapSet([m]).fluctuate_batch(10, random_state=0)
+    assert np.all(np.isnan(batch[:, 0])) and not np.any(np.isnan(batch[:, 1:]))
+    # the nan bin is skipped (not all metrics mask it by themselves)
+    valid = ~np.isnan(m.nominal_values)
+    for metric in stats.ALL_METRICS:
+        totals = MapSet([m]).batch_metric_total(batch, metric)
+        for trial, values in enumerate(batch):
+            reference = stats.total(getattr(stats, metric)(
+                values.reshape(binning.shape)[valid], m.hist[valid]
+            ))
+            assert np.isclose(totals[trial], reference,
+                              rtol=1e-10, atol=1e-8), metric
+
+    batch = expected.fluctuate_batch(20, random_state=1)
+    for metric in stats.ALL_METRICS:
+        totals = expected.batch_metric_total(batch, metric)
+        for trial, values in enumerate(batch):
+            hists = values.reshape((len(maps),) + binning.shape)
+            data = MapSet([Map(name=mp.name, hist=hist, binning=binning)
+                           for mp, hist in zip(maps, hists)])
+            assert np.isclose(totals[trial],
+                              data.metric_total(expected, metric),
+                              rtol=1e-10, atol=1e-8), metric
+
+    logging.info('<< PASS : test_fluctuate_batch >>')
+
+
 # TODO: add tests for llh, chi2 methods
 # TODO: make tests use assert rather than rely on logging.debug(str((!)))
 def test_MapSet():
@@ -3008,7 +3337,9 @@ def test_MapSet():
     _ = ms01.rebin(m1.binning.downsample(3))
     ms01_rebinned = ms01.rebin(m1.binning.downsample(6, 3))
     for m_orig, m_rebinned in zip(ms01, ms01_rebinned):
-        assert m_rebinned.hist[0, 0] == np.sum(m_orig.hist)
+        assert m_rebinned.nominal_values[0, 0] == np.sum(m_orig.nominal_values)
+        assert np.isclose(m_rebinned.std_devs[0, 0],
+                          np.sqrt(np.sum(np.square(m_orig.std_devs))))
 
     logging.debug(str(("downsampling =====================")))
     logging.debug(str((ms01.downsample(3))))
@@ -3017,12 +3348,15 @@ def test_MapSet():
     ms02 = MapSet((m1, m2), name='map set 1')
     ms1 = MapSet(maps=(m1, m2), name='map set 1', collate_by_name=True,
                  hash=None)
-    assert np.all(ms1.combine_re(r'.*').hist == ms1.combine_wildcard('*').hist)
-    assert np.all(ms1.combine_re(r'.*').hist == (ms1.ones + ms1.twos).hist)
-    assert np.all(ms1.combine_re(r'^(one|two)s.*$').hist ==
-                  ms1.combine_wildcard('*s').hist)
-    assert np.all(ms1.combine_re(r'^(one|two)s.*$').hist == (ms1.ones +
-                                                             ms1.twos).hist)
+    def same_values(map0, map1):
+        return (np.all(map0.nominal_values == map1.nominal_values)
+                and np.all(map0.std_devs == map1.std_devs))
+    assert same_values(ms1.combine_re(r'.*'), ms1.combine_wildcard('*'))
+    assert same_values(ms1.combine_re(r'.*'), ms1.ones + ms1.twos)
+    assert same_values(ms1.combine_re(r'^(one|two)s.*$'),
+                       ms1.combine_wildcard('*s'))
+    assert same_values(ms1.combine_re(r'^(one|two)s.*$'),
+                       ms1.ones + ms1.twos)
     logging.debug(str((ms1.combine_re(r'^o').hist)))
     logging.debug(str((ms1.combine_wildcard(r'o*').hist)))
     logging.debug(str((ms1.combine_re(r'^o').hist
@@ -3175,4 +3509,6 @@ def test_MapSet():
 if __name__ == "__main__":
     set_verbosity(1)
     test_Map()
+    test_error_propagation()
+    test_fluctuate_batch()
     test_MapSet()
@@ -11,6 +11,7 @@ from collections.abc import Sequence
 from collections import OrderedDict
 from copy import deepcopy
 from functools import total_ordering
+import itertools
 from operator import setitem
 import sys
 
@@ -46,6 +47,20 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
  limitations under the License.'''
 
 
+_VERSIONS = itertools.count(1)
+"""Source of `Param` versions, unique within a process"""
+
+
+def _values_equal(val0, val1):
+    """Whether param values `val0` and `val1`, which must be in the same units
+    (if any), are (element-wise) equal"""
+    try:
+        return bool(np.all(getattr(val0, 'magnitude', val0)
+                           == getattr(val1, 'magnitude', val1)))
+    except Exception: # pylint: disable=broad-except
+        return False
+
+
 # TODO: Make property "frozen" or "read_only" so params in param set e.g.
 # returned by a template maker -- which updating the values of will NOT have
 # the effect the user might expect -- will be explicitly forbidden?
@@ -117,7 +132,7 @@ class Param(object):
     _slots = ('name', 'unique_id', 'value', 'prior', 'range', 'is_fixed',
               'is_discrete', 'nominal_value', '_rescaled_value',
               '_nominal_value', '_tex', 'help', '_value', '_range', '_units',
-              'normalize_values')
+              'normalize_values', '_version')
     _state_attrs = ('name', 'unique_id', 'value', 'prior', 'range', 'is_fixed',
                     'is_discrete', 'nominal_value', 'tex', 'help')
 
@@ -127,6 +142,7 @@ class Param(object):
         self._tex = None
         self._value = None
         self._units = None
+        self._version = 0
 
         self.value = value
         self.name = name
@@ -156,6 +172,12 @@ class Param(object):
             raise AttributeError('Invalid attribute: %s' % (attr,))
         object.__setattr__(self, attr, val)
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Versions from another process (or copies of this param, which can be
+        # modified independently) cannot be compared with those of this one
+        self._version = next(_VERSIONS)
+
     def __str__(self):
         return '%s=%s; prior=%s, range=%s, is_fixed=%s,' \
                 ' is_discrete=%s; help="%s"' \
@@ -194,12 +216,21 @@ class Param(object):
                         'Passed values must have units if the param has units'
                 val = val.to(self._value.units)
             self.validate_value(val)
+        if self._value is None or not _values_equal(val, self._value):
+            self._version = next(_VERSIONS)
         self._value = val
         if hasattr(self._value, 'units'):
             self._units = self._value.units
         else:
             self._units = ureg.Unit('dimensionless')
 
+    @property
+    def version(self):
+        """int : changes (to a value unique within the process) whenever the
+        param's value changes, so that comparing versions is a cheap
+        alternative to comparing (hashes of) values"""
+        return self._version
+
     @property
     def magnitude(self):
         return self._value.magnitude
@@ -279,7 +310,10 @@ class Param(object):
             )
         srange0 = srange[0].m
         srange1 = srange[1].m
-        self._value = (srange0 + (srange1 - srange0)*rval) * self._units
+        value = (srange0 + (srange1 - srange0)*rval) * self._units
+        if not _values_equal(value, self._value):
+            self._version = next(_VERSIONS)
+        self._value = value
 
     @property
     def tex(self):
@@ -403,6 +437,7 @@ class Param(object):
 
         """
         self._value.ito(units)
+        self._version = next(_VERSIONS)
 
     @property
     def prior_llh(self):
@@ -944,12 +979,26 @@ class ParamSet(Sequence):
     def state(self):
         return tuple([obj.state for obj in self._params])
 
+    @property
+    def version(self):
+        """tuple of int : versions of the params (see `Param.version`); equal
+        versions imply equal param values, so this can be compared instead of
+        `values_hash` for detecting changes within a process"""
+        return tuple([obj._version for obj in self._params])
+
     @property
     def values_hash(self):
         """int : hash only on the current param values (not full state)"""
+        version = (self.version, self.normalize_values)
+        memo = self.__dict__.get('_values_hash_memo')
+        if memo is not None and memo[0] == version:
+            return memo[1]
         if self.normalize_values:
-            return hash_obj(normQuant(self.values))
-        return hash_obj(self.values)
+            values_hash = hash_obj(normQuant(self.values))
+        else:
+            values_hash = hash_obj(self.values)
+        self._values_hash_memo = (version, values_hash)
+        return values_hash
 
     @property
     def nominal_values_hash(self):
@@ -1212,6 +1261,18 @@ def test_Param():
     param2 = deepcopy(p2)
     assert param2 == p2
 
+    # Version changes with the value, and copies are versioned separately
+    version = p2.version
+    p2.value = p2.value
+    p2._rescaled_value = p2._rescaled_value
+    assert p2.version == version
+    p2.value = p2.value * 1.01
+    assert p2.version > version
+    version = p2.version
+    p2._rescaled_value = 0.5
+    assert p2.version > version
+    assert param2.version not in (version, p2.version)
+
     logging.info('<< PASS : test_Param >>')
 
 
@@ -1272,6 +1333,18 @@ def test_ParamSet():
     logging.debug(str((param_set.fixed.values_hash)))
     logging.debug(str((param_set.free.values_hash)))
 
+    # Versions (and memoized values hash) follow value changes
+    version, values_hash = param_set.version, param_set.values_hash
+    assert param_set.free.version == version
+    param_set.values = param_set.values
+    assert param_set.version == version
+    assert param_set.values_hash == values_hash
+    param_set['b'].value = 1.25
+    assert param_set.version != version
+    assert param_set.values_hash != values_hash
+    param_set['b'].value = 1
+    assert param_set.values_hash == values_hash
+
     logging.debug(str((param_set[0].state)))
     logging.debug(str((param_set.hash)))
     logging.debug(str((param_set.fixed.hash)))
@@ -8,20 +8,33 @@ functionality is built-in.
 
 from __future__ import absolute_import, division
 
+from collections import OrderedDict
+import os
+
+import numpy as np
 from numba import SmartArray
 
+from pisa import CACHE_DIR, FTYPE
 from pisa.core.base_stage import BaseStage
 from pisa.core.binning import MultiDimBinning
 from pisa.core.container import ContainerSet
+from pisa.utils.cache import ArrayDiskCache
+from pisa.utils.hash import hash_obj
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
 
 
-__all__ = ["PiStage"]
+__all__ = ["derivative_key", "PiStage"]
 __version__ = "Pi"
 __author__ = "Philipp Eller (pde3@psu.edu)"
 
 
+def derivative_key(key, param_name):
+    """Container key of the derivative of the array `key` with respect to the
+    magnitude (in its own units) of the param `param_name`"""
+    return "d(%s)/d(%s)" % (key, param_name)
+
+
 class PiStage(BaseStage):
     """
     PISA Pi stage base class. Should be used to implement PISA Pi stages
@@ -58,8 +71,33 @@ class PiStage(BaseStage):
     output_apply_keys : tuple of str
         keys of the output data (usually 'weights')
 
+    disk_cache : None, bool, string, or ArrayDiskCache
+        Where services can store per-event arrays that are expensive to
+        compute but depend only on the events and on fixed inputs (see
+        `cached_arrays`)
+      * If None or False, no disk cache is used.
+      * If True, the cache is located at `CACHE_DIR/<stage_name>/<service_name>`
+      * If string, this is interpreted as a directory; a relative path is
+        taken relative to CACHE_DIR.
+      * If an ArrayDiskCache object is passed, it will be used directly
+
+    Notes
+    -----
+    Stages can propagate derivatives of the event weights with respect to
+    params alongside the weights themselves (forward-mode differentiation):
+    for each param in `derivative_params` (set by the pipeline), the array
+    ``derivative_key('weights', name)`` holds d(weights)/d(param), and stages
+    that set `propagates_derivatives` keep these arrays up to date in
+    `apply_derivatives_function`, which is called right before
+    `apply_function`. The params a stage differentiates itself are listed
+    in `analytic_derivative_params`.
+
     """
 
+    propagates_derivatives = False
+    """bool : whether `apply_derivatives_function` updates the derivatives of
+    the weights consistently with what `apply_function` does to the weights"""
+
     def __init__(
         self,
         data=None,
@@ -76,6 +114,7 @@ class PiStage(BaseStage):
         output_apply_keys=(),
         input_calc_keys=(),
         output_calc_keys=(),
+        disk_cache=None,
     ):
         super().__init__(
             params=params,
@@ -142,10 +181,19 @@ class PiStage(BaseStage):
 
         self.mode = "".join(mode)
 
-        self.param_hash = None
+        self.disk_cache = disk_cache
+        self.instantiate_disk_cache()
+
+        self.params_version = None
+        """versions of the params (see `ParamSet.version`) when `compute` last
+        ran; set to None to force the next `compute`"""
         # cake compatibility
         self.outputs = None
 
+        self.derivative_params = ()
+        """tuple of str : params for which derivatives of the weights are
+        propagated through the stage"""
+
     def setup(self):
 
         # check that data is a ContainerSet (downstream modules assume this)
@@ -170,21 +218,94 @@ class PiStage(BaseStage):
         # call the user-defined setup function
         self.setup_function()
 
-        # invalidate param hash:
-        self.param_hash = -1
+        # invalidate params version:
+        self.params_version = None
 
     def setup_function(self):
         """Implement in services (subclasses of PiStage)"""
         pass
 
+    def instantiate_disk_cache(self):
+        """Instantiate the array disk cache for use by the stage."""
+        if isinstance(self.disk_cache, ArrayDiskCache):
+            return
+
+        if self.disk_cache is False or self.disk_cache is None:
+            self.disk_cache = None
+            return
+
+        if isinstance(self.disk_cache, str):
+            path = os.path.expandvars(os.path.expanduser(self.disk_cache))
+            if not os.path.isabs(path):
+                path = os.path.join(CACHE_DIR, path)
+        elif self.disk_cache is True:
+            if self.service_name is not None and self.service_name != "":
+                dirname = self.service_name
+            else:
+                dirname = "generic"
+            path = os.path.join(CACHE_DIR, self.stage_name, dirname)
+        else:
+            raise ValueError(
+                "Don't know what to do with a %s." % type(self.disk_cache)
+            )
+
+        self.disk_cache = ArrayDiskCache(path)
+
+    def cached_arrays(self, container, input_keys, hashables, func):
+        """Retrieve arrays derived from `container` from the disk cache, or
+        compute (and store) them if they are not available.
+
+        Entries are keyed on the contents of the container's `input_keys`
+        arrays (i.e., on the events after any cuts or sub-sampling, or on the
+        binning in binned mode) together with `hashables`, which must capture
+        everything else the arrays depend on (e.g. hashes of table files and
+        the values of fixed params).
+
+        Parameters
+        ----------
+        container : Container
+        input_keys : sequence of str
+            keys of the container arrays that `func` reads
+        hashables : object
+            any further (hashable) inputs to `func`
+        func : callable
+            called without arguments; returns a mapping of names to arrays
+
+        Returns
+        -------
+        arrays : OrderedDict
+            name -> numpy array; read-only memory maps if loaded from disk
+
+        """
+        if self.disk_cache is None:
+            return OrderedDict(func())
+
+        key = (
+            self.stage_name,
+            self.service_name,
+            np.dtype(FTYPE).str,
+            [hash_obj(container[k].get("host")) for k in input_keys],
+            hashables,
+        )
+        arrays = self.disk_cache.get(key)
+        if arrays is None:
+            arrays = OrderedDict(func())
+            self.disk_cache[key] = arrays
+        else:
+            logging.debug(
+                "Loaded %s for %s from disk cache", list(arrays.keys()), container.name
+            )
+        return arrays
+
     @profile
     def compute(self):
         if len(self.params) == 0 and len(self.output_calc_keys) == 0:
             return
 
         # simplest caching algorithm: don't compute if params didn't change
-        new_param_hash = self.params.values_hash
-        if new_param_hash == self.param_hash:
+        # (comparing versions rather than hashing values)
+        new_params_version = self.params.version
+        if new_params_version == self.params_version:
             logging.trace("cached output")
             return
 
@@ -207,7 +328,7 @@ class PiStage(BaseStage):
 
         self.data.data_specs = self.calc_specs
         self.compute_function()
-        self.param_hash = new_param_hash
+        self.params_version = new_params_version
 
         # convert any outputs if necessary:
         if self.mode[1:] == "EB":
@@ -224,6 +345,18 @@ class PiStage(BaseStage):
         """Implement in services (subclasses of PiStage)"""
         pass
 
+    def compute_batch(self, param_points):
+        """Implement in services (subclasses of PiStage) that can compute
+        their outputs for a batch of param points at once (`param_points`
+        being a sequence of mappings of param names to values), such that
+        subsequent `compute` calls at any of these points are cheap"""
+        pass
+
+    def clear_batch(self):
+        """Implement in services (subclasses of PiStage) that implement
+        `compute_batch`, to release what was computed there"""
+        pass
+
     @profile
     def apply(self):
 
@@ -246,6 +379,8 @@ class PiStage(BaseStage):
         #    self.data.data_specs = self.input_specs
         # else:
         self.data.data_specs = self.output_specs
+        if self.derivative_params and self.propagates_derivatives:
+            self.apply_derivatives_function()
         self.apply_function()
 
         if self.mode == "BBE":
@@ -257,6 +392,52 @@ class PiStage(BaseStage):
         """Implement in services (subclasses of PiStage)"""
         pass
 
+    @property
+    def analytic_derivative_params(self):
+        """tuple of str : names of the stage's params with respect to which it
+        computes derivatives (override in services)"""
+        return ()
+
+    def apply_derivatives_function(self):
+        """Implement in services (subclasses of PiStage) that set
+        `propagates_derivatives`: update the derivatives of the weights with
+        respect to `derivative_params`, with the weights still holding the
+        values prior to `apply_function` (see `scale_weight_derivatives`)"""
+        pass
+
+    def scale_weight_derivatives(self, container, factor, factor_derivatives):
+        """Update the derivatives of the weights in `container` for the
+        weights being multiplied by `factor` in `apply_function`, which must
+        not have happened yet.
+
+        Parameters
+        ----------
+        container : Container
+
+        factor : scalar or array
+            Factor multiplying the weights
+
+        factor_derivatives : mapping
+            Param name -> derivative of `factor` with respect to the param
+            (scalar or array); params missing here are taken to not affect
+            `factor`
+
+        """
+        weights = container["weights"].get("host")
+        for name in self.derivative_params:
+            key = derivative_key("weights", name)
+            exists = container.has_data(key)
+            if name in factor_derivatives:
+                # product rule
+                derivative = weights * factor_derivatives[name]
+                if exists:
+                    derivative = derivative + factor * container[key].get("host")
+                container[key] = np.asarray(derivative, dtype=FTYPE)
+            elif exists:
+                array = container[key]
+                array.get("host")[:] *= factor
+                array.mark_changed("host")
+
     def run(self, inputs=None):
         if not inputs is None:
             raise ValueError("PISA pi requires there not be any inputs.")
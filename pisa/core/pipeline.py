@@ -21,11 +21,12 @@ import traceback
 import numpy as np
 
 from pisa import ureg
+from pisa.core.binning import MultiDimBinning
 from pisa.core.events import Data
 from pisa.core.map import Map, MapSet
 from pisa.core.param import ParamSet
 from pisa.core.stage import Stage
-from pisa.core.pi_stage import PiStage
+from pisa.core.pi_stage import PiStage, derivative_key
 from pisa.core.transform import TransformSet
 from pisa.core.container import ContainerSet
 from pisa.utils.config_parser import PISAConfigParser, parse_pipeline_config
@@ -35,7 +36,7 @@ from pisa.utils.log import logging, set_verbosity
 from pisa.utils.profiler import profile
 
 
-__all__ = ["Pipeline", "test_Pipeline", "parse_args", "main"]
+__all__ = ["Pipeline", "test_Pipeline", "test_incremental", "parse_args", "main"]
 
 __author__ = "J.L. Lanfranchi, P. Eller"
 
@@ -82,6 +83,18 @@ class Pipeline(object):
         `config_parser.parse_pipeline_config()` method to get a config
         OrderedDict. If `OrderedDict`, use directly as pipeline configuration.
 
+    Notes
+    -----
+    If `incremental` is set (via ``incremental = True`` in the ``[pipeline]``
+    section of the config, or by setting the attribute directly), a PISA Pi
+    pipeline only re-runs those stages whose params changed since the last
+    call to `get_outputs` or which read a container key (any of
+    `input_apply_keys`, `input_calc_keys`, `output_apply_keys` or a binning
+    dimension of the stage's specs) written by a stage that was re-run. To make
+    this possible, the keys in `output_apply_keys` are snapshotted after each
+    stage runs, and restored from the last upstream writer before a stage is
+    re-run. This relies on the stages declaring all keys they read and write.
+
     """
 
     def __init__(self, config):
@@ -99,6 +112,7 @@ class Pipeline(object):
 
         self._stages = []
         self._detector_name = config.pop('detector_name', None)
+        self.incremental = config.pop('incremental', False)
         self._config = config
         self._init_stages()
         self._source_code_hash = None
@@ -292,6 +306,16 @@ class Pipeline(object):
 
         self._stages = stages
 
+        # state for incremental (Pi) evaluation, see `_run_incremental`
+        self._dependencies = None
+        self._run_counts = [0] * len(stages)
+        self._applied_states = {}
+        self._snapshots = {}
+
+        # params w.r.t. which derivatives of the outputs are propagated, see
+        # `set_derivative_params`
+        self._derivative_params = ()
+
     # TODO: handle other container(s)
     @profile
     def get_outputs(self, inputs=None, idx=None, return_intermediate=False):
@@ -333,6 +357,20 @@ class Pipeline(object):
         if len(self) == 0:
             raise ValueError("No stages in the pipeline to run")
 
+        if self._derivative_params:
+            self._clear_weight_derivatives()
+
+        if (
+            self.incremental
+            and not self._derivative_params
+            and self.pisa_version == "pi"
+            and inputs is None
+            and not return_intermediate
+        ):
+            stages = self.stages[:idx]
+            self._run_incremental(stages)
+            return stages[-1].get_outputs()
+
         for stage in self.stages[:idx]:
             name = "{}.{}".format(stage.stage_name, stage.service_name)
             logging.debug(
@@ -366,6 +404,338 @@ class Pipeline(object):
 
         return outputs
 
+    def compute_batch(self, param_points):
+        """Let stages precompute what they can for a batch of param points
+        at once (see e.g. `pi_prob3.compute_batch`), such that subsequent
+        evaluations at any of these points are cheaper.
+
+        Parameters
+        ----------
+        param_points : sequence of mappings
+            Each maps param names to values (quantities)
+
+        """
+        if self.pisa_version != "pi":
+            return
+        param_points = [OrderedDict(point) for point in param_points]
+        for stage in self:
+            names = set(stage.params.names)
+            stage.compute_batch(
+                [
+                    OrderedDict((n, v) for n, v in point.items() if n in names)
+                    for point in param_points
+                ]
+            )
+
+    def set_derivative_params(self, names):
+        """Propagate derivatives of the outputs w.r.t. the params `names`
+        through the stages alongside the outputs themselves, as far as
+        possible (see `PiStage`).
+
+        This is possible for a param if all stages having the param
+        differentiate w.r.t. it analytically and all stages from the first of
+        these onwards that modify the weights propagate derivatives, and if
+        the pipeline produces binned outputs. Incremental evaluation is
+        disabled while derivatives are propagated.
+
+        Parameters
+        ----------
+        names : sequence of str
+            Pass an empty sequence to stop propagating derivatives.
+
+        Returns
+        -------
+        derivative_params : tuple of str
+            Those of `names` for which derivatives are propagated; the outputs'
+            derivatives w.r.t. any other params of the pipeline must be found
+            otherwise (e.g. by finite differences)
+
+        """
+        derivative_params = []
+        if (
+            self.pisa_version == "pi"
+            and self.stages[-1].output_mode == "binned"
+        ):
+            for name in names:
+                owners = [
+                    num for num, stage in enumerate(self)
+                    if name in stage.params.names
+                ]
+                if not owners:
+                    continue
+                if not all(
+                    name in self[num].analytic_derivative_params
+                    for num in owners
+                ):
+                    continue
+                if all(
+                    stage.propagates_derivatives
+                    for num, stage in enumerate(self)
+                    if num in owners
+                    or (num > owners[0] and "weights" in stage.output_apply_keys)
+                ):
+                    derivative_params.append(name)
+
+        self._derivative_params = tuple(derivative_params)
+        if self.pisa_version == "pi":
+            for stage in self:
+                stage.derivative_params = self._derivative_params
+            if not self._derivative_params:
+                self._clear_weight_derivatives()
+            # the incremental state does not cover the derivatives
+            self._snapshots = {}
+        return self._derivative_params
+
+    def _clear_weight_derivatives(self):
+        """Remove the derivatives of the weights from all containers, such
+        that they are re-created from scratch by the next run"""
+        data = self.stages[0].data
+        if data is None:
+            return
+        keys = set(
+            derivative_key("weights", name)
+            for stage in self
+            for name in stage.params.names
+        )
+        for container in data.containers:
+            for key in keys:
+                container.array_data.pop(key, None)
+                container.binned_data.pop(key, None)
+
+    def get_output_derivatives(self, names=None):
+        """Derivatives of the outputs produced by the last call to
+        `get_outputs` w.r.t. the params set via `set_derivative_params`.
+
+        Parameters
+        ----------
+        names : None or sequence of str
+            Params to get the derivatives for; defaults to all params for which
+            derivatives are propagated. Derivatives w.r.t. params that are not
+            params of the pipeline are zero.
+
+        Returns
+        -------
+        derivatives : OrderedDict
+            Param name -> MapSet with one map per output map, holding the
+            derivatives of its bin contents w.r.t. the magnitude (in its own
+            units) of the param
+
+        """
+        if names is None:
+            names = self._derivative_params
+        for name in names:
+            if name in self.params.names and name not in self._derivative_params:
+                raise ValueError(
+                    "Derivatives w.r.t. param %s are not propagated" % name
+                )
+        stage = self.stages[-1]
+        stage.data.data_specs = stage.output_specs
+        derivatives = OrderedDict()
+        for name in names:
+            key = derivative_key("weights", name)
+            maps = []
+            for container in stage.data:
+                if container.has_data(key):
+                    maps.append(container.get_map(key))
+                else:
+                    # not affected by the param
+                    maps.append(
+                        Map(
+                            name=container.name,
+                            hist=np.zeros(stage.output_specs.shape),
+                            binning=stage.output_specs,
+                        )
+                    )
+            derivatives[name] = MapSet(name=stage.data.name, maps=maps)
+        return derivatives
+
+    def clear_batch(self):
+        """Discard anything precomputed via `compute_batch`"""
+        if self.pisa_version != "pi":
+            return
+        for stage in self:
+            stage.clear_batch()
+
+    def get_outputs_batch(self, param_points, **kwargs):
+        """Compute the pipeline's outputs for each of a batch of param points.
+
+        Param values are restored to what they were before the call once all
+        points are done.
+
+        Parameters
+        ----------
+        param_points : sequence of mappings
+            Each maps param names to values (quantities)
+
+        **kwargs
+            Passed on to `get_outputs`
+
+        Returns
+        -------
+        outputs : list
+            One output of `get_outputs` per point in `param_points`
+
+        """
+        params = self.params
+        original_values = OrderedDict(
+            (name, params[name].value)
+            for point in param_points
+            for name in point
+            if name in params.names
+        )
+        self.compute_batch(param_points)
+        try:
+            outputs = []
+            for point in param_points:
+                for name, value in point.items():
+                    if name in params.names:
+                        params[name].value = value
+                self.update_params(params)
+                outputs.append(self.get_outputs(**kwargs))
+        finally:
+            for name, value in original_values.items():
+                params[name].value = value
+            self.update_params(params)
+            self.clear_batch()
+        return outputs
+
+    @staticmethod
+    def _stage_read_keys(stage):
+        """Set of container keys a Pi `stage` (potentially) reads"""
+        keys = set(stage.input_apply_keys)
+        keys.update(stage.input_calc_keys)
+        # writes are in-place modifications, hence count as reads, too
+        keys.update(stage.output_apply_keys)
+        # binning dimensions (e.g. `pid`) are read when translating
+        for specs in (stage.input_specs, stage.calc_specs, stage.output_specs):
+            if isinstance(specs, MultiDimBinning):
+                keys.update(specs.names)
+        return keys
+
+    def _find_dependencies(self):
+        """For each stage, find the upstream stages it depends on.
+
+        Returns
+        -------
+        dependencies : list of tuples
+            One `(writers, calc_writers, restore_sources)` tuple per stage,
+            where `writers` are the indices of the closest upstream writers of
+            any key the stage reads, `calc_writers` those of keys used in
+            `compute`, and `restore_sources` maps each key in
+            `output_apply_keys` to the index of the closest upstream stage
+            writing that key in the same representation (i.e., the snapshot
+            holding the key's value as it was before the stage ran).
+
+        """
+        dependencies = []
+        for stage_num, stage in enumerate(self):
+            last_writers = {}
+            for prev_num in range(stage_num):
+                for key in self[prev_num].output_apply_keys:
+                    last_writers[key] = prev_num
+
+            writers = sorted(
+                set(
+                    last_writers[key]
+                    for key in self._stage_read_keys(stage)
+                    if key in last_writers
+                )
+            )
+            calc_writers = sorted(
+                set(
+                    last_writers[key]
+                    for key in stage.input_calc_keys
+                    if key in last_writers
+                )
+            )
+            restore_sources = {}
+            for key in stage.output_apply_keys:
+                if key not in last_writers:
+                    continue
+                prev_num = last_writers[key]
+                if _same_specs(self[prev_num].output_specs, stage.output_specs):
+                    restore_sources[key] = prev_num
+
+            dependencies.append((writers, calc_writers, restore_sources))
+        return dependencies
+
+    @staticmethod
+    def _take_snapshot(stage):
+        """Copy the `output_apply_keys` of all containers after `stage` ran"""
+        snapshot = {}
+        stage.data.data_specs = stage.output_specs
+        for container in stage.data:
+            for key in stage.output_apply_keys:
+                snapshot[(container.name, key)] = np.copy(container[key].get("host"))
+        return snapshot
+
+    def _restore_snapshot(self, stage, restore_sources):
+        """Reset the keys `stage` writes to their values prior to the stage"""
+        if len(restore_sources) == 0:
+            return
+        stage.data.data_specs = stage.output_specs
+        for container in stage.data:
+            for key, source_num in restore_sources.items():
+                array = container[key]
+                np.copyto(
+                    array.get("host"), self._snapshots[source_num][(container.name, key)]
+                )
+                array.mark_changed("host")
+
+    @profile
+    def _run_incremental(self, stages):
+        """Run PISA Pi `stages`, skipping those whose params are unchanged
+        since their last run and whose upstream inputs were not re-computed
+        in the meantime."""
+        if self._dependencies is None:
+            self._dependencies = self._find_dependencies()
+
+        for stage_num, stage in enumerate(stages):
+            writers, calc_writers, restore_sources = self._dependencies[stage_num]
+            params_version = stage.params.version
+            # "version" of the inputs is given by how often the writers ran
+            inputs_state = tuple(self._run_counts[num] for num in writers)
+
+            if stage_num in self._snapshots:
+                last_version, last_inputs_state = self._applied_states[stage_num]
+                if (params_version == last_version
+                        and inputs_state == last_inputs_state):
+                    logging.trace(
+                        "skipping unchanged stage %s.%s",
+                        stage.stage_name,
+                        stage.service_name,
+                    )
+                    continue
+
+                changed = [
+                    num
+                    for num, count, last_count in zip(
+                        writers, inputs_state, last_inputs_state
+                    )
+                    if count != last_count
+                ]
+                if set(changed) & set(calc_writers):
+                    # invalidate the stage's own caching of `compute`
+                    stage.params_version = None
+                self._restore_snapshot(stage, restore_sources)
+
+            logging.trace("running stage %s.%s", stage.stage_name, stage.service_name)
+            try:
+                stage.run()
+            except:
+                # state is undefined now, so start from scratch next time
+                self._snapshots = {}
+                logging.error(
+                    "Error occurred computing outputs in stage %s /" " service %s ...",
+                    stage.stage_name,
+                    stage.service_name,
+                )
+                raise
+
+            self._run_counts[stage_num] += 1
+            self._applied_states[stage_num] = (params_version, inputs_state)
+            self._snapshots[stage_num] = self._take_snapshot(stage)
+
     def update_params(self, params):
         """Update params for the pipeline.
 
@@ -464,6 +834,15 @@ class Pipeline(object):
         return self.hash
 
 
+def _same_specs(specs_a, specs_b):
+    """Whether two Pi stage specs (binning, 'events' or None) are identical"""
+    if isinstance(specs_a, MultiDimBinning) and isinstance(specs_b, MultiDimBinning):
+        return specs_a is specs_b or specs_a == specs_b
+    return specs_a == specs_b and not (
+        isinstance(specs_a, MultiDimBinning) or isinstance(specs_b, MultiDimBinning)
+    )
+
+
 def test_Pipeline():
     """Unit tests for Pipeline class"""
     # pylint: disable=line-too-long
@@ -542,6 +921,34 @@ def test_Pipeline():
         current_mat = new_mat
 
 
+def test_incremental():
+    """Incremental evaluation of a Pi pipeline must give identical outputs to
+    a full evaluation"""
+    config = "settings/pipeline/example.cfg"
+    full = Pipeline(config)
+    incremental = Pipeline(config)
+    incremental.incremental = True
+
+    updates = [
+        {},
+        {"aeff_scale": 1.2 * ureg.dimensionless},
+        {"theta23": 47 * ureg.deg},
+        {},
+        {"delta_index": 0.05 * ureg.dimensionless,
+         "aeff_scale": 0.9 * ureg.dimensionless},
+    ]
+    for update in updates:
+        for pipeline in (full, incremental):
+            for name, value in update.items():
+                pipeline.params[name].value = value
+        full_outputs = full.get_outputs()
+        incremental_outputs = incremental.get_outputs()
+        for full_map, incr_map in zip(full_outputs, incremental_outputs):
+            assert np.array_equal(full_map.nominal_values, incr_map.nominal_values)
+
+    logging.info("<< PASS : test_incremental >>")
+
+
 def parse_args():
     """Parse command line arguments if `pipeline.py` is called as a script."""
     parser = ArgumentParser(
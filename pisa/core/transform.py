@@ -7,7 +7,7 @@ defining and applying linear transforms.
 
 from __future__ import absolute_import, division
 
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 from collections import OrderedDict
 from copy import deepcopy
 from functools import wraps
@@ -19,18 +19,21 @@ import sys
 import tempfile
 
 import numpy as np
+from scipy import sparse
 from uncertainties import unumpy as unp
 
 from pisa import ureg, HASH_SIGFIGS
 from pisa.core.binning import MultiDimBinning
 from pisa.core.map import Map, MapSet, rebin
+from pisa.utils.cache import MemoryCache
 from pisa.utils.comparisons import normQuant, recursiveEquality
 from pisa.utils.hash import hash_obj
 from pisa.utils import jsons
 from pisa.utils.log import logging, set_verbosity
 
 
-__all__ = ['TransformSet', 'Transform', 'BinnedTensorTransform']
+__all__ = ['TransformSet', 'Transform', 'BinnedTensorTransform',
+           'SparseBinnedTensorTransform', 'to_sparse_kernel']
 
 __author__ = 'J.L. Lanfranchi, P. Eller'
 
@@ -83,6 +86,9 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
 
 # TODO: Add Sequence capabilities to TransformSet (e.g. it'd be nice to have at
 # least append, extend, ...)
+COMBINED_INPUTS_CACHE_DEPTH = 100
+"""Number of summed inputs kept by `TransformSet.apply`"""
+
 TRANS_SET_SLOTS = ('name', 'hash', 'transforms', '__iter__',
                    'nonvolatile_hash', 'input_names', 'num_inputs',
                    'output_names', 'apply', '__getattribute__',
@@ -96,9 +102,25 @@ class TransformSet(object):
     transforms
     name
 
+    Class attributes
+    ----------------
+    group_shared_kernels : bool
+        Whether `apply` sums the inputs of transforms that apply the same
+        linear kernel to produce the same output before applying that kernel
+        once (see `shared_kernel_groups`), rather than applying the kernel to
+        each input and then summing the results.
+
     """
+    group_shared_kernels = True
+
+    _combined_inputs_cache = MemoryCache(max_depth=COMBINED_INPUTS_CACHE_DEPTH)
+    """Sums of input maps for groups of transforms sharing a kernel, keyed by
+    the hash of the input map set and the names of the summed maps; shared by
+    all transform sets, as the inputs are independent of the transforms"""
+
     def __init__(self, transforms, name=None, hash=None): # pylint: disable=redefined-builtin
         self._transforms = transforms
+        self._shared_kernel_groups = None
         self.name = name
         self.hash = hash
 
@@ -264,9 +286,62 @@ class TransformSet(object):
                and output_name == transform.output_name:
                 return transform
 
+    @property
+    def shared_kernel_groups(self):
+        """list of lists of Transform : The transforms, grouped such that all
+        transforms in a group apply the same linear kernel to their (summed)
+        inputs and produce the same output (i.e., have the same non-None
+        `shared_kernel_key`). Groups are ordered by their first member."""
+        if self._shared_kernel_groups is None:
+            groups = []
+            keyed_groups = {}
+            for xform in self:
+                key = xform.shared_kernel_key
+                if key is None:
+                    groups.append([xform])
+                elif key in keyed_groups:
+                    keyed_groups[key].append(xform)
+                else:
+                    keyed_groups[key] = [xform]
+                    groups.append(keyed_groups[key])
+            self._shared_kernel_groups = groups
+        return self._shared_kernel_groups
+
+    def _combined_input(self, group, inputs):
+        """Sum of the inputs to all transforms in `group`, or None if these
+        cannot be summed (i.e., do not share the same binning)"""
+        names = tuple(name for xform in group for name in xform.input_names)
+        cache_key = None
+        if inputs.hash is not None:
+            cache_key = (inputs.hash, names)
+            if cache_key in self._combined_inputs_cache:
+                return self._combined_inputs_cache[cache_key]
+
+        for xform in group:
+            xform.validate_input(inputs)
+        maps = [inputs[name] for name in names]
+        binning = maps[0].binning
+        if any(m.binning != binning for m in maps[1:]):
+            return None
+        nominal = np.sum([m.nominal_values for m in maps], axis=0)
+        error_hist = None
+        if any(m.has_errors for m in maps):
+            error_hist = np.sqrt(np.sum([m.variances for m in maps], axis=0))
+        combined = Map(name='+'.join(names), hist=nominal,
+                       error_hist=error_hist, binning=binning)
+
+        if cache_key is not None:
+            self._combined_inputs_cache[cache_key] = combined
+        return combined
+
     def apply(self, inputs):
         """Apply each transform to `inputs`; return computed outputs.
 
+        Transforms sharing a linear kernel (without errors) and output (see
+        `shared_kernel_groups`) are applied once to the sum of their inputs
+        (unless `group_shared_kernels` is False), which for N inputs saves a
+        factor of N in the multiplications needed.
+
         Parameters
         -----------
         inputs : sequence of objects
@@ -279,18 +354,23 @@ class TransformSet(object):
         output_names = []
         outputs = []
 
+        if self.group_shared_kernels:
+            groups = self.shared_kernel_groups
+        else:
+            groups = [[xform] for xform in self]
+
         # If any outputs have the same name, add them together to form a single
         # output for that name
-        for xform in self:
-            output = xform.apply(inputs)
-            name = output.name
-            try:
-                idx = output_names.index(name)
-                outputs[idx] = outputs[idx] + output
-                outputs[idx].name = name
-            except ValueError:
-                outputs.append(output)
-                output_names.append(name)
+        for group in groups:
+            combined = None
+            if len(group) > 1:
+                combined = self._combined_input(group, inputs)
+            if combined is None:
+                group_outputs = [xform.apply(inputs) for xform in group]
+            else:
+                group_outputs = [group[0].apply_to_combined(combined)]
+            for output in group_outputs:
+                self._add_output(output, output_names, outputs)
 
         # Automatically attach a sensible hash (this may be overwritten, but
         # the below should be a reasonable hash in most cases)
@@ -302,6 +382,19 @@ class TransformSet(object):
         # TODO: what to set for map set's name, tex, etc. ?
         return MapSet(maps=outputs, hash=hash_)
 
+    @staticmethod
+    def _add_output(output, output_names, outputs):
+        """Append `output` to `outputs` or add it to the existing output of
+        the same name"""
+        name = output.name
+        try:
+            idx = output_names.index(name)
+            outputs[idx] = outputs[idx] + output
+            outputs[idx].name = name
+        except ValueError:
+            outputs.append(output)
+            output_names.append(name)
+
     def __getattr__(self, attr):
         if attr in TRANS_SET_SLOTS:
             return super().__getattribute__(attr)
@@ -508,6 +601,30 @@ class Transform(object):
         """Override this method in subclasses"""
         raise NotImplementedError('Override this method in subclasses')
 
+    @property
+    def shared_kernel_key(self):
+        """None or hashable : Transforms with equal keys (other than None)
+        apply the same linear kernel to the sum of their inputs and produce
+        the same output, such that the kernel can be applied once to the sum
+        of all of their inputs instead (see `apply_to_combined`). None (the
+        default) if the transform does not allow for this."""
+        return None
+
+    def apply_to_combined(self, combined):
+        """Apply the transform to a single map holding the sum of the inputs
+        of all transforms sharing the same `shared_kernel_key`.
+
+        Parameters
+        ----------
+        combined : Map
+
+        Returns
+        -------
+        output : Map
+
+        """
+        raise NotImplementedError('Override this method in subclasses')
+
     def validate_transform(self, xform):
         """Override this method in subclasses"""
         raise NotImplementedError('Override this method in subclasses')
@@ -654,6 +771,7 @@ class BinnedTensorTransform(Transform):
             tex=tex, hash=hash, error_method=error_method
         )
         self._xform_array = None
+        self._kernel_hash = None
         self.xform_array = xform_array
         self.sum_inputs = sum_inputs
         if error_array is not None:
@@ -688,6 +806,7 @@ class BinnedTensorTransform(Transform):
             `self.xform_array` a bare numpy array.
 
         """
+        self._kernel_hash = None
         if error_array is None:
             super().__setattr__(
                 '_xform_array', self.nominal_values
@@ -708,6 +827,30 @@ class BinnedTensorTransform(Transform):
     def xform_array(self, x):
         self.validate_transform(self.input_binning, self.output_binning, x)
         self._xform_array = np.ascontiguousarray(x)
+        self._kernel_hash = None
+
+    @property
+    def kernel_hash(self):
+        """int : Hash of the transform kernel (values, errors, binnings and
+        error method); computed once"""
+        if self._kernel_hash is None:
+            self._kernel_hash = hash_obj((
+                self.nominal_values, self.std_devs, self.input_binning.hash,
+                self.output_binning.hash, self.error_method
+            ))
+        return self._kernel_hash
+
+    @property
+    def shared_kernel_key(self):
+        """None or hashable : See `Transform.shared_kernel_key`; None for
+        transforms stacking multiple inputs and for kernels with errors (as
+        the errors of the kernel are correlated between the transforms, the
+        output errors would differ from those of applying them separately)"""
+        if self.num_inputs > 1 and not self.sum_inputs:
+            return None
+        if self.xform_array.dtype == np.object_:
+            return None
+        return (self.__class__.__name__, self.kernel_hash, self.output_name)
 
     @property
     def nominal_values(self):
@@ -851,40 +994,14 @@ class BinnedTensorTransform(Transform):
         """
         self.validate_input(inputs)
 
-        # TODO: In the multiple inputs / single output case and depending upon
-        # the dimensions of the transform, for efficiency purposes we should
-        # make sure that an operation is not carried out like
-        #
-        #   (input0 [*] transform) + (input1 [*] transform) = output
-        #
-        # but instead is performed more efficiently as
+        # Note that inputs to several transforms sharing the same kernel are
+        # summed *before* applying the kernel, i.e.
         #
         #   (input0 + input1) [*] transform = output
         #
-        # where [*] is some linear operation, like element-by-element
-        # multiplication, a dot product, etc.
-        #
-        # E.g., for a 1D dot product (dimensionality-reducing linear operation)
-        # with M_in inputs and N_el elements in each
-        # vector, for the first (less efficient) formulation, there are
-        #
-        #   (N_el-1)*M_in + (M_in-1) = (M_in*N_el - 1) adds
-        #
-        # and
-        #
-        #   (N_el*M_in) multiplies
-        #
-        # while for the second (more efficient) formulation, there are
-        #
-        #   (M_in-1)*N_el + (N_el-1) = (M_in*N_el - 1) adds
-        #
-        # and
-        #
-        #   (N_el) multiplies
-        #
-        # so the benefit is a reduction of the number of multiplies necessary
-        # by a factor of the number of inputs being "combined" (the number of
-        # adds stays the same).
+        # rather than (input0 [*] transform) + (input1 [*] transform), by
+        # `TransformSet.apply` (see `shared_kernel_key`); this reduces the
+        # number of multiplies by a factor of the number of inputs combined.
 
         # TODO: make sure all of these operations are compatible with
         # uncertainties module!
@@ -907,6 +1024,19 @@ class BinnedTensorTransform(Transform):
                            for n in names]
             input_array = np.stack(input_array, axis=0)
 
+        return Map(name=self.output_name,
+                   hist=self._contract(input_array),
+                   binning=self.output_binning)
+
+    def apply_to_combined(self, combined):
+        input_array = combined.rebin(self.input_binning).hist
+        return Map(name=self.output_name,
+                   hist=self._contract(input_array),
+                   binning=self.output_binning)
+
+    def _contract(self, input_array):
+        """Apply the kernel to the (rebinned, and summed or stacked) input
+        array"""
         # TODO: is logic kosher here?
 
         # Transform same shape: element-by-element multiplication
@@ -963,13 +1093,369 @@ class BinnedTensorTransform(Transform):
                   self.xform_array.shape)
             )
 
-        output = Map(name=self.output_name,
-                     hist=output,
-                     binning=self.output_binning)
-
         return output
 
 
+def to_sparse_kernel(xform_array, output_binning, threshold=0):
+    """Convert a dense (N_in + N_out)-dimensional kernel, as used by
+    `BinnedTensorTransform`, to the CSR matrices used by
+    `SparseBinnedTensorTransform`.
+
+    Parameters
+    ----------
+    xform_array : numpy.ndarray, possibly `uncertainties.unumpy` object array
+        Kernel whose trailing dimensions are those of `output_binning`
+
+    output_binning : MultiDimBinning
+
+    threshold : float >= 0
+        Kernel entries with absolute (nominal) value not exceeding this are
+        dropped
+
+    Returns
+    -------
+    kernel : scipy.sparse.csr_matrix
+        Shape (number of input bins, number of output bins)
+
+    kernel_errors : None or scipy.sparse.csr_matrix
+        Standard deviations of the retained kernel entries (same sparsity
+        structure as `kernel`), or None if `xform_array` has no errors
+
+    """
+    assert threshold >= 0
+    xform_array = np.asarray(xform_array)
+    n_out = MultiDimBinning(output_binning).size
+    if xform_array.size % n_out != 0:
+        raise ValueError(
+            'Kernel of shape %s does not end in output binning of shape %s'
+            % (xform_array.shape, MultiDimBinning(output_binning).shape)
+        )
+    if xform_array.dtype == np.object_:
+        nominal = unp.nominal_values(xform_array).reshape(-1, n_out)
+        std_devs = unp.std_devs(xform_array).reshape(-1, n_out)
+    else:
+        nominal = xform_array.reshape(-1, n_out)
+        std_devs = None
+
+    rows, cols = np.nonzero(np.abs(nominal) > threshold)
+    kernel = sparse.csr_matrix(
+        (nominal[rows, cols].astype(np.float64), (rows, cols)),
+        shape=nominal.shape
+    )
+    kernel_errors = None
+    if std_devs is not None:
+        kernel_errors = sparse.csr_matrix(
+            (std_devs[rows, cols].astype(np.float64), (rows, cols)),
+            shape=nominal.shape
+        )
+    return kernel, kernel_errors
+
+
+def _to_csr(matrix):
+    """Interpret `matrix` (scipy sparse matrix or Mapping as produced by
+    `SparseBinnedTensorTransform.serializable_state`) as a CSR matrix"""
+    if isinstance(matrix, Mapping):
+        return sparse.csr_matrix(
+            (np.asarray(matrix['data'], dtype=np.float64),
+             np.asarray(matrix['indices']),
+             np.asarray(matrix['indptr'])),
+            shape=tuple(matrix['shape'])
+        )
+    return sparse.csr_matrix(matrix, dtype=np.float64)
+
+
+def _csr_state(matrix):
+    """Serializable state of a CSR matrix (see `_to_csr`)"""
+    state = OrderedDict()
+    state['data'] = matrix.data
+    state['indices'] = matrix.indices
+    state['indptr'] = matrix.indptr
+    state['shape'] = list(matrix.shape)
+    return state
+
+
+class SparseBinnedTensorTransform(Transform):
+    """
+    Smearing kernel (see `BinnedTensorTransform`) stored as a sparse matrix
+    over the flattened input and output bins, such that applying it costs
+    O(number of non-zero kernel entries) rather than O(N_in * N_out).
+
+    The contraction is carried out on plain floats; if the input maps or the
+    kernel have errors, the output variances are propagated separately (to
+    first order, treating the input bins and kernel entries as independent).
+
+
+    Parameters
+    ----------
+    input_names : string or sequence thereof
+        Names of maps expected in the input MapSet.
+
+    output_name : string
+        Name of Map that will be generated.
+
+    input_binning : MultiDimBinning
+        Binning required for inputs maps.
+
+    output_binning : MultiDimBinning
+        Binning used for generated output maps.
+
+    xform_array : numpy ndarray, scipy sparse matrix, or Mapping
+        Either a dense kernel as accepted by `BinnedTensorTransform` (which is
+        converted via `to_sparse_kernel`), a sparse matrix of shape (number of
+        input bins, number of output bins), or the CSR state of such a matrix
+        (as found in `serializable_state`).
+
+    sum_inputs : bool
+        If true, add inputs together if multiple are specified. Otherwise,
+        stack input maps, such that the input bins of all inputs form the rows
+        of the kernel matrix (in the order of `input_names`).
+
+    error_array : None, numpy ndarray, scipy sparse matrix, or Mapping
+        Standard deviations of the kernel entries, in the same form as
+        `xform_array`. Only entries retained in `xform_array` are used.
+
+    threshold : float >= 0
+        Kernel entries with absolute value not exceeding this are dropped when
+        converting a dense `xform_array`.
+
+    tex : string
+        TeX label for e.g. automatic plot labelling.
+
+    hash : immutable object (usually integer)
+        A hash value the user can attach
+
+    error_method : None, bool, or string
+        Define the method for error propaation on unumpy arrays
+
+    """
+    _slots = tuple(list(Transform._slots) +
+                   ['_input_binning', '_output_binning', '_xform_array',
+                    '_error_array'])
+
+    _state_attrs = tuple(list(Transform._state_attrs) +
+                         ['input_binning', 'output_binning', 'xform_array',
+                          'error_array'])
+
+    def __init__(self, input_names, output_name, input_binning, output_binning,
+                 xform_array, sum_inputs=False, error_array=None, threshold=0,
+                 tex=None, error_method=None, hash=None): # pylint: disable=redefined-builtin
+        super().__init__(
+            input_names=input_names, output_name=output_name,
+            input_binning=input_binning, output_binning=output_binning,
+            tex=tex, hash=hash, error_method=error_method
+        )
+        if isinstance(xform_array, (sparse.spmatrix, Mapping)):
+            kernel = _to_csr(xform_array)
+            kernel_errors = None
+        else:
+            kernel, kernel_errors = to_sparse_kernel(
+                xform_array, output_binning=self.output_binning,
+                threshold=threshold
+            )
+        if error_array is not None:
+            if isinstance(error_array, (sparse.spmatrix, Mapping)):
+                error_array = _to_csr(error_array)
+            else:
+                error_array = sparse.csr_matrix(
+                    np.asarray(error_array, dtype=np.float64).reshape(
+                        kernel.shape
+                    )
+                )
+            # Restrict to the entries of the kernel
+            pattern = kernel.copy()
+            pattern.data = np.ones_like(pattern.data)
+            kernel_errors = _to_csr(error_array.multiply(pattern))
+        self.validate_transform(self.input_binning, self.output_binning,
+                                kernel)
+        self._xform_array = kernel
+        self._error_array = kernel_errors
+        self._kernel_hash = None
+        self.sum_inputs = sum_inputs
+
+    @property
+    def serializable_state(self):
+        """OrderedDict : State of the object in a format that is serializable"""
+        state = super().serializable_state
+        state['xform_array'] = _csr_state(self.xform_array)
+        state['error_array'] = (None if self.error_array is None
+                                else _csr_state(self.error_array))
+        state['sum_inputs'] = self.sum_inputs
+        return state
+
+    @property
+    def hashable_state(self):
+        """OrderedDict : State of the object that can be used for hashing"""
+        state = super().hashable_state
+        kernel = self.xform_array.copy()
+        kernel.sum_duplicates()
+        kernel.sort_indices()
+        state['xform_array'] = (
+            normQuant(kernel.data, sigfigs=HASH_SIGFIGS), kernel.indices,
+            kernel.indptr, kernel.shape
+        )
+        if self.error_array is None:
+            state['error_array'] = None
+        else:
+            state['error_array'] = normQuant(
+                np.asarray(self.error_array[kernel.nonzero()]).ravel(),
+                sigfigs=HASH_SIGFIGS
+            )
+        state['sum_inputs'] = self.sum_inputs
+        return state
+
+    @property
+    def xform_array(self):
+        """scipy.sparse.csr_matrix : Kernel, of shape (number of input bins,
+        number of output bins)"""
+        return self._xform_array
+
+    @property
+    def error_array(self):
+        """None or scipy.sparse.csr_matrix : Standard deviations of the kernel
+        entries"""
+        return self._error_array
+
+    @property
+    def nnz(self):
+        """int : Number of stored kernel entries"""
+        return self.xform_array.nnz
+
+    @property
+    def kernel_hash(self):
+        """int : Hash of the transform kernel (values, errors, binnings and
+        error method); computed once"""
+        if self._kernel_hash is None:
+            state = self.hashable_state
+            self._kernel_hash = hash_obj((
+                state['xform_array'], state['error_array'],
+                self.input_binning.hash, self.output_binning.hash,
+                self.error_method
+            ))
+        return self._kernel_hash
+
+    @property
+    def shared_kernel_key(self):
+        """None or hashable : See `Transform.shared_kernel_key`; None for
+        transforms stacking multiple inputs and for kernels with errors (see
+        `BinnedTensorTransform.shared_kernel_key`)"""
+        if self.num_inputs > 1 and not self.sum_inputs:
+            return None
+        if self.error_array is not None:
+            return None
+        return (self.__class__.__name__, self.kernel_hash, self.output_name)
+
+    def __eq__(self, other):
+        if not isinstance(other, SparseBinnedTensorTransform):
+            return False
+        return recursiveEquality(self.hashable_state, other.hashable_state)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def validate_transform(self, input_binning, output_binning, xform_array): # pylint: disable=arguments-differ
+        """Check that the kernel matrix maps a whole number of input binnings
+        onto `output_binning`"""
+        num_in, num_out = xform_array.shape
+        if num_out != output_binning.size or num_in % input_binning.size:
+            raise ValueError(
+                'Kernel matrix of shape %s incompatible with input binning of'
+                ' shape %s and output binning of shape %s'
+                % (xform_array.shape, input_binning.shape,
+                   output_binning.shape)
+            )
+
+    def validate_input(self, inputs):
+        if inputs is None:
+            raise ValueError('No inputs provided.')
+
+        for input_name in self.input_names:
+            assert input_name in inputs, \
+                    'Input "%s" expected; got: %s.' \
+                    % (input_name, inputs.names)
+
+    def _input_values(self, inputs):
+        """Flattened nominal values and variances (None if no input has
+        errors) of the (rebinned, summed or stacked) inputs"""
+        maps = [inputs[name] for name in self.input_names]
+        if self.num_inputs > 1 and self.sum_inputs:
+            # Sum inputs, *then* rebin (if necessary)
+            nominal = np.sum([m.nominal_values for m in maps], axis=0)
+            nominal = rebin(nominal, orig_binning=maps[0].binning,
+                            new_binning=self.input_binning)
+            variances = None
+            if any(m.has_errors for m in maps):
+                variances = np.sum([m.variances for m in maps], axis=0)
+                variances = rebin(variances, orig_binning=maps[0].binning,
+                                  new_binning=self.input_binning)
+            return nominal.ravel(), (None if variances is None
+                                     else variances.ravel())
+
+        # Rebin (if necessary) then stack
+        maps = [m.rebin(self.input_binning) for m in maps]
+        nominal = np.concatenate([m.nominal_values.ravel() for m in maps])
+        variances = None
+        if any(m.has_errors for m in maps):
+            variances = np.concatenate([m.variances.ravel() for m in maps])
+        return nominal, variances
+
+    def _apply(self, inputs):
+        """Apply the kernel to input maps to compute the output map.
+
+        Parameters
+        ----------
+        inputs : MapSet
+            Container class that must contain (at least) the maps to be
+            transformed.
+
+        Returns
+        -------
+        output : Map
+            Result of applying the transform to the input map(s).
+
+        """
+        self.validate_input(inputs)
+        return self._contract(*self._input_values(inputs))
+
+    def apply_to_combined(self, combined):
+        combined = combined.rebin(self.input_binning)
+        return self._contract(
+            combined.nominal_values.ravel(),
+            combined.variances.ravel() if combined.has_errors else None
+        )
+
+    def _contract(self, nominal, variances):
+        """Apply the kernel to the flattened input values and variances
+        (None for no errors) to obtain the output map"""
+        if nominal.size != self.xform_array.shape[0]:
+            raise ValueError(
+                'Input(s) "%s" have %d bins but transform expects %d.'
+                % (', '.join(self.input_names), nominal.size,
+                   self.xform_array.shape[0])
+            )
+
+        # Transpose of CSR is CSC; either way the product is O(nnz)
+        kernel_t = self.xform_array.T
+        output = kernel_t.dot(nominal.astype(np.float64, copy=False))
+
+        error_hist = None
+        if variances is not None or self.error_array is not None:
+            output_variances = np.zeros_like(output)
+            if variances is not None:
+                output_variances += kernel_t.power(2).dot(variances)
+            if self.error_array is not None:
+                output_variances += (
+                    self.error_array.T.power(2).dot(np.square(nominal))
+                )
+            error_hist = np.sqrt(output_variances).reshape(
+                self.output_binning.shape
+            )
+
+        return Map(name=self.output_name,
+                   hist=output.reshape(self.output_binning.shape),
+                   error_hist=error_hist,
+                   binning=self.output_binning)
+
+
 def test_BinnedTensorTransform():
     """Unit tests for BinnedTensorTransform class"""
     binning = MultiDimBinning([
@@ -1060,6 +1546,183 @@ def test_BinnedTensorTransform():
     logging.info('<< PASS : test_TransformSet >>')
 
 
+def test_SparseBinnedTensorTransform():
+    """Unit tests for SparseBinnedTensorTransform class"""
+    in_binning = MultiDimBinning([
+        dict(name='true_energy', is_log=True, domain=(1, 80)*ureg.GeV,
+             num_bins=10),
+        dict(name='true_coszen', is_lin=True, domain=(-1, 0), num_bins=5)
+    ])
+    out_binning = MultiDimBinning([
+        dict(name='reco_energy', is_log=True, domain=(1, 80)*ureg.GeV,
+             num_bins=8),
+        dict(name='reco_coszen', is_lin=True, domain=(-1, 0), num_bins=4)
+    ])
+    rand = np.random.RandomState(0)
+
+    nue_map = Map(name='nue', binning=in_binning,
+                  hist=rand.random_sample(in_binning.shape))
+    numu_map = Map(name='numu', binning=in_binning,
+                   hist=rand.random_sample(in_binning.shape))
+    numu_map.set_poisson_errors()
+    inputs = MapSet(name='inputs', maps=[nue_map, numu_map])
+
+    # Mostly-empty kernel, with and without errors
+    kernel = rand.random_sample(in_binning.shape + out_binning.shape)
+    kernel[kernel < 0.8] = 0
+    kernel_errors = 0.1 * kernel
+
+    for input_names, sum_inputs in [('nue', False), ('numu', False),
+                                    (['nue', 'numu'], True)]:
+        for errors in [None, kernel_errors]:
+            dense = BinnedTensorTransform(
+                input_names=input_names, output_name='out',
+                input_binning=in_binning, output_binning=out_binning,
+                xform_array=kernel, sum_inputs=sum_inputs, error_array=errors
+            )
+            sparse_xform = SparseBinnedTensorTransform(
+                input_names=input_names, output_name='out',
+                input_binning=in_binning, output_binning=out_binning,
+                xform_array=kernel, sum_inputs=sum_inputs, error_array=errors
+            )
+            assert sparse_xform.nnz == np.count_nonzero(kernel)
+            ref = dense.apply(inputs)
+            out = sparse_xform.apply(inputs)
+            assert out.binning == ref.binning
+            assert np.allclose(out.nominal_values, ref.nominal_values,
+                               rtol=1e-12)
+            assert np.allclose(out.std_devs, ref.std_devs, rtol=1e-12)
+
+    # Truncation
+    truncated = SparseBinnedTensorTransform(
+        input_names='nue', output_name='out', input_binning=in_binning,
+        output_binning=out_binning, xform_array=kernel, threshold=0.9
+    )
+    assert truncated.nnz == np.count_nonzero(kernel > 0.9)
+    ref = np.tensordot(nue_map.nominal_values, np.where(kernel > 0.9, kernel, 0),
+                       axes=([0, 1], [0, 1]))
+    assert np.allclose(truncated.apply(inputs).nominal_values, ref)
+
+    # Stacked inputs use one kernel slice per input
+    stacked_kernel = np.stack([kernel, 2*kernel], axis=0)
+    stacked = SparseBinnedTensorTransform(
+        input_names=['nue', 'numu'], output_name='out',
+        input_binning=in_binning, output_binning=out_binning,
+        xform_array=stacked_kernel
+    )
+    ref = np.tensordot(
+        np.stack([nue_map.nominal_values, numu_map.nominal_values]),
+        stacked_kernel, axes=([0, 1, 2], [0, 1, 2])
+    )
+    assert np.allclose(stacked.apply(inputs).nominal_values, ref)
+
+    testdir = tempfile.mkdtemp()
+    try:
+        xform = SparseBinnedTensorTransform(
+            input_names='numu', output_name='numu', input_binning=in_binning,
+            output_binning=out_binning, xform_array=kernel,
+            error_array=kernel_errors
+        )
+        t_file = os.path.join(testdir, 'xform.json')
+        xform.to_json(t_file)
+        xform_ = SparseBinnedTensorTransform.from_json(t_file)
+        assert xform_ == xform
+        xforms = TransformSet(transforms=[xform, truncated])
+        t_file = os.path.join(testdir, 'xforms.json')
+        xforms.to_json(t_file)
+        assert TransformSet.from_json(t_file) == xforms
+    finally:
+        shutil.rmtree(testdir, ignore_errors=True)
+
+    logging.info('<< PASS : test_SparseBinnedTensorTransform >>')
+
+
+def test_shared_kernels():
+    """Unit tests for applying transforms sharing a kernel to summed inputs"""
+    in_binning = MultiDimBinning([
+        dict(name='true_energy', is_log=True, domain=(1, 80)*ureg.GeV,
+             num_bins=10),
+        dict(name='true_coszen', is_lin=True, domain=(-1, 0), num_bins=5)
+    ])
+    out_binning = MultiDimBinning([
+        dict(name='reco_energy', is_log=True, domain=(1, 80)*ureg.GeV,
+             num_bins=8),
+        dict(name='reco_coszen', is_lin=True, domain=(-1, 0), num_bins=4)
+    ])
+    rand = np.random.RandomState(0)
+    names = ['nue_cc', 'nuebar_cc', 'numu_cc', 'numubar_cc']
+    maps = []
+    for name in names:
+        maps.append(Map(name=name, binning=in_binning,
+                        hist=rand.random_sample(in_binning.shape)))
+        maps[-1].set_poisson_errors()
+    inputs = MapSet(maps=maps, hash=1234)
+
+    e_kernel = rand.random_sample(in_binning.shape + out_binning.shape)
+    mu_kernel = rand.random_sample(in_binning.shape + out_binning.shape)
+    mu_kernel[mu_kernel < 0.5] = 0
+
+    for xform_class in [BinnedTensorTransform, SparseBinnedTensorTransform]:
+        xforms = []
+        for name in names:
+            kernel = e_kernel if name.startswith('nue') else mu_kernel
+            # Separate (equal) kernel arrays for all transforms
+            xforms.append(xform_class(
+                input_names=name, output_name='all',
+                input_binning=in_binning, output_binning=out_binning,
+                xform_array=kernel.copy()
+            ))
+        xforms.append(xform_class(
+            input_names=names[:2], output_name='nue', sum_inputs=True,
+            input_binning=in_binning, output_binning=out_binning,
+            xform_array=e_kernel
+        ))
+        xform_set = TransformSet(transforms=xforms, hash=5678)
+        assert [len(g) for g in xform_set.shared_kernel_groups] == [2, 2, 1]
+
+        TransformSet.group_shared_kernels = False
+        try:
+            ref = xform_set.apply(inputs)
+        finally:
+            TransformSet.group_shared_kernels = True
+        outputs = xform_set.apply(inputs)
+        assert outputs.names == ref.names == ['all', 'nue']
+        for output, ref_output in zip(outputs, ref):
+            assert np.allclose(output.nominal_values,
+                               ref_output.nominal_values, rtol=1e-12)
+            assert np.allclose(output.std_devs, ref_output.std_devs,
+                               rtol=1e-12)
+
+        # Summed inputs are reused for the same inputs
+        assert (inputs.hash, tuple(names[:2])) \
+                in TransformSet._combined_inputs_cache # pylint: disable=protected-access
+        again = xform_set.apply(inputs)
+        assert np.all(again['all'].nominal_values
+                      == outputs['all'].nominal_values)
+
+        # Kernels with errors are not shared, as the summed inputs would pick
+        # up the correlation of the kernel errors between the transforms
+        err_xforms = [
+            xform_class(
+                input_names=name, output_name='all',
+                input_binning=in_binning, output_binning=out_binning,
+                xform_array=e_kernel, error_array=0.1*e_kernel
+            )
+            for name in names[:2]
+        ]
+        err_xform_set = TransformSet(transforms=err_xforms)
+        assert [len(g) for g in err_xform_set.shared_kernel_groups] == [1, 1]
+        outputs = err_xform_set.apply(inputs)
+        separate = [xform.apply(inputs) for xform in err_xforms]
+        assert np.allclose(outputs['all'].std_devs,
+                           np.sqrt(separate[0].variances
+                                   + separate[1].variances), rtol=1e-12)
+
+    logging.info('<< PASS : test_shared_kernels >>')
+
+
 if __name__ == "__main__":
     set_verbosity(1)
     test_BinnedTensorTransform()
+    test_SparseBinnedTensorTransform()
+    test_shared_kernels()
@@ -3,16 +3,10 @@
 module for data representation translation methods
 '''
 
-# TODO:
-#    - right now we distinguish on histogramming/lookup for scalars (normal) or array, which means that instead
-#    of just a single value per e.g. histogram bin, there can be an array of values
-#    This should be made more general that one function can handle everything...since now we have several
-#    functions doing similar things. not very pretty
-
 from __future__ import absolute_import, print_function, division
 
 import numpy as np
-from numba import guvectorize, SmartArray, cuda
+from numba import guvectorize, jit, SmartArray, cuda
 
 from pisa import FTYPE, TARGET
 from pisa.core.binning import OneDimBinning, MultiDimBinning
@@ -21,8 +15,13 @@ from pisa.utils import vectorizer
 
 __all__ = [
     'histogram',
+    'fused_histogram',
+    'flat_bin_index',
     'lookup',
-    'resample'
+    'resample',
+    'test_histogram',
+    'test_fused_histogram',
+    'test_lookup',
 ]
 
 
@@ -51,14 +50,8 @@ def resample(weights, old_sample, old_binning, new_sample, new_binning):
 
     # this is a two step process, first histogram the weights into the new binning:
     # and keep the flat_hist_counts
-    if TARGET == 'cuda':
-        flat_hist = get_hist_gpu(old_sample, weights, new_binning, apply_weights=True)
-        flat_hist_counts = get_hist_gpu(old_sample, weights, new_binning, apply_weights=False)
-    else:
-        #print(old_sample[0].get('host'))
-        #print(weights.get('host'))
-        flat_hist = get_hist_np(old_sample, weights, new_binning, apply_weights=True)
-        flat_hist_counts = get_hist_np(old_sample, weights, new_binning, apply_weights=False)
+    flat_hist, flat_hist_counts, _ = fused_histogram(old_sample, weights, new_binning)
+    flat_hist_counts = _counts_like(flat_hist_counts, flat_hist)
     vectorizer.divide(flat_hist_counts, flat_hist)
 
     # now do the inverse, a lookup
@@ -73,11 +66,14 @@ def resample(weights, old_sample, old_binning, new_sample, new_binning):
 
 # --------- histogramming methods ---------------
 
-def histogram(sample, weights, binning, averaged):
-    return get_hist(sample, weights, binning, averaged)
+def histogram(sample, weights, binning, averaged, flat_index=None,
+              return_sumw2=False):
+    return get_hist(sample, weights, binning, averaged, flat_index=flat_index,
+                    return_sumw2=return_sumw2)
 
 
-def get_hist(sample, weights, binning, averaged):
+def get_hist(sample, weights, binning, averaged, flat_index=None,
+             return_sumw2=False):
     '''
     histograming
 
@@ -96,180 +92,282 @@ def get_hist(sample, weights, binning, averaged):
             probabilities are translated.....otherwise we end up with probability*count
             per bin
 
+    flat_index : SmartArray or None
+        flat bin index of each event (as returned by `flat_bin_index`); if
+        None, it is computed from `sample`
+
+    return_sumw2 : bool
+        if True, also return the sum of squared weights per bin (computed in
+        the same pass over the events); these are never averaged
+
     Notes
     -----
 
     '''
-    if TARGET == 'cuda':
-        flat_hist = get_hist_gpu(sample, weights, binning, apply_weights=True)
-        if averaged:
-            flat_hist_counts = get_hist_gpu(sample, weights, binning, apply_weights=False)
-    else:
-        flat_hist = get_hist_np(sample, weights, binning, apply_weights=True)
-        if averaged:
-            flat_hist_counts = get_hist_np(sample, weights, binning, apply_weights=False)
+    flat_hist, flat_hist_counts, flat_hist_sumw2 = fused_histogram(
+        sample, weights, binning, flat_index=flat_index
+    )
     if averaged:
-        #print(flat_hist_counts.get('host').shape)
-        #print(flat_hist.get('host').shape)
-        vectorizer.divide(flat_hist_counts, flat_hist)
+        vectorizer.divide(_counts_like(flat_hist_counts, flat_hist), flat_hist)
+    if return_sumw2:
+        return flat_hist, flat_hist_sumw2
     return flat_hist
 
-def get_hist_gpu(sample, weights, binning, apply_weights=True):
-    # ToDo:
-    # * make for d > 3
-    if binning.num_dims in [2, 3]:
-        bin_edges = [edges.magnitude for edges in binning.bin_edges]
-        if len(weights.shape) > 1:
-            # so we have arrays
-            flat_hist = SmartArray(np.zeros((binning.size, weights.shape[1]), dtype=FTYPE))
-            arrays = True
-        else:
-            flat_hist = SmartArray(np.zeros(binning.size, dtype=FTYPE))
-            arrays = False
-        size = weights.shape[0]
-        d_bin_edges_x = cuda.to_device(bin_edges[0])
-        d_bin_edges_y = cuda.to_device(bin_edges[1])
-        if binning.num_dims == 2:
-            if arrays:
-                histogram_2d_kernel_arrays[(size+511)//512, 512](sample[0].get('gpu'),
-                                                                 sample[1].get('gpu'),
-                                                                 flat_hist,
-                                                                 d_bin_edges_x,
-                                                                 d_bin_edges_y,
-                                                                 weights.get('gpu'),
-                                                                 apply_weights)
-            else:
-                histogram_2d_kernel[(size+511)//512, 512](sample[0].get('gpu'),
-                                                          sample[1].get('gpu'),
-                                                          flat_hist,
-                                                          d_bin_edges_x,
-                                                          d_bin_edges_y,
-                                                          weights.get('gpu'),
-                                                          apply_weights)
-        elif binning.num_dims == 3:
-            d_bin_edges_z = cuda.to_device(bin_edges[2])
-            if arrays:
-                histogram_3d_kernel_arrays[(size+511)//512, 512](sample[0].get('gpu'),
-                                                                 sample[1].get('gpu'),
-                                                                 sample[2].get('gpu'),
-                                                                 flat_hist,
-                                                                 d_bin_edges_x,
-                                                                 d_bin_edges_y,
-                                                                 d_bin_edges_z,
-                                                                 weights.get('gpu'),
-                                                                 apply_weights)
-            else:
-                histogram_3d_kernel[(size+511)//512, 512](sample[0].get('gpu'),
-                                                          sample[1].get('gpu'),
-                                                          sample[2].get('gpu'),
-                                                          flat_hist,
-                                                          d_bin_edges_x,
-                                                          d_bin_edges_y,
-                                                          d_bin_edges_z,
-                                                          weights.get('gpu'),
-                                                          apply_weights)
-        return flat_hist
+
+def fused_histogram(sample, weights, binning, flat_index=None):
+    '''
+    histogram weights, event counts and squared weights in a single pass over
+    the events, for any number of dimensions
+
+    Paramters
+    ---------
+
+    sample : list of SmartArrays
+
+    weights : SmartArray
+        of shape (n_events,) or (n_events, n) for vector-valued weights
+
+    binning : PISA MultiDimBinning
+
+    flat_index : SmartArray or None
+        flat bin index of each event (as returned by `flat_bin_index`); if
+        None, it is computed from `sample`
+
+    Returns
+    -------
+    flat_hist : SmartArray
+        sum of weights per (flat) bin, shape (binning.size,) or (binning.size, n)
+
+    flat_hist_counts : SmartArray
+        number of events per bin, shape (binning.size,)
+
+    flat_hist_sumw2 : SmartArray
+        sum of squared weights per bin, same shape as `flat_hist`
+
+    Notes
+    -----
+    As with `numpy.histogramdd`, bins are closed on the left, except for the
+    last bin in each dimension which also includes its upper edge. Events
+    outside of the binning are ignored.
+
+    '''
+    if flat_index is None:
+        flat_index = flat_bin_index(sample, binning)
+    weights_ = weights.get(WHERE)
+    vector_weights = weights_.ndim == 2
+    if not vector_weights:
+        weights_ = weights_.reshape(weights_.shape[0], 1)
+    n = weights_.shape[1]
+
+    if TARGET == 'cuda':
+        # accumulate in double precision regardless of FTYPE
+        hist = cuda.to_device(np.zeros((binning.size, n), dtype=np.float64))
+        counts = cuda.to_device(np.zeros(binning.size, dtype=np.float64))
+        sumw2 = cuda.to_device(np.zeros((binning.size, n), dtype=np.float64))
+        size = flat_index.shape[0]
+        if size > 0:
+            fill_hist_kernel[(size+511)//512, 512](flat_index.get('gpu'),
+                                                   weights_,
+                                                   hist,
+                                                   counts,
+                                                   sumw2)
+        hist = hist.copy_to_host()
+        counts = counts.copy_to_host()
+        sumw2 = sumw2.copy_to_host()
     else:
-        raise NotImplementedError('Other dimesnions that 2 and 3 on the GPU not supported right now')
+        hist = np.zeros((binning.size, n), dtype=np.float64)
+        counts = np.zeros(binning.size, dtype=np.float64)
+        sumw2 = np.zeros((binning.size, n), dtype=np.float64)
+        fill_hist(flat_index.get('host'), weights_, hist, counts, sumw2)
+
+    if not vector_weights:
+        hist = hist.ravel()
+        sumw2 = sumw2.ravel()
+    return (SmartArray(hist.astype(FTYPE)),
+            SmartArray(counts.astype(FTYPE)),
+            SmartArray(sumw2.astype(FTYPE)))
+
+
+def _counts_like(flat_hist_counts, flat_hist):
+    '''broadcast per-bin counts to the shape of a (vector-valued) histogram'''
+    if flat_hist.ndim == 1:
+        return flat_hist_counts
+    counts = flat_hist_counts.get('host')
+    return SmartArray(np.repeat(counts[:, np.newaxis], flat_hist.shape[1], axis=1))
+
+
+def flat_bin_index(sample, binning):
+    '''
+    flat (C-order) index into `binning` of each event, or -1 for events
+    outside of the binning
+
+    Paramters
+    ---------
+
+    sample : list of SmartArrays
+        one per dimension of `binning`, in the same order
+
+    binning : PISA MultiDimBinning
+
+    Returns
+    -------
+    flat_index : SmartArray of int64
+
+    '''
+    assert len(sample) == binning.num_dims, 'need one sample array per dimension'
+    bin_edges, edge_offsets, index_modes, index_params = _index_strategy(binning)
+    # one row of coordinates per event
+    sample = np.stack([s.get('host') for s in sample], axis=1).astype(FTYPE, copy=False)
+    sample = SmartArray(sample)
+    flat_index = SmartArray(np.empty(sample.shape[0], dtype=np.int64))
+    if sample.shape[0] > 0:
+        find_flat_index_vectorized(sample.get(WHERE),
+                                   bin_edges,
+                                   edge_offsets,
+                                   index_modes,
+                                   index_params,
+                                   out=flat_index.get(WHERE))
+        flat_index.mark_changed(WHERE)
+    return flat_index
+
+
+def _index_strategy(binning):
+    '''
+    per-dimension description of how to find bin indices, as arrays that can
+    be passed to `find_flat_index`
+
+    Returns
+    -------
+    bin_edges : array
+        edges of all dimensions concatenated
+
+    edge_offsets : array of int64
+        the edges of dimension `d` are `bin_edges[edge_offsets[d]:edge_offsets[d+1]]`
 
+    index_modes : array of int64
+        0 for irregular binnings (binary search), 1 for linear and 2 for
+        logarithmic binnings (direct computation)
 
-def get_hist_np(sample, weights, binning, apply_weights=True):
-    '''helper function for numoy historams'''
+    index_params : array
+        for each dimension, the offset and scale that map (the log of) a value
+        onto its bin index, i.e. `index = (x - offset) * scale`
+
+    '''
     bin_edges = [edges.magnitude for edges in binning.bin_edges]
-    sample = [s.get('host') for s in sample]
-    weights = weights.get('host')
-    if weights.ndim == 2:
-        # that means it's 1-dim data instead of scalars
-        hists = []
-        for i in range(weights.shape[1]):
-            w = weights[:, i] if apply_weights else None
-            hist, _ = np.histogramdd(sample=sample, weights=w, bins=bin_edges)
-            hists.append(hist.ravel())
-        flat_hist = np.stack(hists, axis=1)
-    else:
-        w = weights if apply_weights else None
-        hist, _ = np.histogramdd(sample=sample, weights=w, bins=bin_edges)
-        flat_hist = hist.ravel()
-    return SmartArray(flat_hist.astype(FTYPE))
+    edge_offsets = np.cumsum([0] + [len(edges) for edges in bin_edges]).astype(np.int64)
+    index_modes = np.zeros(binning.num_dims, dtype=np.int64)
+    index_params = np.zeros(2 * binning.num_dims, dtype=FTYPE)
+    for d, (dim, edges) in enumerate(zip(binning, bin_edges)):
+        if dim.is_lin:
+            index_modes[d] = 1
+            lower, upper = edges[0], edges[-1]
+        elif dim.is_log:
+            index_modes[d] = 2
+            lower, upper = np.log(edges[0]), np.log(edges[-1])
+        else:
+            continue
+        index_params[2*d] = lower
+        index_params[2*d + 1] = dim.num_bins / (upper - lower)
+    bin_edges = np.concatenate(bin_edges).astype(FTYPE)
+    return bin_edges, edge_offsets, index_modes, index_params
 
-# TODO: can we do just n-dimensional? And scalars or arbitrary array shapes? This is so ugly :/
-# Furthermore: optimize using shared memory
-@cuda.jit
-def histogram_2d_kernel(sample_x, sample_y, flat_hist, bin_edges_x, bin_edges_y, weights, apply_weights):
-    i = cuda.grid(1)
-    if i < sample_x.size:
-        if (sample_x[i] >= bin_edges_x[0]
-                and sample_x[i] <= bin_edges_x[-1]
-                and sample_y[i] >= bin_edges_y[0]
-                and sample_y[i] <= bin_edges_y[-1]):
-            idx_x = find_index(sample_x[i], bin_edges_x)
-            idx_y = find_index(sample_y[i], bin_edges_y)
-            idx = idx_x * (bin_edges_y.size - 1) + idx_y
-            if apply_weights:
-                cuda.atomic.add(flat_hist, idx, weights[i])
-            else:
-                cuda.atomic.add(flat_hist, idx, 1.)
 
-@cuda.jit
-def histogram_2d_kernel_arrays(sample_x, sample_y, flat_hist, bin_edges_x, bin_edges_y, weights, apply_weights):
-    i = cuda.grid(1)
-    if i < sample_x.size:
-        if (sample_x[i] >= bin_edges_x[0]
-                and sample_x[i] <= bin_edges_x[-1]
-                and sample_y[i] >= bin_edges_y[0]
-                and sample_y[i] <= bin_edges_y[-1]):
-            idx_x = find_index(sample_x[i], bin_edges_x)
-            idx_y = find_index(sample_y[i], bin_edges_y)
-            idx = idx_x * (bin_edges_y.size - 1) + idx_y
-            for j in range(flat_hist.shape[1]):
-                if apply_weights:
-                    cuda.atomic.add(flat_hist, (idx, j), weights[i, j])
-                else:
-                    cuda.atomic.add(flat_hist, (idx, j), 1.)
+@myjit
+def find_flat_index(sample, bin_edges, edge_offsets, index_modes, index_params):
+    ''' flat (C-order) bin index of the point `sample`, or -1 if it is outside
+    the binning (see `_index_strategy` for the meaning of the other arguments)
 
-@cuda.jit
-def histogram_3d_kernel(sample_x, sample_y, sample_z, flat_hist, bin_edges_x, bin_edges_y, bin_edges_z, weights, apply_weights):
-    i = cuda.grid(1)
-    if i < sample_x.size:
-        if (sample_x[i] >= bin_edges_x[0]
-                and sample_x[i] <= bin_edges_x[-1]
-                and sample_y[i] >= bin_edges_y[0]
-                and sample_y[i] <= bin_edges_y[-1]
-                and sample_z[i] >= bin_edges_z[0]
-                and sample_z[i] <= bin_edges_z[-1]):
-            idx_x = find_index(sample_x[i], bin_edges_x)
-            idx_y = find_index(sample_y[i], bin_edges_y)
-            idx_z = find_index(sample_z[i], bin_edges_z)
-            idx = idx_x * (bin_edges_y.size - 1) * (bin_edges_z.size - 1) + idx_y * (bin_edges_z.size - 1) + idx_z
-            if apply_weights:
-                cuda.atomic.add(flat_hist, idx, weights[i])
+    direct computation for linear and logarithmic binnings, binary search
+    otherwise
+    '''
+    idx = 0
+    for d in range(sample.shape[0]):
+        first = edge_offsets[d]
+        last = edge_offsets[d+1] - 1
+        x = sample[d]
+        # also catches NaNs
+        if not (x >= bin_edges[first] and x <= bin_edges[last]):
+            return -1
+        num_bins = last - first
+        lower = first
+        if index_modes[d] == 0:
+            # invariant: bin_edges[first] <= x, and x < bin_edges[last] unless
+            # `last` is the uppermost edge
+            while last - first > 1:
+                mid = (first + last) // 2
+                if x >= bin_edges[mid]:
+                    first = mid
+                else:
+                    last = mid
+            i = first - lower
+        else:
+            if index_modes[d] == 1:
+                i = int((x - index_params[2*d]) * index_params[2*d+1])
             else:
-                cuda.atomic.add(flat_hist, idx, 1.)
+                i = int((math.log(x) - index_params[2*d]) * index_params[2*d+1])
+            i = min(max(i, 0), num_bins - 1)
+            # correct for rounding, such that results agree exactly with the
+            # bin edges
+            while i > 0 and x < bin_edges[lower + i]:
+                i -= 1
+            while i < num_bins - 1 and x >= bin_edges[lower + i + 1]:
+                i += 1
+        idx = idx * num_bins + i
+    return idx
+
 
+if FTYPE == np.float32:
+    _SIGNATURE = ['(f4[:], f4[:], i8[:], i8[:], f4[:], i8[:])']
+else:
+    _SIGNATURE = ['(f8[:], f8[:], i8[:], i8[:], f8[:], i8[:])']
+
+@guvectorize(_SIGNATURE, '(d),(e),(f),(d),(g)->()', target=TARGET)
+def find_flat_index_vectorized(sample, bin_edges, edge_offsets, index_modes,
+                               index_params, flat_index):
+    '''
+    Vectorized gufunc to find the flat bin index of each event
+    '''
+    flat_index[0] = find_flat_index(sample, bin_edges, edge_offsets,
+                                    index_modes, index_params)
+
+
+@jit(nopython=True, nogil=True)
+def fill_hist(flat_index, weights, hist, counts, sumw2):
+    '''accumulate weights, counts and squared weights of all events in one
+    pass (CPU)
+
+    Weights are promoted to double precision before squaring and summing,
+    also for FTYPE=float32'''
+    for i in range(flat_index.shape[0]):
+        idx = flat_index[i]
+        if idx < 0:
+            continue
+        counts[idx] += 1.
+        for j in range(weights.shape[1]):
+            w = float(weights[i, j])
+            hist[idx, j] += w
+            sumw2[idx, j] += w * w
+
+
+# TODO: optimize using shared memory
 @cuda.jit
-def histogram_3d_kernel_arrays(sample_x, sample_y, sample_z, flat_hist, bin_edges_x, bin_edges_y, bin_edges_z, weights, apply_weights):
+def fill_hist_kernel(flat_index, weights, hist, counts, sumw2):
+    '''accumulate weights, counts and squared weights of all events in one
+    pass (GPU)'''
     i = cuda.grid(1)
-    if i < sample_x.size:
-        if (sample_x[i] >= bin_edges_x[0]
-                and sample_x[i] <= bin_edges_x[-1]
-                and sample_y[i] >= bin_edges_y[0]
-                and sample_y[i] <= bin_edges_y[-1]
-                and sample_z[i] >= bin_edges_z[0]
-                and sample_z[i] <= bin_edges_z[-1]):
-            idx_x = find_index(sample_x[i], bin_edges_x)
-            idx_y = find_index(sample_y[i], bin_edges_y)
-            idx_z = find_index(sample_z[i], bin_edges_z)
-            idx = idx_x * (bin_edges_y.size - 1) * (bin_edges_z.size - 1) + idx_y * (bin_edges_z.size - 1) + idx_z
-            for j in range(flat_hist.shape[1]):
-                if apply_weights:
-                    cuda.atomic.add(flat_hist, (idx, j), weights[i, j])
-                else:
-                    cuda.atomic.add(flat_hist, (idx, j), 1.)
+    if i < flat_index.size:
+        idx = flat_index[i]
+        if idx >= 0:
+            cuda.atomic.add(counts, idx, 1.)
+            for j in range(weights.shape[1]):
+                w = float(weights[i, j])
+                cuda.atomic.add(hist, (idx, j), w)
+                cuda.atomic.add(sumw2, (idx, j), w * w)
 
 
 # ---------- Lookup methods ---------------
 
-def lookup(sample, flat_hist, binning):
+def lookup(sample, flat_hist, binning, flat_index=None):
     '''
     the inverse of histograming
 
@@ -279,164 +377,81 @@ def lookup(sample, flat_hist, binning):
     sample : list of SmartArrays
 
     flat_hist : SmartArray
+        of shape (binning.size,) or (binning.size, n)
 
     binning : PISA MultiDimBinning
 
+    flat_index : SmartArray or None
+        flat bin index of each event (as returned by `flat_bin_index`); if
+        None, it is computed from `sample`
+
     Notes
     -----
-    this is only a 2d method right now
+    events outside of the binning are assigned 0
     '''
-    #print(binning)
-    assert binning.num_dims in [2,3], 'can only do 2d and 3d at the moment'
-    bin_edges = [edges.magnitude for edges in binning.bin_edges]
-    # todo: directly return smart array
+    if flat_index is None:
+        flat_index = flat_bin_index(sample, binning)
     if flat_hist.ndim == 1:
-        #print 'looking up 1D'
-        array = SmartArray(np.zeros_like(sample[0]))
-        if binning.num_dims == 2:
-            lookup_vectorized_2d(sample[0].get(WHERE), sample[1].get(WHERE), flat_hist.get(WHERE), bin_edges[0], bin_edges[1], out=array.get(WHERE))
-        elif binning.num_dims == 3:
-            lookup_vectorized_3d(sample[0].get(WHERE), sample[1].get(WHERE), sample[2].get(WHERE), flat_hist.get(WHERE), bin_edges[0], bin_edges[1], bin_edges[2], out=array.get(WHERE))
+        array = SmartArray(np.zeros(flat_index.shape[0], dtype=FTYPE))
+        lookup_vectorized(flat_index.get(WHERE), flat_hist.get(WHERE), out=array.get(WHERE))
     elif flat_hist.ndim == 2:
-        #print 'looking up ND'
-        array = SmartArray(np.zeros((sample[0].size, flat_hist.shape[1]), dtype=FTYPE))
-        if binning.num_dims == 2:
-            lookup_vectorized_2d_arrays(sample[0].get(WHERE), sample[1].get(WHERE), flat_hist.get(WHERE), bin_edges[0], bin_edges[1], out=array.get(WHERE))
-        elif binning.num_dims == 3:
-            lookup_vectorized_3d_arrays(sample[0].get(WHERE), sample[1].get(WHERE), sample[2].get(WHERE), flat_hist.get(WHERE), bin_edges[0], bin_edges[1], bin_edges[2], out=array.get(WHERE))
+        array = SmartArray(np.zeros((flat_index.shape[0], flat_hist.shape[1]), dtype=FTYPE))
+        lookup_vectorized_arrays(flat_index.get(WHERE), flat_hist.get(WHERE), out=array.get(WHERE))
     else:
         raise NotImplementedError()
     array.mark_changed(WHERE)
     return array
 
-@myjit
-def find_index(x, bin_edges):
-    ''' simple binary search
-
-    direct trnasformations instead of search
-    '''
-    # TODO: support lin and log binnings with
-
-    first = 0
-    last = len(bin_edges) - 1
-    while first <= last:
-        i = int((first + last)/2)
-        if x >= bin_edges[i]:
-            if (x < bin_edges[i+1]) or (x <= bin_edges[-1] and i == len(bin_edges) - 1):
-                break
-            else:
-                first = i + 1
-        else:
-            last = i - 1
-    return i
 
 if FTYPE == np.float32:
-    _SIGNATURE = ['(f4[:], f4[:], f4[:], f4[:], f4[:], f4[:])']
+    _SIGNATURE = ['(i8[:], f4[:], f4[:])']
 else:
-    _SIGNATURE = ['(f8[:], f8[:], f8[:], f8[:], f8[:], f8[:])']
+    _SIGNATURE = ['(i8[:], f8[:], f8[:])']
 
-@guvectorize(_SIGNATURE, '(),(),(j),(k),(l)->()', target=TARGET)
-def lookup_vectorized_2d(sample_x, sample_y, flat_hist, bin_edges_x, bin_edges_y, weights):
+@guvectorize(_SIGNATURE, '(),(j)->()', target=TARGET)
+def lookup_vectorized(flat_index, flat_hist, weights):
     '''
     Vectorized gufunc to perform the lookup
     '''
-    sample_x_ = sample_x[0]
-    sample_y_ = sample_y[0]
-    if (sample_x_ >= bin_edges_x[0]
-            and sample_x_ <= bin_edges_x[-1]
-            and sample_y_ >= bin_edges_y[0]
-            and sample_y_ <= bin_edges_y[-1]):
-        idx_x = find_index(sample_x_, bin_edges_x)
-        idx_y = find_index(sample_y_, bin_edges_y)
-        idx = idx_x*(len(bin_edges_y)-1) + idx_y
+    idx = flat_index[0]
+    if idx >= 0:
         weights[0] = flat_hist[idx]
     else:
         weights[0] = 0.
 
 
 if FTYPE == np.float32:
-    _SIGNATURE = ['(f4[:], f4[:], f4[:,:], f4[:], f4[:], f4[:])']
+    _SIGNATURE = ['(i8[:], f4[:,:], f4[:])']
 else:
-    _SIGNATURE = ['(f8[:], f8[:], f8[:,:], f8[:], f8[:], f8[:])']
+    _SIGNATURE = ['(i8[:], f8[:,:], f8[:])']
 
-@guvectorize(_SIGNATURE, '(),(),(j,d),(k),(l)->(d)', target=TARGET)
-def lookup_vectorized_2d_arrays(sample_x, sample_y, flat_hist, bin_edges_x, bin_edges_y, weights):
+@guvectorize(_SIGNATURE, '(),(j,d)->(d)', target=TARGET)
+def lookup_vectorized_arrays(flat_index, flat_hist, weights):
     '''
     Vectorized gufunc to perform the lookup
     while flat hist and weights have both a second dimension
     '''
-    sample_x_ = sample_x[0]
-    sample_y_ = sample_y[0]
-    if (sample_x_ >= bin_edges_x[0]
-            and sample_x_ <= bin_edges_x[-1]
-            and sample_y_ >= bin_edges_y[0]
-            and sample_y_ <= bin_edges_y[-1]):
-        idx_x = find_index(sample_x_, bin_edges_x)
-        idx_y = find_index(sample_y_, bin_edges_y)
-        idx = idx_x*(len(bin_edges_y)-1) + idx_y
+    idx = flat_index[0]
+    if idx >= 0:
         for i in range(weights.size):
             weights[i] = flat_hist[idx, i]
     else:
         for i in range(weights.size):
             weights[i] = 0.
 
-if FTYPE == np.float32:
-    _SIGNATURE = ['(f4[:], f4[:], f4[:], f4[:], f4[:], f4[:], f4[:], f4[:])']
-else:
-    _SIGNATURE = ['(f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f8[:])']
-
-@guvectorize(_SIGNATURE, '(),(),(),(j),(k),(l),(m)->()', target=TARGET)
-def lookup_vectorized_3d(sample_x, sample_y, sample_z, flat_hist, bin_edges_x, bin_edges_y, bin_edges_z, weights):
-    '''
-    Vectorized gufunc to perform the lookup
-    '''
-    sample_x_ = sample_x[0]
-    sample_y_ = sample_y[0]
-    sample_z_ = sample_z[0]
-    if (sample_x_ >= bin_edges_x[0]
-            and sample_x_ <= bin_edges_x[-1]
-            and sample_y_ >= bin_edges_y[0]
-            and sample_y_ <= bin_edges_y[-1]
-            and sample_z_ >= bin_edges_z[0]
-            and sample_z_ <= bin_edges_z[-1]):
-        idx_x = find_index(sample_x_, bin_edges_x)
-        idx_y = find_index(sample_y_, bin_edges_y)
-        idx_z = find_index(sample_z_, bin_edges_z)
-        idx = (idx_x*(len(bin_edges_y)-1) + idx_y)*(len(bin_edges_z)-1) + idx_z
-        weights[0] = flat_hist[idx]
-    else:
-        weights[0] = 0.
-
 
-if FTYPE == np.float32:
-    _SIGNATURE = ['(f4[:], f4[:], f4[:], f4[:,:], f4[:], f4[:], f4[:], f4[:])']
-else:
-    _SIGNATURE = ['(f8[:], f8[:], f8[:], f8[:,:], f8[:], f8[:], f8[:], f8[:])']
+def _random_binning(num_dims):
+    '''helper for tests: mixed lin/log/irregular binning'''
+    dims = []
+    for d in range(num_dims):
+        if d % 3 == 0:
+            dims.append(OneDimBinning(name='x%d'%d, num_bins=4+d, is_lin=True, domain=[-1, 1]))
+        elif d % 3 == 1:
+            dims.append(OneDimBinning(name='x%d'%d, num_bins=3+d, is_log=True, domain=[1, 100]))
+        else:
+            dims.append(OneDimBinning(name='x%d'%d, bin_edges=[-1, -0.5, 0.1, 0.2, 1]))
+    return MultiDimBinning(dims)
 
-@guvectorize(_SIGNATURE, '(),(),(),(j,d),(k),(l),(m)->(d)', target=TARGET)
-def lookup_vectorized_3d_arrays(sample_x, sample_y, sample_z, flat_hist, bin_edges_x, bin_edges_y, bin_edges_z, weights):
-    '''
-    Vectorized gufunc to perform the lookup
-    while flat hist and weights have both a second dimension
-    '''
-    sample_x_ = sample_x[0]
-    sample_y_ = sample_y[0]
-    sample_z_ = sample_z[0]
-    if (sample_x_ >= bin_edges_x[0]
-            and sample_x_ <= bin_edges_x[-1]
-            and sample_y_ >= bin_edges_y[0]
-            and sample_y_ <= bin_edges_y[-1]
-            and sample_z_ >= bin_edges_z[0]
-            and sample_z_ <= bin_edges_z[-1]):
-        idx_x = find_index(sample_x_, bin_edges_x)
-        idx_y = find_index(sample_y_, bin_edges_y)
-        idx_z = find_index(sample_z_, bin_edges_z)
-        idx = (idx_x*(len(bin_edges_y)-1) + idx_y)*(len(bin_edges_z)-1) + idx_z
-        for i in range(weights.size):
-            weights[i] = flat_hist[idx, i]
-    else:
-        for i in range(weights.size):
-            weights[i] = 0.
 
 def test_histogram():
     n_evts = 100
@@ -460,8 +475,70 @@ def test_histogram():
 
     histo = histogram(sample, weights, binning, averaged)
 
-    assert np.array_equal(histo.reshape(10, 10), np.zeros(shape=(10, 10)))
+    # events lie on the diagonal, and the average of unit weights is one
+    assert np.array_equal(histo.reshape(10, 10), np.eye(10))
+
+
+def test_fused_histogram():
+    '''compare against numpy.histogramdd for 1 to 4 dimensions'''
+    rand = np.random.RandomState(0)
+    n_evts = 10000
+    for num_dims in range(1, 5):
+        binning = _random_binning(num_dims)
+        sample = []
+        for dim in binning:
+            edges = dim.bin_edges.magnitude
+            width = edges[-1] - edges[0]
+            s = rand.uniform(edges[0] - 0.1*width, edges[-1] + 0.1*width, n_evts)
+            # put some events exactly on the edges
+            s[:len(edges)] = edges
+            sample.append(s.astype(FTYPE))
+        w = rand.uniform(0, 2, (n_evts, 3)).astype(FTYPE)
+        bin_edges = [edges.magnitude for edges in binning.bin_edges]
+
+        flat_hist, flat_hist_counts, flat_hist_sumw2 = fused_histogram(
+            [SmartArray(s) for s in sample], SmartArray(w), binning
+        )
+        counts, _ = np.histogramdd(sample, bins=bin_edges)
+        assert np.array_equal(flat_hist_counts.get('host'), counts.ravel())
+        for i in range(w.shape[1]):
+            ref, _ = np.histogramdd(sample, bins=bin_edges, weights=w[:, i])
+            ref_sumw2, _ = np.histogramdd(sample, bins=bin_edges, weights=w[:, i]**2)
+            assert np.allclose(flat_hist.get('host')[:, i], ref.ravel())
+            assert np.allclose(flat_hist_sumw2.get('host')[:, i], ref_sumw2.ravel())
+
+        # scalar weights and averaging
+        histo = histogram([SmartArray(s) for s in sample], SmartArray(w[:, 0].copy()),
+                          binning, averaged=True)
+        ref, _ = np.histogramdd(sample, bins=bin_edges, weights=w[:, 0])
+        mask = counts > 0
+        assert np.allclose(histo.get('host')[mask.ravel()], (ref[mask]/counts[mask]))
+        assert np.all(histo.get('host')[~mask.ravel()] == 0)
+
+
+def test_lookup():
+    '''lookup must return the value of the bin each event falls into'''
+    rand = np.random.RandomState(1)
+    for num_dims in range(1, 5):
+        binning = _random_binning(num_dims)
+        flat_hist = rand.uniform(size=binning.size).astype(FTYPE)
+        centers = np.meshgrid(*[dim.weighted_centers.magnitude for dim in binning],
+                              indexing='ij')
+        sample = [SmartArray(c.ravel().astype(FTYPE)) for c in centers]
+        array = lookup(sample, SmartArray(flat_hist), binning)
+        assert np.allclose(array.get('host'), flat_hist)
+
+        flat_hist_2d = rand.uniform(size=(binning.size, 2)).astype(FTYPE)
+        array = lookup(sample, SmartArray(flat_hist_2d), binning)
+        assert np.allclose(array.get('host'), flat_hist_2d)
+
+        # out of bounds
+        outside = [SmartArray(np.full(3, dim.bin_edges.magnitude[-1] + 1, dtype=FTYPE))
+                   for dim in binning]
+        assert np.all(lookup(outside, SmartArray(flat_hist), binning).get('host') == 0)
 
 
 if __name__ == '__main__':
     test_histogram()
+    test_fused_histogram()
+    test_lookup()
@@ -281,6 +281,13 @@ def parse_args(command, description):
             type=int, default=0,
             help='''Fluctated fiducial data index.'''
         )
+        parser.add_argument(
+            '--num-workers',
+            type=int, default=1,
+            help='''Number of worker processes to distribute the data and
+            fiducial trials over. Each worker sets up the distribution makers
+            only once; trials already recorded to disk are skipped.'''
+        )
     # A blind analysis only makes sense when the possibility of actually
     # analysing data is available.
     if command not in (inj_param_scan, systematics_tests):
@@ -308,6 +315,13 @@ def parse_args(command, description):
         help='''Do not store minimizer history (steps). This behavior is also
         enforced if --blind is specified.'''
     )
+    parser.add_argument(
+        '--fit-memo-size',
+        type=int, default=0,
+        help='''Number of fits to remember, such that identical fits (e.g. to
+        unfluctuated fiducial data in each trial) are not repeated. 0 disables
+        memoization.'''
+    )
     # Add in the arguments specific to the injected parameter scan.
     if command == inj_param_scan:
         parser.add_argument(
@@ -39,7 +39,7 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
 def profile_scan(data_settings, template_settings, param_names, steps,
                  only_points, no_outer, data_param_selections,
                  hypo_param_selections, profile, outfile, minimizer_settings,
-                 metric, debug_mode):
+                 metric, debug_mode, batch_size, warm_start):
     """Perform a profile scan.
 
     Parameters
@@ -57,6 +57,8 @@ def profile_scan(data_settings, template_settings, param_names, steps,
     minimizer_settings
     metric
     debug_mode
+    batch_size
+    warm_start
 
     Returns
     -------
@@ -98,7 +100,9 @@ def profile_scan(data_settings, template_settings, param_names, steps,
         profile=profile,
         minimizer_settings=minimizer_settings,
         outfile=outfile,
-        debug_mode=debug_mode
+        debug_mode=debug_mode,
+        batch_size=batch_size,
+        warm_start=warm_start
     )
     to_file(results, outfile)
     logging.info("Done.")
@@ -180,6 +184,16 @@ def parse_args():
         essentials for a physics analysis, 1 for more minimizer history, 2 for
         whatever can be recorded.'''
     )
+    parser.add_argument(
+        '--batch-size', type=int, required=False, default=None,
+        help='''If not profiling, precompute e.g. oscillation probabilities
+        for this many scan points at once.'''
+    )
+    parser.add_argument(
+        '--warm-start', action='store_true',
+        help='''If profiling, start the fit at each scan point from the best
+        fit at the previous point.'''
+    )
     parser.add_argument(
         '-v', action='count', default=None,
         help='set verbosity level'
@@ -3,6 +3,9 @@ PISA pi stage to apply effective area weights
 """
 from __future__ import absolute_import, print_function, division
 
+import numpy as np
+
+from pisa import ureg
 from pisa.core.pi_stage import PiStage
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
@@ -84,6 +87,53 @@ class pi_aeff(PiStage):
         # but it could if for example some smoothing will be performed!
 
 
+    propagates_derivatives = True
+
+    @property
+    def analytic_derivative_params(self):
+        return ('livetime',
+                'aeff_scale',
+                'nutau_cc_norm',
+                'nutau_norm',
+                'nu_nc_norm',
+               )
+
+    def apply_derivatives_function(self):
+        # the weights are scaled by the product of all factors applicable to
+        # a container (and weighted_aeff), hence the derivative w.r.t. each
+        # factor is the product of all others
+        factors = {
+            'aeff_scale': self.params.aeff_scale.m_as('dimensionless'),
+            'livetime': self.params.livetime.m_as('sec'),
+            'nutau_cc_norm': self.params.nutau_cc_norm.m_as('dimensionless'),
+            'nutau_norm': self.params.nutau_norm.m_as('dimensionless'),
+            'nu_nc_norm': self.params.nu_nc_norm.m_as('dimensionless'),
+        }
+        # derivative w.r.t. livetime in its own units rather than seconds
+        sec_per_livetime_unit = ureg.Quantity(
+            1, self.params.livetime.units
+        ).m_as('sec')
+
+        for container in self.data:
+            applicable = ['aeff_scale', 'livetime']
+            if container.name in ['nutau_cc', 'nutaubar_cc']:
+                applicable.append('nutau_cc_norm')
+            if 'nutau' in container.name:
+                applicable.append('nutau_norm')
+            if 'nc' in container.name:
+                applicable.append('nu_nc_norm')
+
+            weighted_aeff = container['weighted_aeff'].get('host')
+            factor = np.prod([factors[name] for name in applicable]) * weighted_aeff
+            factor_derivatives = {}
+            for name in applicable:
+                others = np.prod([factors[other] for other in applicable
+                                  if other != name])
+                factor_derivatives[name] = others * weighted_aeff
+            factor_derivatives['livetime'] = (factor_derivatives['livetime']
+                                              * sec_per_livetime_unit)
+            self.scale_weight_derivatives(container, factor, factor_derivatives)
+
     @profile
     def apply_function(self):
 
@@ -23,9 +23,11 @@ class simple_data_loader(PiStage):
     Parameters
     ----------
 
-    events_file : hdf5 file path
+    events_file : hdf5 file path or columnar events directory
         output from make_events, including flux weights
-        and Genie systematics coefficients
+        and Genie systematics coefficients. A columnar events directory (see
+        `pisa.core.events_pi.EventsPi.save_columnar`) is memory-mapped instead
+        of read, such that processes on the same node share the event data
 
     mc_cuts : cut expr
         e.g. '(true_coszen <= 0.5) & (true_energy <= 70)'
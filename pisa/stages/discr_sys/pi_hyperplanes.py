@@ -5,13 +5,14 @@ PISA pi stage to apply hyperplane fits from discrete systematics parameterizatio
 from __future__ import absolute_import, print_function, division
 
 import ast
+from collections import OrderedDict
 
 from numba import guvectorize
 import numpy as np
 
 from pisa import FTYPE, TARGET, ureg
 from pisa.core.binning import MultiDimBinning
-from pisa.core.pi_stage import PiStage
+from pisa.core.pi_stage import PiStage, derivative_key
 from pisa.utils.fileio import from_file
 from pisa.utils.log import logging
 from pisa.utils.numba_tools import WHERE
@@ -341,6 +342,50 @@ class pi_hyperplanes(PiStage):  # pyint: disable=invalid-name
 
         self.data.unlink_containers()
 
+    propagates_derivatives = True
+
+    @property
+    def analytic_derivative_params(self):
+        return tuple(self.fit_param_names)
+
+    def apply_derivatives_function(self):
+        # the hyperplanes are linear in the params, hence the derivatives of
+        # the scale factors are the (fixed) hyperplane slopes; these are
+        # translated to the output representation once and kept
+        slope_keys = OrderedDict()
+        for i, (name, units) in enumerate(zip(self.fit_param_names, self.fit_param_units)):
+            if name in self.derivative_params:
+                slope_keys[name] = (i, units, derivative_key("hyperplane_scalefactors", name))
+
+        self.data.data_specs = self.output_specs
+        missing = [
+            container for container in self.data
+            if not all(
+                container.has_data(key) for _, _, key in slope_keys.values()
+            )
+        ]
+        if missing:
+            self.data.data_specs = self.calc_specs
+            for container in missing:
+                results = container["hyperplane_results"].get("host")
+                for name, (i, units, key) in slope_keys.items():
+                    # derivative w.r.t. the param in its own units
+                    per_unit = ureg.Quantity(1, self.params[name].units).m_as(units)
+                    container[key] = results[:, i + 1] * per_unit
+                    if self.output_mode == "events":
+                        container.binned_to_array(key)
+            self.data.data_specs = self.output_specs
+
+        for container in self.data:
+            self.scale_weight_derivatives(
+                container,
+                container["hyperplane_scalefactors"].get("host"),
+                OrderedDict(
+                    (name, container[key].get("host"))
+                    for name, (_, _, key) in slope_keys.items()
+                ),
+            )
+
     def apply_function(self):
         for container in self.data:
             vectorizer.multiply(
@@ -15,6 +15,7 @@ from pisa.utils.log import logging
 from pisa.utils.profiler import profile
 from pisa.utils.numba_tools import WHERE, myjit, ftype
 from pisa.utils.flux_weights import load_2d_table, calculate_2d_flux_weights
+from pisa.utils.hash import hash_file
 
 
 class pi_honda_ip(PiStage):
@@ -26,6 +27,10 @@ class pi_honda_ip(PiStage):
 
     flux_table : str
 
+    disk_cache : None, bool, string, or ArrayDiskCache
+        Cache the nominal fluxes on disk, keyed on the events and the flux
+        table file (see `pisa.core.pi_stage.PiStage`)
+
     Notes
     -----
 
@@ -40,6 +45,7 @@ class pi_honda_ip(PiStage):
                  input_specs=None,
                  calc_specs=None,
                  output_specs=None,
+                 disk_cache=None,
                 ):
 
         expected_params = ('flux_table',
@@ -75,6 +81,7 @@ class pi_honda_ip(PiStage):
             input_calc_keys=input_calc_keys,
             output_calc_keys=output_calc_keys,
             output_apply_keys=output_apply_keys,
+            disk_cache=disk_cache,
         )
 
         assert self.input_mode is None
@@ -100,6 +107,24 @@ class pi_honda_ip(PiStage):
         # don't forget to un-link everything again
         self.data.unlink_containers()
 
+    def calc_nominal_flux(self, container):
+        """Evaluate the flux tables for the events in `container`, filling its
+        `nominal_nu_flux` and `nominal_nubar_flux` arrays (which are returned)
+        """
+        # create lists for iteration
+        out_names = ['nominal_nu_flux']*2 + ['nominal_nubar_flux']*2
+        indices = [0, 1, 0, 1]
+        tables = ['nue', 'numu', 'nuebar', 'numubar']
+        for out_name, index, table in zip(out_names, indices, tables):
+            logging.info('Calculating nominal %s flux for %s'%(table, container.name))
+            calculate_2d_flux_weights(true_energies=container['true_energy'].get('host'),
+                                      true_coszens=container['true_coszen'].get('host'),
+                                      en_splines=self.flux_table[table],
+                                      out=container[out_name].get('host')[:,index]
+                                     )
+        return [(out_name, container[out_name].get('host'))
+                for out_name in ('nominal_nu_flux', 'nominal_nubar_flux')]
+
     @profile
     def compute_function(self):
 
@@ -113,21 +138,23 @@ class pi_honda_ip(PiStage):
                                              'nuebar_cc', 'numubar_cc', 'nutaubar_cc',
                                              'nuebar_nc', 'numubar_nc', 'nutaubar_nc'])
 
-        # create lists for iteration
-        out_names = ['nominal_nu_flux']*2 + ['nominal_nubar_flux']*2
-        indices = [0, 1, 0, 1]
-        tables = ['nue', 'numu', 'nuebar', 'numubar']
+        flux_table_hash = None
+        if self.disk_cache is not None:
+            flux_table_hash = hash_file(self.params.flux_table.value)
+
         for container in self.data:
-            for out_name, index, table in zip(out_names, indices, tables):
-                logging.info('Calculating nominal %s flux for %s'%(table, container.name))
-                calculate_2d_flux_weights(true_energies=container['true_energy'].get('host'),
-                                           true_coszens=container['true_coszen'].get('host'),
-                                           en_splines=self.flux_table[table],
-                                           out=container[out_name].get('host')[:,index]
-                                          )
+            arrays = self.cached_arrays(
+                container,
+                input_keys=('true_energy', 'true_coszen'),
+                hashables=flux_table_hash,
+                func=lambda: self.calc_nominal_flux(container), # pylint: disable=cell-var-from-loop
+            )
+            for out_name, array in arrays.items():
+                host_array = container[out_name].get('host')
+                if array is not host_array:
+                    host_array[:] = array
             container['nominal_nu_flux'].mark_changed('host')
             container['nominal_nubar_flux'].mark_changed('host')
 
         # don't forget to un-link everything again
         self.data.unlink_containers()
-
@@ -21,6 +21,7 @@ from pisa.core.pi_stage import PiStage
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
 from pisa.utils.numba_tools import WHERE, myjit, ftype
+from pisa.utils.hash import hash_file
 from pisa.utils.resources import find_resource
 
 
@@ -37,6 +38,10 @@ class pi_mceq_barr(PiStage):
         pointing to spline table obtained from MCEq
     barr_* : quantity (dimensionless)
 
+    disk_cache : None, bool, string, or ArrayDiskCache
+        Cache the evaluated splines on disk, keyed on the events and the table
+        file (see `pisa.core.pi_stage.PiStage`)
+
     Notes
     -----
 
@@ -54,6 +59,7 @@ class pi_mceq_barr(PiStage):
                  input_specs=None,
                  calc_specs=None,
                  output_specs=None,
+                 disk_cache=None,
                 ):
 
         expected_params = ('table_file',
@@ -99,6 +105,7 @@ class pi_mceq_barr(PiStage):
             input_calc_keys=input_calc_keys,
             output_calc_keys=output_calc_keys,
             output_apply_keys=output_apply_keys,
+            disk_cache=disk_cache,
         )
 
         assert self.input_mode is not None
@@ -109,7 +116,11 @@ class pi_mceq_barr(PiStage):
 
 
         # load MCeq tables
-        spline_tables_dict = pickle.load(BZ2File(find_resource(self.params.table_file.value)))
+        table_file = find_resource(self.params.table_file.value)
+        spline_tables_dict = pickle.load(BZ2File(table_file))
+        table_hash = None
+        if self.disk_cache is not None:
+            table_hash = hash_file(table_file)
 
         self.data.data_specs = self.calc_specs
 
@@ -127,26 +138,40 @@ class pi_mceq_barr(PiStage):
         for container in self.data:
             # evaluate the splines (flux and deltas) for each E/CZ point
             # at the moment this is done on CPU, therefore we force 'host'
-            for key in spline_tables_dict.keys():
-                logging.info('Evaluating MCEq splines for %s for Barr parameter %s'%(container.name, key))
-                container['barr_'+key] = np.empty((container.size, 8), dtype=FTYPE)
-                self.eval_spline(container['true_energy'].get('host'),
-                                 container['true_coszen'].get('host'),
-                                 spline_tables_dict[key],
-                                 out=container['barr_'+key].get('host'))
-                container['barr_'+key].mark_changed('host')
+            arrays = self.cached_arrays(
+                container,
+                input_keys=('true_energy', 'true_coszen'),
+                hashables=table_hash,
+                func=lambda: self.eval_splines(container, spline_tables_dict), # pylint: disable=cell-var-from-loop
+            )
+            for name, array in arrays.items():
+                container[name] = np.array(array, dtype=FTYPE)
         self.data.unlink_containers()
 
+    def eval_splines(self, container, spline_tables_dict):
+        '''
+        evaluate the splines of all Barr parameters for the events in
+        `container`, returning a list of (`barr_<key>`, array) pairs
+        '''
+        arrays = []
+        for key in spline_tables_dict.keys():
+            logging.info('Evaluating MCEq splines for %s for Barr parameter %s'%(container.name, key))
+            out = np.empty((container.size, 8), dtype=FTYPE)
+            self.eval_spline(container['true_energy'].get('host'),
+                             container['true_coszen'].get('host'),
+                             spline_tables_dict[key],
+                             out=out)
+            arrays.append(('barr_'+key, out))
+        return arrays
+
     def eval_spline(self, true_energy, true_coszen, splines, out):
         '''
-        dumb function to iterate trhouh all E, CZ values
-        and evlauate all 8 Barr splines at these points
+        evaluate all 8 Barr splines at all E, CZ values
         '''
-        for i in range(len(true_energy)):
-            abs_cos = abs(true_coszen[i])
-            log_e = np.log(true_energy[i])
-            for j in range(len(splines)):
-                out[i,j] = splines[j](abs_cos, log_e)[0,0]
+        abs_cos = np.abs(true_coszen)
+        log_e = np.log(true_energy)
+        for j in range(len(splines)):
+            out[:,j] = splines[j](abs_cos, log_e, grid=False)
 
 
     @profile
@@ -14,7 +14,7 @@ import numpy as np
 from numba import guvectorize, cuda
 
 from pisa import FTYPE, TARGET
-from pisa.core.pi_stage import PiStage
+from pisa.core.pi_stage import PiStage, derivative_key
 from pisa.utils.profiler import profile
 from pisa.utils.numba_tools import WHERE, myjit, ftype
 from pisa.utils.resources import find_resource
@@ -133,6 +133,38 @@ class pi_simple(PiStage):  # pylint: disable=invalid-name
             container["sys_flux"].mark_changed(WHERE)
 
 
+    # the spectral index scale multiplies all fluxes, while all subsequent
+    # modifications are homogeneous in the fluxes, hence
+    # d(sys_flux)/d(delta_index) = sys_flux * log(E / E_pivot)
+    propagates_derivatives = True
+
+    @property
+    def analytic_derivative_params(self):
+        # with binned calc specs, sys_flux is computed at the bin centres and
+        # then translated to the events, such that the derivative at the event
+        # energies does not belong to it; fall back to finite differences
+        if self.calc_mode == "events":
+            return ("delta_index",)
+        return ()
+
+    def apply_derivatives_function(self):
+        if "delta_index" not in self.derivative_params:
+            return
+        for container in self.data:
+            sys_flux = container["sys_flux"].get("host")
+            log_energy_ratio = np.log(
+                container["true_energy"].get("host") / SPECTRAL_INDEX_PIVOT_ENERGY
+            )
+            container[derivative_key("sys_flux", "delta_index")] = (
+                sys_flux * log_energy_ratio[:, np.newaxis]
+            ).astype(FTYPE)
+
+
+SPECTRAL_INDEX_PIVOT_ENERGY = 24.0900951261
+"""Energy (GeV) at which the spectral index modification is unity (must
+match the literal in `apply_sys_kernel`)"""
+
+
 @myjit
 def apply_ratio_scale(ratio_scale, sum_constant, in1, in2, out):
     """ apply ratio scale to flux values
@@ -203,6 +235,8 @@ def apply_sys_kernel(
 
     # apply flux systematics
     # spectral idx
+    # NOTE: literal rather than SPECTRAL_INDEX_PIVOT_ENERGY, since `myjit`
+    # compiles kernels outside of this module's namespace
     idx_scale = spectral_index_scale(true_energy, 24.0900951261, delta_index)
     new_nu_flux[0] *= idx_scale
     new_nu_flux[1] *= idx_scale
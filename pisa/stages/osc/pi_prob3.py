@@ -11,13 +11,14 @@ import numpy as np
 from numba import guvectorize
 
 from pisa import FTYPE, TARGET
-from pisa.core.pi_stage import PiStage
+from pisa.core.pi_stage import PiStage, derivative_key
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
 from pisa.stages.osc.pi_osc_params import OscParams
 from pisa.stages.osc.layers import Layers
 from pisa.stages.osc.prob3numba.numba_osc import propagate_array, fill_probs
 from pisa.utils.numba_tools import WHERE
+from pisa.utils.hash import hash_file
 from pisa.utils.resources import find_resource
 
 
@@ -40,7 +41,10 @@ class pi_prob3(PiStage):
     deltam31 : quantity (mass^2)
     deltacp : quantity (angle)
 
-    None
+    disk_cache : None, bool, string, or ArrayDiskCache
+        Cache the Earth layer densities and distances on disk, keyed on the
+        events, the earth model file and the layer params (see
+        `pisa.core.pi_stage.PiStage`)
 
     Notes
     -----
@@ -55,6 +59,7 @@ class pi_prob3(PiStage):
                  input_specs=None,
                  calc_specs=None,
                  output_specs=None,
+                 disk_cache=None,
                 ):
 
         expected_params = ('detector_depth',
@@ -100,6 +105,7 @@ class pi_prob3(PiStage):
             input_apply_keys=input_apply_keys,
             output_calc_keys=output_calc_keys,
             output_apply_keys=output_apply_keys,
+            disk_cache=disk_cache,
         )
 
         assert self.input_mode is not None
@@ -109,6 +115,11 @@ class pi_prob3(PiStage):
         self.layers = None
         self.osc_params = None
 
+        # probabilities precomputed for a batch of param points, see
+        # `compute_batch`
+        self._batch_index = {}
+        self._batch_probabilities = None
+
     def setup_function(self):
 
         # object for oscillation parameters
@@ -137,10 +148,20 @@ class pi_prob3(PiStage):
                                              'nuebar_cc', 'numubar_cc', 'nutaubar_cc',
                                              'nuebar_nc', 'numubar_nc', 'nutaubar_nc'])
 
+        layers_hashables = None
+        if self.disk_cache is not None:
+            layers_hashables = (hash_file(earth_model), detector_depth,
+                                prop_height, YeI, YeO, YeM)
+
         for container in self.data:
-            self.layers.calcLayers(container['true_coszen'].get('host'))
-            container['densities'] = self.layers.density.reshape((container.size, self.layers.max_layers))
-            container['distances'] = self.layers.distance.reshape((container.size, self.layers.max_layers))
+            arrays = self.cached_arrays(
+                container,
+                input_keys=('true_coszen',),
+                hashables=layers_hashables,
+                func=lambda: self.calc_layers(container), # pylint: disable=cell-var-from-loop
+            )
+            container['densities'] = np.array(arrays['densities'])
+            container['distances'] = np.array(arrays['distances'])
 
         # don't forget to un-link everything again
         self.data.unlink_containers()
@@ -160,6 +181,14 @@ class pi_prob3(PiStage):
             container['prob_e'] = np.empty((container.size), dtype=FTYPE)
             container['prob_mu'] = np.empty((container.size), dtype=FTYPE)
 
+    def calc_layers(self, container):
+        ''' densities and distances of the layers traversed by the events in
+        `container` '''
+        self.layers.calcLayers(container['true_coszen'].get('host'))
+        shape = (container.size, self.layers.max_layers)
+        return [('densities', self.layers.density.reshape(shape)),
+                ('distances', self.layers.distance.reshape(shape))]
+
     def calc_probs(self, nubar, e_array, rho_array, len_array, out):
         ''' wrapper to execute osc. calc '''
         propagate_array(self.osc_params.dm_matrix, # pylint: disable = unexpected-keyword-arg, no-value-for-parameter
@@ -173,35 +202,130 @@ class pi_prob3(PiStage):
                        )
         out.mark_changed(WHERE)
 
-    @profile
-    def compute_function(self):
-
-        # set the correct data mode
-        self.data.data_specs = self.calc_specs
-
+    def _osc_values(self, point=None):
+        '''Magnitudes of the oscillation params in the units used by
+        `OscParams`, taken from `point` (mapping of param names to values)
+        where given, otherwise the current param values'''
+        if point is None:
+            point = {}
+        values = []
+        for name, units in OSC_PARAM_UNITS:
+            value = self.params[name].value
+            if name in point:
+                # convert to the param's units first, as setting the param
+                # value does, such that the magnitudes (used as keys of the
+                # batch) are identical to those `compute` finds at the point
+                value = point[name].to(value.units)
+            values.append(value.m_as(units))
+        return tuple(values)
+
+    def _set_osc_params(self, osc_values):
+        '''update mixing params from the output of `_osc_values`'''
+        (self.osc_params.theta12,
+         self.osc_params.theta13,
+         self.osc_params.theta23,
+         self.osc_params.dm21,
+         self.osc_params.dm31,
+         self.osc_params.deltacp) = osc_values
+
+    def _link_containers(self):
+        '''speed up calculation by adding links'''
         if self.calc_mode == 'binned':
-            # speed up calculation by adding links
             self.data.link_containers('nu', ['nue_cc', 'numu_cc', 'nutau_cc',
                                              'nue_nc', 'numu_nc', 'nutau_nc'])
             self.data.link_containers('nubar', ['nuebar_cc', 'numubar_cc', 'nutaubar_cc',
                                                 'nuebar_nc', 'numubar_nc', 'nutaubar_nc'])
 
-        # --- update mixing params ---
-        self.osc_params.theta12 = self.params.theta12.value.m_as('rad')
-        self.osc_params.theta13 = self.params.theta13.value.m_as('rad')
-        self.osc_params.theta23 = self.params.theta23.value.m_as('rad')
-        self.osc_params.dm21 = self.params.deltam21.value.m_as('eV**2')
-        self.osc_params.dm31 = self.params.deltam31.value.m_as('eV**2')
-        self.osc_params.deltacp = self.params.deltacp.value.m_as('rad')
-
+    @profile
+    def compute_batch(self, param_points):
+        '''
+        Calculate oscillation probabilities for a batch of K param points with
+        a single kernel launch per container, re-using the layers computed in
+        `setup_function`. The results are cached, such that subsequent calls
+        to `compute` at any of these points skip the calculation.
+
+        Parameters
+        ----------
+        param_points : sequence of mappings
+            Each maps param names (e.g. `theta23`) to values (quantities);
+            oscillation params not specified take their current values, other
+            params are ignored
+
+        Returns
+        -------
+        probabilities : dict
+            container name -> array of shape (K, n_events or n_bins, 3, 3)
+
+        '''
+        osc_values = [self._osc_values(point) for point in param_points]
+
+        dm = []
+        mix = []
+        nsi_eps = []
+        for values in osc_values:
+            self._set_osc_params(values)
+            dm.append(self.osc_params.dm_matrix)
+            mix.append(self.osc_params.mix_matrix_complex)
+            nsi_eps.append(self.osc_params.nsi_eps)
+        # extra axis to broadcast against the event dimension
+        dm = np.stack(dm)[:, np.newaxis]
+        mix = np.stack(mix)[:, np.newaxis]
+        nsi_eps = np.stack(nsi_eps)[:, np.newaxis]
 
+        self.data.data_specs = self.calc_specs
+        self._link_containers()
+        probabilities = {}
         for container in self.data:
-            self.calc_probs(container['nubar'],
-                            container['true_energy'],
-                            container['densities'],
-                            container['distances'],
-                            out=container['probability'],
+            out = np.empty((len(osc_values), container.size, 3, 3), dtype=FTYPE)
+            propagate_array(dm, # pylint: disable = unexpected-keyword-arg, no-value-for-parameter
+                            mix,
+                            nsi_eps,
+                            container['nubar'],
+                            container['true_energy'].get('host'),
+                            container['densities'].get('host'),
+                            container['distances'].get('host'),
+                            out=out
                            )
+            probabilities[container.name] = out
+        self.data.unlink_containers()
+
+        self._batch_index = {values: i for i, values in enumerate(osc_values)}
+        self._batch_probabilities = probabilities
+        # make sure `compute` is not skipped if params are at any of the points
+        self.params_version = None
+
+        return probabilities
+
+    def clear_batch(self):
+        '''Discard probabilities cached by `compute_batch`'''
+        self._batch_index = {}
+        self._batch_probabilities = None
+
+    @profile
+    def compute_function(self):
+
+        # set the correct data mode
+        self.data.data_specs = self.calc_specs
+        self._link_containers()
+
+        osc_values = self._osc_values()
+        batch_idx = self._batch_index.get(osc_values)
+
+        if batch_idx is not None:
+            for container in self.data:
+                probability = container['probability']
+                np.copyto(probability.get('host'),
+                          self._batch_probabilities[container.name][batch_idx])
+                probability.mark_changed('host')
+        else:
+            self._set_osc_params(osc_values)
+            for container in self.data:
+                self.calc_probs(container['nubar'],
+                                container['true_energy'],
+                                container['densities'],
+                                container['distances'],
+                                out=container['probability'],
+                               )
 
         # the following is flavour specific, hence unlink
         self.data.unlink_containers()
@@ -223,6 +347,28 @@ class pi_prob3(PiStage):
             container['prob_e'].mark_changed(WHERE)
             container['prob_mu'].mark_changed(WHERE)
 
+    # the oscillation params are not differentiated, but derivatives of the
+    # weights and of the fluxes (w.r.t. flux params) are propagated
+    propagates_derivatives = True
+
+    def apply_derivatives_function(self):
+        for container in self.data:
+            sys_flux = container['sys_flux'].get('host')
+            prob_e = container['prob_e'].get('host')
+            prob_mu = container['prob_mu'].get('host')
+            factor_derivatives = {}
+            for name in self.derivative_params:
+                key = derivative_key('sys_flux', name)
+                if container.has_data(key):
+                    flux_derivative = container[key].get('host')
+                    factor_derivatives[name] = (flux_derivative[:, 0] * prob_e
+                                                + flux_derivative[:, 1] * prob_mu)
+            self.scale_weight_derivatives(
+                container,
+                sys_flux[:, 0] * prob_e + sys_flux[:, 1] * prob_mu,
+                factor_derivatives
+            )
+
     @profile
     def apply_function(self):
 
@@ -235,6 +381,16 @@ class pi_prob3(PiStage):
             container['weights'].mark_changed(WHERE)
 
 
+# oscillation params and the units `OscParams` expects them in (in the order
+# `OscParams` attributes are set in `pi_prob3._set_osc_params`)
+OSC_PARAM_UNITS = (('theta12', 'rad'),
+                   ('theta13', 'rad'),
+                   ('theta23', 'rad'),
+                   ('deltam21', 'eV**2'),
+                   ('deltam31', 'eV**2'),
+                   ('deltacp', 'rad'),
+                  )
+
 # vectorized function to apply (flux * prob)
 # must be outside class
 if FTYPE == np.float64:
@@ -244,3 +400,40 @@ else:
 @guvectorize([signature], '(d),(),()->()', target=TARGET)
 def apply_probs(flux, prob_e, prob_mu, out):
     out[0] *= (flux[0] * prob_e) + (flux[1] * prob_mu)
+
+
+def test_compute_batch():
+    """Outputs computed with probabilities from `compute_batch` must be
+    identical to those of computing the probabilities point by point, also
+    for points given in units other than those of the params"""
+    from pisa import ureg
+    from pisa.core.pipeline import Pipeline
+
+    pipeline = Pipeline('settings/pipeline/example.cfg')
+    osc = pipeline.osc
+    # in rad while theta23 is in deg, so converting to the param's units may
+    # change the last bits of the magnitudes
+    points = [{'theta23': value*ureg.rad, 'deltam31': 2.5e-3*ureg.eV**2}
+              for value in np.linspace(0.6, 0.9, 21)]
+
+    ref_outputs = []
+    for point in points:
+        for name, value in point.items():
+            pipeline.params[name].value = value
+        ref_outputs.append(pipeline.get_outputs())
+
+    pipeline.compute_batch(points)
+    try:
+        for point, ref_output in zip(points, ref_outputs):
+            for name, value in point.items():
+                pipeline.params[name].value = value
+            # `compute` takes the probabilities from the batch
+            assert osc._osc_values() in osc._batch_index # pylint: disable=protected-access
+            outputs = pipeline.get_outputs()
+            for ref_map, out_map in zip(ref_output, outputs):
+                assert np.array_equal(ref_map.nominal_values,
+                                      out_map.nominal_values)
+    finally:
+        pipeline.clear_batch()
+
+    logging.info('<< PASS : test_compute_batch >>')
@@ -104,6 +104,9 @@ class pi_shift_scale_pid(PiStage):
                                    container['original_pid'].get(WHERE),
                                    out=container['calculated_pid'].get(WHERE))
             container['calculated_pid'].mark_changed(WHERE)
+            # `pid` (written in `apply_function`) changes only when recomputed
+            # here, so only now do the cached event bins need to be redone
+            container.invalidate_flat_index('pid')
 
     def apply_function(self):
         for container in self.data:
@@ -10,7 +10,9 @@ from __future__ import division
 import numpy as np
 
 from pisa.core.stage import Stage
-from pisa.core.transform import BinnedTensorTransform, TransformSet
+from pisa.core.transform import (BinnedTensorTransform,
+                                 SparseBinnedTensorTransform,
+                                 TransformSet, to_sparse_kernel)
 from pisa.utils.flavInt import flavintGroupsFromString, NuFlavIntGroup
 from pisa.utils.log import logging
 
@@ -107,6 +109,11 @@ class hist(Stage):
         in PISA but not necessarily) prefixed by "reco_". Each must match a
         corresponding dimension in `input_binning`.
 
+    sparse_threshold : None or float >= 0
+        If not None, apply the reconstruction kernels as
+        `SparseBinnedTensorTransform`s, dropping kernel entries whose value
+        does not exceed this threshold (0 drops only empty entries)
+
     transforms_cache_depth : int >= 0
 
     outputs_cache_depth : int >= 0
@@ -130,11 +137,13 @@ class hist(Stage):
     """
     def __init__(self, params, particles, input_names, transform_groups,
                  sum_grouped_flavints, input_binning, output_binning,
-                 error_method=None, transforms_cache_depth=20,
-                 outputs_cache_depth=20, memcache_deepcopy=True,
-                 debug_mode=None):
+                 error_method=None, sparse_threshold=None,
+                 transforms_cache_depth=20, outputs_cache_depth=20,
+                 memcache_deepcopy=True, debug_mode=None):
         assert particles in ['neutrinos', 'muons']
         self.particles = particles
+        assert sparse_threshold is None or sparse_threshold >= 0
+        self.sparse_threshold = sparse_threshold
         self.transform_groups = flavintGroupsFromString(transform_groups)
         self.sum_grouped_flavints = sum_grouped_flavints
 
@@ -179,6 +188,7 @@ class hist(Stage):
         self.include_attrs_for_hashes('particles')
         self.include_attrs_for_hashes('transform_groups')
         self.include_attrs_for_hashes('sum_grouped_flavints')
+        self.include_attrs_for_hashes('sparse_threshold')
 
     def validate_binning(self):
         input_basenames = set(self.input_binning.basenames)
@@ -287,7 +297,7 @@ class hist(Stage):
                 errors=(self.error_method not in [None, False])
             )
             # Extract just the numpy array to work with
-            true_event_counts = true_event_counts.hist
+            true_event_counts = true_event_counts.hist.copy()
 
             # If there weren't any events in the input (true_*) bin, make this
             # bin have no effect -- i.e., populate all output bins
@@ -307,7 +317,7 @@ class hist(Stage):
                 norm_factors = np.expand_dims(norm_factors, axis=-1)
 
             # Apply the normalization to the kernels
-            reco_kernel *= norm_factors
+            reco_kernel = reco_kernel * norm_factors
 
             assert np.all(reco_kernel >= 0), \
                     'number of elements less than 0 = %d' \
@@ -316,6 +326,16 @@ class hist(Stage):
             totals = np.sum(reco_kernel, axis=sum_over_axes)
             assert np.all(totals <= 1+1e-14), 'max = ' + str(np.max(totals)-1)
 
+            # Optionally convert to a sparse kernel (once for all transforms
+            # sharing it)
+            xform_class, kernel_errors = BinnedTensorTransform, None
+            if self.sparse_threshold is not None:
+                xform_class = SparseBinnedTensorTransform
+                reco_kernel, kernel_errors = to_sparse_kernel(
+                    reco_kernel, output_binning=self.output_binning,
+                    threshold=self.sparse_threshold
+                )
+
             # Now populate this transform to each input for which it applies.
 
             if self.sum_grouped_flavints:
@@ -328,12 +348,13 @@ class hist(Stage):
                 for output_name in self.output_names:
                     if output_name not in xform_flavints:
                         continue
-                    xform = BinnedTensorTransform(
+                    xform = xform_class(
                         input_names=xform_input_names,
                         output_name=output_name,
                         input_binning=self.input_binning,
                         output_binning=self.output_binning,
                         xform_array=reco_kernel,
+                        error_array=kernel_errors,
                         sum_inputs=self.sum_grouped_flavints
                     )
                     xforms.append(xform)
@@ -347,12 +368,13 @@ class hist(Stage):
                 for input_name in self.input_names:
                     if input_name not in xform_flavints:
                         continue
-                    xform = BinnedTensorTransform(
+                    xform = xform_class(
                         input_names=input_name,
                         output_name=input_name,
                         input_binning=self.input_binning,
                         output_binning=self.output_binning,
                         xform_array=reco_kernel,
+                        error_array=kernel_errors,
                     )
                     xforms.append(xform)
 
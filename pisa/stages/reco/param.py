@@ -17,7 +17,9 @@ from scipy.stats import norm
 from scipy import stats
 
 from pisa.core.stage import Stage
-from pisa.core.transform import BinnedTensorTransform, TransformSet
+from pisa.core.transform import (BinnedTensorTransform,
+                                 SparseBinnedTensorTransform,
+                                 TransformSet, to_sparse_kernel)
 from pisa.core.binning import basename
 from pisa.utils.fileio import from_file
 from pisa.utils.flavInt import flavintGroupsFromString, NuFlavIntGroup
@@ -402,6 +404,11 @@ class param(Stage):
         preferred `only_physics_domain_*` options, which means no correction of
         the energy resolution functions will be made.
 
+    sparse_threshold : None or float >= 0
+        If not None, apply the reconstruction kernels as
+        `SparseBinnedTensorTransform`s, dropping kernel entries whose value
+        does not exceed this threshold (0 drops only empty entries)
+
     transforms_cache_depth : int >= 0
 
     outputs_cache_depth : int >= 0
@@ -426,13 +433,17 @@ class param(Stage):
     def __init__(self, params, particles, input_names, transform_groups,
                  sum_grouped_flavints, input_binning, output_binning,
                  only_physics_domain_sum, only_physics_domain_distwise,
-                 coszen_flipback, error_method=None, transforms_cache_depth=20,
-                 outputs_cache_depth=20, memcache_deepcopy=False,
-                 debug_mode=None):
+                 coszen_flipback, error_method=None, sparse_threshold=None,
+                 transforms_cache_depth=20, outputs_cache_depth=20,
+                 memcache_deepcopy=False, debug_mode=None):
         assert particles in ['neutrinos', 'muons']
         self.particles = particles
         """Whether stage is instantiated to process neutrinos or muons"""
 
+        assert sparse_threshold is None or sparse_threshold >= 0
+        self.sparse_threshold = sparse_threshold
+        """Threshold for sparse reco kernels (None for dense kernels)"""
+
         self.transform_groups = flavintGroupsFromString(transform_groups)
         """Particle/interaction types to group for computing transforms"""
 
@@ -519,6 +530,7 @@ class param(Stage):
         self.include_attrs_for_hashes('only_physics_domain_sum')
         self.include_attrs_for_hashes('only_physics_domain_distwise')
         self.include_attrs_for_hashes('coszen_flipback')
+        self.include_attrs_for_hashes('sparse_threshold')
 
     def validate_binning(self):
         # Right now this can only deal with 2D energy / coszenith binning
@@ -877,6 +889,16 @@ class param(Stage):
                 reco_kernel = np.swapaxes(reco_kernel, 2, 3)
 
 
+            # Optionally convert to a sparse kernel (once for all transforms
+            # sharing it)
+            xform_class, kernel_errors = BinnedTensorTransform, None
+            if self.sparse_threshold is not None:
+                xform_class = SparseBinnedTensorTransform
+                reco_kernel, kernel_errors = to_sparse_kernel(
+                    reco_kernel, output_binning=self.output_binning,
+                    threshold=self.sparse_threshold
+                )
+
             if self.sum_grouped_flavints:
                 xform_input_names = []
                 for input_name in self.input_names:
@@ -887,12 +909,13 @@ class param(Stage):
                 for output_name in self.output_names:
                     if output_name not in xform_flavints:
                         continue
-                    xform = BinnedTensorTransform(
+                    xform = xform_class(
                         input_names=xform_input_names,
                         output_name=output_name,
                         input_binning=self.input_binning,
                         output_binning=self.output_binning,
                         xform_array=reco_kernel,
+                        error_array=kernel_errors,
                         sum_inputs=self.sum_grouped_flavints
                     )
                     xforms.append(xform)
@@ -910,12 +933,13 @@ class param(Stage):
                         logging.trace('  input: %s, output: %s, xform: %s',
                                       input_name, output_name, xform_flavints)
 
-                        xform = BinnedTensorTransform(
+                        xform = xform_class(
                             input_names=input_name,
                             output_name=output_name,
                             input_binning=self.input_binning,
                             output_binning=self.output_binning,
                             xform_array=reco_kernel,
+                            error_array=kernel_errors,
                             sum_inputs=self.sum_grouped_flavints
                         )
                         xforms.append(xform)
@@ -43,7 +43,9 @@ from numpy import inf # pylint: disable=unused-import
 from pisa import EPSILON, FTYPE, NUMBA_AVAIL, OMP_NUM_THREADS, numba_jit
 from pisa.core.binning import MultiDimBinning
 from pisa.core.stage import Stage
-from pisa.core.transform import BinnedTensorTransform, TransformSet
+from pisa.core.transform import (BinnedTensorTransform,
+                                 SparseBinnedTensorTransform,
+                                 TransformSet, to_sparse_kernel)
 
 from pisa.utils.comparisons import EQUALITY_SIGFIGS, isscalar
 from pisa.utils.fileio import mkdir, to_file
@@ -638,6 +640,11 @@ class vbwkde(Stage): # pylint: disable=invalid-name
         cached to disk by this service, _not_ the full transform (since the
         latter can be multiple GB, depending on input/output binning).
 
+    sparse_threshold : None or float >= 0
+        If not None, apply the reconstruction kernels as
+        `SparseBinnedTensorTransform`s, dropping kernel entries whose value
+        does not exceed this threshold (0 drops only empty entries)
+
     transforms_cache_depth : int >= 0
         Default is 1 since transforms for this service can be huge (gigabytes)
 
@@ -681,6 +688,7 @@ class vbwkde(Stage): # pylint: disable=invalid-name
                  tgt_max_binwidth_factors, energy_inbin_smoothing,
                  coszen_inbin_smoothing,
                  error_method=None,
+                 sparse_threshold=None,
                  disk_cache=False,
                  transforms_cache_depth=1,
                  outputs_cache_depth=20,
@@ -724,6 +732,9 @@ class vbwkde(Stage): # pylint: disable=invalid-name
             )
         self.sum_grouped_flavints = sum_grouped_flavints
 
+        assert sparse_threshold is None or sparse_threshold >= 0
+        self.sparse_threshold = sparse_threshold
+
         # `char_deps_downsampling` ...
 
         if isinstance(char_deps_downsampling, str):
@@ -916,6 +927,7 @@ class vbwkde(Stage): # pylint: disable=invalid-name
         self.include_attrs_for_hashes('tgt_max_binwidth_factors')
         self.include_attrs_for_hashes('energy_inbin_smoothing')
         self.include_attrs_for_hashes('coszen_inbin_smoothing')
+        self.include_attrs_for_hashes('sparse_threshold')
 
         self.kde_profiles = dict()
         """dict containing `KDEProfile`s. Structure is:
@@ -1012,6 +1024,15 @@ class vbwkde(Stage): # pylint: disable=invalid-name
                 if set(xform_flavints).intersection(input_flavs):
                     xform_input_names.append(input_name)
 
+            reco_kernel = self.xform_kernels[xform_flavints].hist
+            xform_class, kernel_errors = BinnedTensorTransform, None
+            if self.sparse_threshold is not None:
+                xform_class = SparseBinnedTensorTransform
+                reco_kernel, kernel_errors = to_sparse_kernel(
+                    reco_kernel, output_binning=self.output_binning,
+                    threshold=self.sparse_threshold
+                )
+
             for output_name in self.output_names:
                 if output_name not in xform_flavints:
                     continue
@@ -1019,12 +1040,13 @@ class vbwkde(Stage): # pylint: disable=invalid-name
                 logging.trace('  inputs: %s, output: %s, xform: %s',
                               xform_input_names, output_name, xform_flavints)
 
-                xform = BinnedTensorTransform(
+                xform = xform_class(
                     input_names=xform_input_names,
                     output_name=output_name,
                     input_binning=self.input_binning,
                     output_binning=self.output_binning,
-                    xform_array=self.xform_kernels[xform_flavints].hist,
+                    xform_array=reco_kernel,
+                    error_array=kernel_errors,
                     sum_inputs=True
                 )
                 xforms.append(xform)
@@ -1693,10 +1715,12 @@ class vbwkde(Stage): # pylint: disable=invalid-name
                     # At that coordinate, we broadcast the information from
                     # the `reco_coszen` dimension into the entire `reco_energy`
                     # dimension.
-                    kernel.hist[coszen_indexer] *= kernel_binning.broadcast(
-                        reco_coszen_fractions,
-                        from_dim='reco_coszen',
-                        to_dims=['reco_energy']
+                    kernel[coszen_indexer] = (
+                        kernel.hist[coszen_indexer] * kernel_binning.broadcast(
+                            reco_coszen_fractions,
+                            from_dim='reco_coszen',
+                            to_dims=['reco_energy']
+                        )
                     )
 
         with self._xform_kernels_lock:
@@ -7,7 +7,7 @@ from __future__ import absolute_import, print_function, division
 import numpy as np
 
 from pisa import FTYPE
-from pisa.core.pi_stage import PiStage
+from pisa.core.pi_stage import PiStage, derivative_key
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
 from pisa.utils import vectorizer
@@ -78,13 +78,17 @@ class pi_hist(PiStage):
     def setup_function(self):
         # create the variables to be filled in `apply`
         if self.error_method in ['sumw2']:
-            self.data.data_specs = self.input_specs
-            for container in self.data:
-                container['weights_squared'] = np.empty((container.size), dtype=FTYPE)
+            if self.input_mode == 'binned':
+                self.data.data_specs = self.input_specs
+                for container in self.data:
+                    container['weights_squared'] = np.empty((container.size), dtype=FTYPE)
             self.data.data_specs = self.output_specs
             for container in self.data:
                 container['errors'] = np.empty((container.size), dtype=FTYPE)
 
+    # the derivatives of the weights are histogrammed alongside the weights
+    propagates_derivatives = True
+
     @profile
     def apply(self):
         # this is special, we want the actual event weights in the histo
@@ -101,13 +105,17 @@ class pi_hist(PiStage):
                     vectorizer.sqrt(container['weights_squared'], out=container['errors'])
 
         elif self.input_mode == 'events':
+            self.data.data_specs = self.output_specs
             for container in self.data:
-                self.data.data_specs = self.input_specs
-                # calcualte errors
-                if self.error_method in ['sumw2']:
-                    vectorizer.square(container['weights'], out=container['weights_squared'])
-                self.data.data_specs = self.output_specs
-                container.array_to_binned('weights', self.output_specs, averaged=False)
+                # the sum of squared weights (for the errors) is obtained in
+                # the same pass over the events
                 if self.error_method in ['sumw2']:
-                    container.array_to_binned('weights_squared', self.output_specs, averaged=False)
+                    container.array_to_binned('weights', self.output_specs, averaged=False,
+                                              sumw2_key='weights_squared')
                     vectorizer.sqrt(container['weights_squared'], out=container['errors'])
+                else:
+                    container.array_to_binned('weights', self.output_specs, averaged=False)
+                for name in self.derivative_params:
+                    key = derivative_key('weights', name)
+                    if key in container.array_data:
+                        container.array_to_binned(key, self.output_specs, averaged=False)
@@ -98,6 +98,32 @@ class genie_sys(PiStage): # pylint: disable=invalid-name
         assert self.calc_mode is None
         assert self.output_mode is not None
 
+    propagates_derivatives = True
+
+    @property
+    def analytic_derivative_params(self):
+        return ('Genie_Ma_QE', 'Genie_Ma_RES')
+
+    def apply_derivatives_function(self):
+        genie_ma_qe = self.params.Genie_Ma_QE.m_as('dimensionless')
+        genie_ma_res = self.params.Genie_Ma_RES.m_as('dimensionless')
+
+        for container in self.data:
+            linear_qe = container['linear_fit_maccqe'].get('host')
+            quad_qe = container['quad_fit_maccqe'].get('host')
+            linear_res = container['linear_fit_maccres'].get('host')
+            quad_res = container['quad_fit_maccres'].get('host')
+            qe_factor = 1. + (linear_qe + quad_qe * genie_ma_qe) * genie_ma_qe
+            res_factor = 1. + (linear_res + quad_res * genie_ma_res) * genie_ma_res
+            self.scale_weight_derivatives(
+                container,
+                qe_factor * res_factor,
+                {
+                    'Genie_Ma_QE': (linear_qe + 2. * quad_qe * genie_ma_qe) * res_factor,
+                    'Genie_Ma_RES': qe_factor * (linear_res + 2. * quad_res * genie_ma_res),
+                }
+            )
+
     @profile
     def apply_function(self):
         genie_ma_qe = self.params.Genie_Ma_QE.m_as('dimensionless')
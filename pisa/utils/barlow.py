@@ -16,7 +16,7 @@ import sys
 import numpy as np
 from scipy.optimize import minimize
 
-__all__ = ['Likelihoods']
+__all__ = ['Likelihoods', 'test_Likelihoods']
 __author__ = 'Michael Larson'
 __email__ = 'mlarson@nbi.ku.dk'
 __date__ = '2016-03-14'
@@ -200,11 +200,9 @@ class Likelihoods(object):
         unweighted histograms. You can choose between "Poisson" and "Barlow"
         likelihoods at the moment.
 
-        If using the "Barlow" LLH, note that the method is picked to be Powell
-        with 25 iterations maximum per step. This is not optimized at all and
-        was explicitly chosen simply because it "worked". This doesn't work
-        with the bounds set in the normal way, so the positive-definiteness of
-        the rates is enforced in the get_llh_barlow_bin method.
+        If using the "Barlow" LLH, the best-fit expected rates are found for
+        all bins at once by the fit_barlow_rates method, instead of running a
+        minimizer in each bin.
 
         """
         llh_type = llh_type.lower()
@@ -217,24 +215,12 @@ class Likelihoods(object):
             return poisson_llh
 
         # The more complicated case: The Barlow LLH
-        # This requires a separate minimization step in each bin to estimate
-        #  the expected rate in each bin from each MC sample using constraints
-        #  from the data and the observed MC distribution.
+        # This requires estimating the expected rate in each bin from each MC
+        #  sample using constraints from the data and the observed MC
+        #  distribution.
         elif llh_type == "barlow":
-            llh = 0
-            for bin_n in range(len(self.data_histogram)):
-                self.current_bin = bin_n
-                bin_result = minimize(
-                    fun=self.get_llh_barlow_bin,
-                    x0=self.bestfit_plots[:, bin_n],
-                    method="Powell",
-                    options={'maxiter': 25, 'disp': False}
-                )
-                self.bestfit_plots[:, bin_n] = bin_result.x
-                llh += bin_result.fun
-
-            self.current_bin = None
-            return llh
+            self.bestfit_plots = self.fit_barlow_rates()
+            return self.get_llh_barlow(self.bestfit_plots)
 
         raise ArgValueError(
             'Unknown `llh_type` "{}". Choose either "Poisson" (ideal) or'
@@ -242,6 +228,77 @@ class Likelihoods(object):
             .format(llh_type)
         )
 
+    def fit_barlow_rates(self, tol=1e-12, maxiter=100):
+        """Find the expected number of events from each MC sample in each bin
+        that maximize the Barlow LLH, for all bins simultaneously.
+
+        As shown by Barlow and Beeston, the maximum in bin i lies at
+        A_ji = a_ji / (1 + w_ji * t_i) with 1 - t_i = d_i / f_i, where f_i is
+        the total weighted expectation. This leaves a single equation for t_i
+        in each bin, which is solved with a vectorized Newton iteration (see
+        `_solve_barlow_t`). If the sample with the largest weight in a bin has
+        no MC events, the maximum can instead lie at t_i = -1/w_ki with a
+        non-zero rate for that sample (the "special case" of the paper).
+
+        Returns the rates as an array of shape (n_samples, n_bins).
+
+        """
+        w = np.asarray(self.mc_histograms, dtype=np.float64)
+        a = np.asarray(self.unweighted_histograms, dtype=np.float64)
+        d = np.asarray(self.data_histogram, dtype=np.float64)
+        populated = a > 0
+
+        # Empty data bins have their maximum at t = 1. If no populated sample
+        # carries any weight, the rates are A = a whatever t is.
+        w_populated = np.max(np.where(populated, w, 0.), axis=0)
+        t = np.where(d > 0, 0., 1.)
+        solve = np.flatnonzero((d > 0) & (w_populated > 0))
+        t[solve] = _solve_barlow_t(
+            w[:, solve], a[:, solve], d[solve], -1. / w_populated[solve],
+            tol=tol, maxiter=maxiter
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(populated, a / (1. + w * t), 0.)
+
+        # The special case. Bins without any weighted MC events keep zero
+        # rates, since get_llh_barlow_bin drops the data term for f = 0.
+        w_empty = np.where(populated, -np.inf, w)
+        k = np.argmax(w_empty, axis=0)
+        w_k = w_empty[k, np.arange(len(d))]
+        special = np.flatnonzero((d > 0) & (w_populated > 0)
+                                 & (w_k > w_populated))
+        if special.size:
+            w_s, a_s, k_s = w[:, special], a[:, special], k[special]
+            t_s = -1. / w_k[special]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rates_s = np.where(populated[:, special],
+                                   a_s / (1. + w_s * t_s), 0.)
+            f_s = d[special] / (1. - t_s)
+            rate_k = (f_s - np.sum(w_s * rates_s, axis=0)) / w_k[special]
+            accept = rate_k > 0
+            rates_s[k_s, np.arange(special.size)] = rate_k
+            rates[:, special[accept]] = rates_s[:, accept]
+
+        return rates
+
+    def get_llh_barlow(self, rates):
+        """The Barlow LLH summed over all bins for the expected number of
+        events `rates` (of shape (n_samples, n_bins)) in each MC sample. This
+        is the vectorized equivalent of summing get_llh_barlow_bin over the
+        bins; all rates must be non-negative."""
+        di = self.data_histogram
+        ai = self.unweighted_histograms
+        fi = np.sum(np.multiply(self.mc_histograms, rates), axis=0)
+
+        # See get_llh_barlow_bin for the individual terms
+        with np.errstate(divide='ignore', invalid='ignore'):
+            llh = np.sum(np.where(fi > 0, di * np.log(fi) - fi, 0.))
+            llh -= np.sum(np.where(di > 0, di * np.log(di) - di, 0.))
+            llh += np.sum(np.where(rates > 0, ai * np.log(rates) - rates, 0.))
+            llh -= np.sum(np.where(ai > 0, ai * np.log(ai) - ai, 0.))
+
+        return -llh
+
     def get_llh_barlow_bin(self, a_i):
         """The Barlow LLH finds the best-fit "expected" MC distribution using
         both the data and observed MC as constraints. Each bin is independent
@@ -304,3 +361,100 @@ class Likelihoods(object):
         llh -= np.sum(di[cut] * np.log(di[cut]) - di[cut])
 
         return -llh
+
+
+def _solve_barlow_t(w, a, d, t_min, tol=1e-12, maxiter=100):
+    """Solve sum_j(w_j * a_j / (1 + w_j * t)) = d / (1 - t) for t in each bin
+    (column) of the (n_samples, n_bins) arrays `w` and `a`.
+
+    The left hand side diverges at `t_min` = -1/max(w_j | a_j > 0) and the
+    difference of both sides decreases strictly towards t = 1, so there is a
+    single root in (t_min, 1). It is found by Newton's method, falling back to
+    bisection of the bracketing interval whenever a step would leave it.
+
+    """
+    populated = a > 0
+    lo, hi = t_min, np.ones_like(d)
+
+    # Start from the nominal expectation
+    t = 1. - d / np.sum(w * a, axis=0)
+    t = np.where((t > lo) & (t < hi), t, 0.5 * (lo + hi))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(maxiter):
+            denom = 1. + w * t
+            terms = np.where(populated, w * a / denom, 0.)
+            score = np.sum(terms, axis=0) - d / (1. - t)
+            slope = -np.sum(terms * w / denom, axis=0) - d / (1. - t)**2
+
+            lo = np.where(score > 0, t, lo)
+            hi = np.where(score > 0, hi, t)
+            t_new = t - score / slope
+            t_new = np.where((t_new > lo) & (t_new < hi), t_new,
+                             0.5 * (lo + hi))
+
+            converged = np.abs(t_new - t) <= tol * (1. + np.abs(t))
+            t = t_new
+            if np.all(converged):
+                break
+
+    return t
+
+
+def test_Likelihoods():
+    """Vectorized Barlow fit must find the same (or a better) maximum as the
+    per-bin minimization, and report the speedup over it"""
+    import time
+    from pisa.utils.log import logging
+
+    rand = np.random.RandomState(0)
+    shape = (30, 20)
+    n_samples = 3
+    unweighted = rand.poisson(8, (n_samples,) + shape).astype(np.float64)
+    mc = rand.uniform(0.05, 1., (n_samples,) + shape)
+    data = rand.poisson(np.sum(mc * unweighted, axis=0)).astype(np.float64)
+    # empty data bins, empty MC samples and the Barlow-Beeston special case
+    data[0, :5] = 0
+    unweighted[0, 1, :5] = 0
+    unweighted[:, 2, :5] = 0
+    unweighted[2, 3, :5] = 0
+    mc[2, 3, :5] = 5.
+    data[3, :5] = 40
+
+    likelihoods = Likelihoods()
+    likelihoods.set_data(data)
+    likelihoods.set_mc(mc)
+    likelihoods.set_unweighted(unweighted)
+
+    t0 = time.time()
+    llh = likelihoods.get_llh('barlow')
+    t1 = time.time()
+    rates = likelihoods.bestfit_plots
+    assert np.all(rates >= 0)
+
+    # Reference: the per-bin minimization
+    ref_llh = 0
+    n_bins = likelihoods.data_histogram.size
+    for bin_n in range(n_bins):
+        likelihoods.current_bin = bin_n
+        ref = minimize(
+            fun=likelihoods.get_llh_barlow_bin,
+            x0=likelihoods.unweighted_histograms[:, bin_n],
+            method="Powell",
+            options={'xtol': 1e-10, 'ftol': 1e-12, 'disp': False}
+        )
+        fun = likelihoods.get_llh_barlow_bin(rates[:, bin_n])
+        assert fun <= ref.fun + 1e-8, (bin_n, fun, ref.fun)
+        ref_llh += ref.fun
+    t2 = time.time()
+    assert np.isclose(llh, ref_llh, rtol=1e-8, atol=1e-6), (llh, ref_llh)
+
+    logging.info('Barlow LLH with %d bins: minimize %.3f s, vectorized %.6f s',
+                 n_bins, t2 - t1, t1 - t0)
+    logging.info('<< PASS : test_Likelihoods >>')
+
+
+if __name__ == '__main__':
+    from pisa.utils.log import set_verbosity
+    set_verbosity(1)
+    test_Likelihoods()
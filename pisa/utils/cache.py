@@ -1,25 +1,42 @@
 """
-MemoryCache and DiskCache classes to store long-to-compute results.
+MemoryCache, DiskCache, and ArrayDiskCache classes to store long-to-compute
+results.
 """
 
 
 from __future__ import absolute_import
 
 from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
 import copy
+import itertools
+import mmap
+from numbers import Number
 import os
 import pickle
 import re
 import sqlite3
 import shutil
+import sys
 import tempfile
 import time
+import weakref
+import zlib
 
+import numpy as np
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from pisa import MEMCACHE_MAX_BYTES
+from pisa.utils.hash import hash_obj
 from pisa.utils.log import logging, set_verbosity
 
 
-__all__ = ['MemoryCache', 'DiskCache',
-           'test_MemoryCache', 'test_DiskCache']
+__all__ = ['get_nbytes', 'MemoryCache', 'DiskCache', 'ArrayDiskCache',
+           'test_MemoryCache', 'test_DiskCache', 'test_ArrayDiskCache']
 
 __author__ = 'J.L. Lanfranchi'
 
@@ -38,10 +55,79 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
  limitations under the License.'''
 
 
+def get_nbytes(obj, _seen=None):
+    """Estimate the memory held by `obj`, dominated for PISA objects (e.g.
+    Maps, MapSets, Transforms and TransformSets) by the `nbytes` of the numpy
+    arrays they contain.
+
+    Containers and objects' attributes are searched recursively (counting each
+    object once); other objects are counted by their `sys.getsizeof`.
+
+    Parameters
+    ----------
+    obj : object
+
+    Returns
+    -------
+    nbytes : int
+
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        nbytes = obj.nbytes
+        if obj.dtype == np.object_:
+            # e.g. `uncertainties` objects, which are all alike; estimate from
+            # the first
+            nbytes += obj.size * (sys.getsizeof(obj.flat[0]) if obj.size
+                                  else 0)
+        return nbytes
+    if isinstance(obj, (str, bytes, Number)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, Mapping):
+        return sys.getsizeof(obj) + sum(
+            get_nbytes(k, _seen) + get_nbytes(v, _seen) for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(get_nbytes(v, _seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + get_nbytes(vars(obj), _seen)
+    return sys.getsizeof(obj)
+
+
+def _compress(data, compression):
+    if compression is None:
+        return data
+    if compression == 'zlib':
+        return zlib.compress(data, 1)
+    if compression == 'lz4':
+        return lz4.frame.compress(data)
+    raise ValueError('Unknown compression "%s"' % compression)
+
+
+def _decompress(data, compression):
+    if compression is None:
+        return data
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    if compression == 'lz4':
+        return lz4.frame.decompress(data)
+    raise ValueError('Unknown compression "%s"' % compression)
+
+
 class MemoryCache(object):
     """Simple implementation of a first-in-first-out (FIFO) or least-recently-
     used (LRU) in-memory cache, with a subset of the dict interface.
 
+    Entries are evicted to keep both their number and (optionally) their total
+    size (as estimated by `get_nbytes`) within limits, where the latter limit
+    can apply to each cache separately and/or to all caches of the process
+    together.
+
     Parameters
     ----------
     max_depth : int >= 0
@@ -58,33 +144,60 @@ class MemoryCache(object):
         returned from the cache. This can guard aganst an object in the cache
         being modifed after it has been stored to the cache.
 
+    max_bytes : None or int >= 0
+        Maximum total size of the entries in the cache; None for no limit.
+        Entries larger than this are not stored at all.
+
     Class attributes
     ----------------
     GLOBAL_MEMCACHE_DEPTH_OVERRIDE : None or int >= 0
         Set to an integer to override the cache depth for *all* memory caches.
         E.g., set this to 0 to disable caching everywhere.
 
+    GLOBAL_MEMCACHE_MAX_BYTES : None or int >= 0
+        Maximum total size of the entries of *all* memory caches in the
+        process; when exceeded, the least recently used (or, for FIFO caches,
+        the oldest) entries across all caches are evicted first. Defaults to
+        `pisa.MEMCACHE_MAX_BYTES` (set via the `PISA_MEMCACHE_MAX_BYTES`
+        environment variable); None for no limit.
+
     Notes
     -----
     Based off of code at www.kunxi.org/blog/2014/05/lru-cache-in-python
 
     """
     GLOBAL_MEMCACHE_DEPTH_OVERRIDE = None
-    def __init__(self, max_depth, is_lru=True, deepcopy=False):
+    GLOBAL_MEMCACHE_MAX_BYTES = MEMCACHE_MAX_BYTES
+
+    _instances = weakref.WeakSet()
+    _ticks = itertools.count()
+
+    def __init__(self, max_depth, is_lru=True, deepcopy=False,
+                 max_bytes=None):
+        # key -> [value, nbytes, tick], ordered by tick
         self.__cache = OrderedDict()
         self.__max_depth = max_depth
         self.__is_lru = is_lru
         self.__deepcopy = deepcopy
+        self.__max_bytes = max_bytes
+        self.__nbytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
         if self.GLOBAL_MEMCACHE_DEPTH_OVERRIDE is not None:
             self.__max_depth = self.GLOBAL_MEMCACHE_DEPTH_OVERRIDE
         assert isinstance(self.__max_depth, int), \
                 '`max_depth` must be int; got %s' % type(self.__max_depth)
         assert self.__max_depth >= 0, \
                 '`max_depth` must be >= 0; got %s' % self.__max_depth
+        assert max_bytes is None or max_bytes >= 0, \
+                '`max_bytes` must be None or >= 0; got %s' % max_bytes
+        self._instances.add(self)
 
     def __str__(self):
-        return 'MemoryCache(max_depth=%d, is_lru=%s)' % (self.__max_depth,
-                                                         self.__is_lru)
+        return 'MemoryCache(max_depth=%d, is_lru=%s, max_bytes=%s)' % (
+            self.__max_depth, self.__is_lru, self.__max_bytes
+        )
 
     def __repr__(self):
         return str(self) + '; %d keys:\n%s' % (len(self.__cache),
@@ -95,10 +208,16 @@ class MemoryCache(object):
             raise KeyError(
                 '`None` is not a valid cache key, so nothing can live there.'
             )
-        value = self.__cache[key]
+        try:
+            entry = self.__cache[key]
+        except KeyError:
+            self.__misses += 1
+            raise
+        self.__hits += 1
         if self.__is_lru:
-            del self.__cache[key]
-            self.__cache[key] = value
+            self.__cache.move_to_end(key)
+            entry[2] = next(self._ticks)
+        value = entry[0]
         if self.__deepcopy:
             value = copy.deepcopy(value)
         return value
@@ -111,20 +230,78 @@ class MemoryCache(object):
         if self.__max_depth == 0:
             return
         # Same logic here for LRU and FIFO
-        try:
-            del self.__cache[key]
-        except KeyError:
-            if len(self) >= self.__max_depth:
-                self.__cache.popitem(last=False)
+        if key in self.__cache:
+            self.__remove(key)
         if self.__deepcopy:
             value = copy.deepcopy(value)
-        self.__cache[key] = value
+
+        nbytes = 0
+        if (self.__max_bytes is not None
+                or self.GLOBAL_MEMCACHE_MAX_BYTES is not None):
+            nbytes = get_nbytes(value)
+            budgets = [b for b in (self.__max_bytes,
+                                   self.GLOBAL_MEMCACHE_MAX_BYTES)
+                       if b is not None]
+            if nbytes > min(budgets):
+                logging.debug('Not caching object of %d bytes, exceeding the'
+                              ' cache budget of %d bytes', nbytes,
+                              min(budgets))
+                return
+
+        while len(self.__cache) >= self.__max_depth:
+            self.__evict_oldest()
+        if self.__max_bytes is not None:
+            while self.__nbytes + nbytes > self.__max_bytes:
+                self.__evict_oldest()
+        if self.GLOBAL_MEMCACHE_MAX_BYTES is not None:
+            self._evict_global(self.GLOBAL_MEMCACHE_MAX_BYTES - nbytes)
+
+        self.__cache[key] = [value, nbytes, next(self._ticks)]
+        self.__nbytes += nbytes
+
+    def __remove(self, key):
+        """Remove entry `key` and return its value"""
+        value, nbytes, _ = self.__cache.pop(key)
+        self.__nbytes -= nbytes
+        return value
+
+    def __evict_oldest(self):
+        """Evict the least recently used (LRU) or oldest (FIFO) entry"""
+        self.__remove(next(iter(self.__cache)))
+        self.__evictions += 1
+
+    def _oldest_tick(self):
+        """Tick of the least recently used (LRU) or oldest (FIFO) entry; None
+        if the cache is empty"""
+        if not self.__cache:
+            return None
+        return self.__cache[next(iter(self.__cache))][2]
+
+    @classmethod
+    def _evict_global(cls, max_bytes):
+        """Evict the oldest entries across all caches until their total size
+        does not exceed `max_bytes`"""
+        caches = list(cls._instances)
+        total = sum(cache.nbytes for cache in caches)
+        while total > max_bytes:
+            ticks = [(cache._oldest_tick(), i) # pylint: disable=protected-access
+                     for i, cache in enumerate(caches)]
+            ticks = [t for t in ticks if t[0] is not None]
+            if not ticks:
+                break
+            cache = caches[min(ticks)[1]]
+            nbytes = cache.nbytes
+            cache.__evict_oldest() # pylint: disable=protected-access
+            total -= nbytes - cache.nbytes
 
     def __contains__(self, key):
-        return key in self.__cache
+        if key in self.__cache:
+            return True
+        self.__misses += 1
+        return False
 
     def __delitem__(self, key):
-        return self.__cache.__delitem__(self, key)
+        self.__remove(key)
 
     def __iter__(self):
         return iter(self.__cache)
@@ -135,25 +312,50 @@ class MemoryCache(object):
     def __reversed__(self):
         return reversed(self.__cache)
 
+    @property
+    def nbytes(self):
+        """int : Total estimated size of the cached entries (only tracked if
+        a per-cache or global byte budget is set)"""
+        return self.__nbytes
+
+    @property
+    def hits(self):
+        """int : Number of successful lookups"""
+        return self.__hits
+
+    @property
+    def misses(self):
+        """int : Number of lookups (including membership tests) of keys not
+        in the cache"""
+        return self.__misses
+
+    @property
+    def evictions(self):
+        """int : Number of entries removed to respect the cache's limits"""
+        return self.__evictions
+
     def clear(self):
-        return self.__cache.clear()
+        self.__cache.clear()
+        self.__nbytes = 0
 
     def get(self, key, dflt=None):
         if key in self.__cache:
             return self[key]
+        self.__misses += 1
         return dflt
 
     def keys(self):
         return self.__cache.keys()
 
     def pop(self, k):
-        value = self.__cache.pop(k)
+        value = self.__remove(k)
         if self.__deepcopy:
             value = copy.deepcopy(value)
         return value
 
     def popitem(self, last=True):
-        return self.pop(last)
+        key = next(reversed(self.__cache)) if last else next(iter(self.__cache))
+        return key, self.pop(key)
 
     def setdefault(self, key, default=None):
         if not key in self:
@@ -161,7 +363,7 @@ class MemoryCache(object):
         return self[key]
 
     def values(self):
-        vals = self.__cache.values()
+        vals = [entry[0] for entry in self.__cache.values()]
         if self.__deepcopy:
             vals = [copy.deepcopy(v) for v in vals]
         return vals
@@ -172,11 +374,20 @@ class DiskCache(object):
     Implements a subset of dict methods but with persistent storage to an on-
     disk sqlite database.
 
+    Small objects are stored (pickled) in the database itself. Objects whose
+    pickled size reaches `blob_threshold` are stored in side files in the
+    directory `<db_fpath>.blobs`, with only metadata kept in the database.
+    Uncompressed side files keep the contiguous numpy arrays within an object
+    separate from the rest of its pickle (pickle protocol 5), such that these
+    are memory-mapped (copy-on-write) rather than read and copied upon
+    retrieval.
+
     Parameters
     ----------
     db_fpath : str
         Path to database file; if existing file is specified, schema must match
-        that specified by DiskCache.TABLE_SCHEMA.
+        that specified by DiskCache.TABLE_SCHEMA. (Databases created by
+        earlier versions of this class are emptied and upgraded.)
 
     max_depth : int
         Limit on the number of rows in the database's table. Pruning is either
@@ -184,16 +395,38 @@ class DiskCache(object):
 
     is_lru : bool
         If True, implement least-recently-used (LRU) logic for removing items
-        beyond `max_depth`. This adds an additional ~400 ms to item retrieval
-        time. Otherwise, behaves as a first-in-first-out (FIFO) cache.
+        beyond `max_depth`. This adds a database write to item retrieval.
+        Otherwise, behaves as a first-in-first-out (FIFO) cache.
+
+    compression : None or str
+        One of DiskCache.COMPRESSIONS ('zlib' or, if the `lz4` package is
+        installed, 'lz4') to compress stored objects, or None to store them
+        uncompressed. Compressed objects cannot be memory-mapped.
+
+    blob_threshold : int >= 0
+        Pickled size (in bytes) from which objects are stored in side files
+        rather than in the database.
+
+    evict_batch : None or int in [1, max_depth]
+        Once `max_depth` is exceeded, this many entries (minus one) beyond
+        the excess are pruned at once, such that pruning only needs to happen
+        every `evict_batch` insertions. If None, defaults to 1/10 of
+        `max_depth`.
 
     Notes
     -----
-    This is not (as of now) thread-safe, but it is multi-process safe. The
-    Python sqlite3 api requires a single Python process to have just a single
-    connection to a database at a time. Several processes can be safely
-    connected to the database simultaneously, however, due to sqlite's locking
-    mechanisms that resolve resource contention.
+    This is not (as of now) thread-safe, but it is multi-process safe. Each
+    process keeps a single persistent connection to the database (reopened
+    in processes forked after it was opened), and the database is kept in
+    write-ahead-log (WAL) mode, such that readers do not block writers nor
+    vice versa. Insertions and deletions are done in immediate transactions
+    which resolve contention between several processes (e.g. jobs on a
+    cluster node sharing a CACHE_DIR; WAL mode requires all processes using a
+    database to be on the same host, so it must not be shared via a network
+    file system). Side files are written under unique names before being
+    registered in the database and removed only after having been
+    unregistered, so they are never seen partially written; a file removed by
+    another process while being looked up results in a cache miss.
 
     Large databases are slower to work with than small. Therefore it is
     recommended to use separate databases for each stage's cache rather than
@@ -209,7 +442,7 @@ class DiskCache(object):
     >>> disk_cache[13] = x
     >>> disk_cache[14] = x
     >>> y = disk_cache[12]
-    >>> print y == x
+    >>> print(y == x)
     True
     >>> len(disk_cache)
     3
@@ -234,61 +467,96 @@ class DiskCache(object):
 
     """
     TABLE_SCHEMA = \
+        '''CREATE TABLE cache (hash INTEGER PRIMARY KEY,
+                               accesstime INTEGER,
+                               data BLOB,
+                               blob TEXT,
+                               compression TEXT)'''
+    LEGACY_TABLE_SCHEMA = \
         '''CREATE TABLE cache (hash INTEGER PRIMARY KEY,
                                accesstime INTEGER,
                                data BLOB)'''
-    def __init__(self, db_fpath, max_depth=100, is_lru=False):
+    META_SCHEMA = 'CREATE TABLE meta (count INTEGER)'
+    COMPRESSIONS = ('zlib', 'lz4')
+    BLOB_ALIGNMENT = 64
+
+    def __init__(self, db_fpath, max_depth=100, is_lru=False,
+                 compression=None, blob_threshold=2**16, evict_batch=None):
         self.__db_fpath = os.path.expandvars(os.path.expanduser(db_fpath))
-        self.__instantiate_db()
+        self.__blob_dirpath = self.__db_fpath + '.blobs'
+        self.__conn = None
+        self.__conn_pid = None
+        self.__forked_conns = []
         assert 0 < max_depth < 1e6, 'Invalid `max_depth`:' + str(max_depth)
+        if compression not in (None,) + self.COMPRESSIONS:
+            raise ValueError('`compression` must be None or one of %s; got %s'
+                             % (self.COMPRESSIONS, compression))
+        if compression == 'lz4' and lz4 is None:
+            raise ImportError('`compression`="lz4" requires the lz4 package')
+        if evict_batch is None:
+            evict_batch = max(1, max_depth // 10)
+        assert 1 <= evict_batch <= max_depth, \
+                'Invalid `evict_batch`:' + str(evict_batch)
         self.__max_depth = max_depth
         self.__is_lru = is_lru
+        self.__compression = compression
+        self.__blob_threshold = blob_threshold
+        self.__evict_batch = evict_batch
+        self.__instantiate_db()
 
     @property
     def path(self):
         return self.__db_fpath
 
-    def __instantiate_db(self):
-        exists = True if os.path.isfile(self.__db_fpath) else False
+    def __getstate__(self):
+        # Connections cannot be pickled; reconnect wherever unpickled
+        state = self.__dict__.copy()
+        state['_DiskCache__conn'] = None
+        state['_DiskCache__conn_pid'] = None
+        state['_DiskCache__forked_conns'] = []
+        return state
 
-        # Create the directory in with the database file will be created
-        if not exists:
-            dirpath, _ = os.path.split(self.__db_fpath)
-            if not os.path.isdir(dirpath) and dirpath != '':
-                os.makedirs(dirpath)
-
-        conn = self.__connect()
-        try:
-            if exists:
-                # Check that the table format is valid
-                sql = ("SELECT sql FROM sqlite_master WHERE type='table' AND"
-                       " NAME='cache'")
-                cursor = conn.execute(sql)
-                schema, = cursor.fetchone()
-                # Ignore formatting
-                schema = re.sub(r'\s', '', schema).lower()
+    def __instantiate_db(self):
+        # Create the directories in which the database file and side files
+        # will be created
+        if not os.path.isdir(self.__blob_dirpath):
+            os.makedirs(self.__blob_dirpath, exist_ok=True)
+
+        with self.__transaction() as conn:
+            sql = ("SELECT sql FROM sqlite_master WHERE type='table' AND"
+                   " NAME='cache'")
+            row = conn.execute(sql).fetchone()
+            if row is not None:
+                # Check that the table format is valid (ignoring formatting)
+                schema = re.sub(r'\s', '', row[0]).lower()
                 ref_schema = re.sub(r'\s', '', self.TABLE_SCHEMA).lower()
-                if schema != ref_schema:
+                legacy_schema = re.sub(r'\s', '',
+                                       self.LEGACY_TABLE_SCHEMA).lower()
+                if schema == legacy_schema:
+                    logging.warning('Emptying disk cache "%s" created by an'
+                                    ' earlier version of PISA',
+                                    self.__db_fpath)
+                    conn.execute('DROP TABLE cache')
+                    row = None
+                elif schema != ref_schema:
                     raise ValueError('Existing database at "%s" has'
                                      'non-matching schema:\n"""%s"""'
                                      %(self.__db_fpath, schema))
-            else:
-                # Create the table for storing (hash, data, timestamp) tuples
+            if row is None:
+                # Create the table for storing (hash, timestamp, data, side
+                # file, compression) tuples and the one keeping the number of
+                # entries, which is too slow to count on every insertion
                 conn.execute(self.TABLE_SCHEMA)
-                sql = "CREATE INDEX idx0 ON cache(hash)"
-                conn.execute(sql)
                 sql = "CREATE INDEX idx1 ON cache(accesstime)"
                 conn.execute(sql)
-                conn.commit()
-        except:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+                conn.execute('DROP TABLE IF EXISTS meta')
+                conn.execute(self.META_SCHEMA)
+                conn.execute('INSERT INTO meta (count) VALUES (0)')
 
     def __str__(self):
-        s = 'DiskCache(db_fpath=%s, max_depth=%d, is_lru=%s)' % \
-                (self.__db_fpath, self.__max_depth, self.__is_lru)
+        s = ('DiskCache(db_fpath=%s, max_depth=%d, is_lru=%s,'
+             ' compression=%s)' % (self.__db_fpath, self.__max_depth,
+                                   self.__is_lru, self.__compression))
         return s
 
     def __repr__(self):
@@ -299,123 +567,166 @@ class DiskCache(object):
             raise KeyError(
                 '`None` is not a valid cache key, so nothing can live there.'
             )
-        t0 = time.time()
         if not isinstance(key, int):
             raise KeyError('`key` must be int, got "%s"' % type(key))
-        conn = self.__connect()
+        t0 = time.time()
+        conn = self.__connection
+        if self.__is_lru:
+            # Update accesstime
+            sql = "UPDATE cache SET accesstime = ? WHERE hash = ?"
+            conn.execute(sql, (self.now, key))
+
+        # Retrieve contents
+        sql = "SELECT data, blob, compression FROM cache WHERE hash = ?"
+        row = conn.execute(sql, (key,)).fetchone()
+        if row is None:
+            raise KeyError(str(key))
         t1 = time.time()
-        logging.trace('conn: %0.4f' % (t1 - t0))
+        logging.trace('select: % 0.4f' % (t1 - t0))
         try:
-            if self.__is_lru:
-                # Update accesstime
-                sql = "UPDATE cache SET accesstime = ? WHERE hash = ?"
-                conn.execute(sql, (self.now, key))
-                t2 = time.time()
-                logging.trace('update: % 0.4f' % (t2 - t1))
-            t2 = time.time()
-
-            # Retrieve contents
-            sql = "SELECT data FROM cache WHERE hash = ?"
-            cursor = conn.execute(sql, (key,))
-            t3 = time.time()
-            logging.trace('select: % 0.4f' % (t3 - t2))
-            tmp = cursor.fetchone()
-            if tmp is None:
-                raise KeyError(str(key))
-            data = tmp[0]
-            t4 = time.time()
-            logging.trace('fetch: % 0.4f' % (t4 - t3))
-            data = pickle.loads(bytes(data))
-            t5 = time.time()
-            logging.trace('loads: % 0.4f' % (t5 - t4))
-        finally:
-            conn.commit()
-            conn.close()
-            logging.trace('')
-        return data
+            obj = self.__load(*row)
+        except FileNotFoundError:
+            # Side file was removed by another process after the lookup
+            raise KeyError(str(key))
+        logging.trace('load: % 0.4f' % (time.time() - t1))
+        return obj
 
     def __setitem__(self, key, obj):
         if key is None:
             raise KeyError(
                 '`None` is not a valid cache key, so nothing can live there.'
             )
-        t0 = time.time()
         assert isinstance(key, int)
-        data = sqlite3.Binary(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+        t0 = time.time()
+        data, blob = self.__dump(obj)
         t1 = time.time()
-        logging.trace('dumps: % 0.4f' % (t1 - t0))
+        logging.trace('dump: % 0.4f' % (t1 - t0))
 
-        conn = self.__connect()
-        t2 = time.time()
-        logging.trace('conn: % 0.4f' % (t2 - t1))
         try:
-            t = time.time()
-            sql = "INSERT INTO cache (hash, accesstime, data) VALUES (?, ?, ?)"
-            conn.execute(sql, (key, self.now, data))
-            t1 = time.time()
-            logging.trace('insert: % 0.4f' % (t1 - t))
-            conn.commit()
-            t2 = time.time()
-            logging.trace('commit: % 0.4f' % (t2 - t1))
-
-            # Remove oldest-accessed rows in excess of limit
-            n_to_remove = len(self) - self.__max_depth
-            t3 = time.time()
-            logging.trace('len: % 0.4f' % (t3 - t2))
-            if n_to_remove <= 0:
-                return
-
-            # Find the access time of the n-th element (sorted ascending by
-            # access time)
-            sql = ("SELECT accesstime FROM cache ORDER BY accesstime ASC LIMIT"
-                   " 1 OFFSET ?")
-            cursor = conn.execute(sql, (n_to_remove,))
-            t4 = time.time()
-            logging.trace('select old: % 0.4f' % (t4 - t3))
-            nth_access_time, = cursor.fetchone()
-            t5 = time.time()
-            logging.trace('fetch: % 0.4f' % (t5 - t4))
-
-            # Remove all elements that old or older
-            sql = "DELETE FROM cache WHERE accesstime < ?"
-            conn.execute(sql, (nth_access_time,))
-            t6 = time.time()
-            logging.trace('delete: % 0.4f' % (t6 - t5))
+            with self.__transaction() as conn:
+                sql = "SELECT blob FROM cache WHERE hash = ?"
+                old_row = conn.execute(sql, (key,)).fetchone()
+                sql = ("INSERT OR REPLACE INTO cache (hash, accesstime, data,"
+                       " blob, compression) VALUES (?, ?, ?, ?, ?)")
+                conn.execute(sql, (key, self.now, data, blob,
+                                   self.__compression))
+                if old_row is None:
+                    conn.execute('UPDATE meta SET count = count + 1')
+                    stale_blobs = self.__evict(conn)
+                else:
+                    stale_blobs = [old_row[0]]
         except:
-            t = time.time()
-            conn.rollback()
-            logging.trace('rollback: % 0.4f' % (time.time() - t))
+            self.__remove_blobs([blob])
             raise
+        self.__remove_blobs(stale_blobs)
+        logging.trace('insert: % 0.4f' % (time.time() - t1))
+
+    def __evict(self, conn):
+        """Remove oldest-accessed rows in excess of `max_depth` (and
+        `evict_batch` - 1 more) within the transaction on `conn`; return the
+        side files to remove once the transaction is committed"""
+        count, = conn.execute('SELECT count FROM meta').fetchone()
+        n_to_remove = count - self.__max_depth
+        if n_to_remove <= 0:
+            return []
+        n_to_remove += self.__evict_batch - 1
+        sql = "SELECT hash, blob FROM cache ORDER BY accesstime ASC LIMIT ?"
+        rows = conn.execute(sql, (n_to_remove,)).fetchall()
+        conn.executemany("DELETE FROM cache WHERE hash = ?",
+                         [(k,) for k, _ in rows])
+        conn.execute('UPDATE meta SET count = count - ?', (len(rows),))
+        return [blob for _, blob in rows]
+
+    def __dump(self, obj):
+        """Pickle `obj`; return the value for the `data` column and the name
+        of the side file written (None if stored in the database)"""
+        buffers = []
+        if self.__compression is None and pickle.HIGHEST_PROTOCOL >= 5:
+            # Keep contiguous array data out of the pickle
+            payload = pickle.dumps(obj, protocol=5,
+                                   buffer_callback=buffers.append)
+            buffers = [buf.raw() for buf in buffers]
         else:
-            t = time.time()
-            conn.commit()
-            logging.trace('commit: % 0.4f' % (time.time() - t))
-        finally:
-            t = time.time()
-            conn.close()
-            logging.trace('close: % 0.4f' % (time.time() - t))
-            logging.trace('')
+            payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        nbytes = len(payload) + sum(buf.nbytes for buf in buffers)
 
-    def __delitem__(self, key):
-        conn = self.__connect()
+        if nbytes < self.__blob_threshold:
+            if buffers:
+                payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+            return sqlite3.Binary(_compress(payload, self.__compression)), None
+
+        fd, blob_fpath = tempfile.mkstemp(dir=self.__blob_dirpath,
+                                          suffix='.blob')
         try:
-            sql = "DELETE FROM cache WHERE hash = ?"
-            conn.execute(sql, (key,))
+            with os.fdopen(fd, 'wb') as fobj:
+                if self.__compression is not None:
+                    fobj.write(_compress(payload, self.__compression))
+                    layout = None
+                else:
+                    # Pickle, then each buffer aligned for memory mapping
+                    fobj.write(payload)
+                    offset = len(payload)
+                    buffer_extents = []
+                    for buf in buffers:
+                        padding = -offset % self.BLOB_ALIGNMENT
+                        fobj.write(b'\0' * padding)
+                        offset += padding
+                        fobj.write(buf)
+                        buffer_extents.append((offset, buf.nbytes))
+                        offset += buf.nbytes
+                    layout = (len(payload), buffer_extents)
         except:
-            conn.rollback()
+            self.__remove_blobs([os.path.basename(blob_fpath)])
             raise
-        else:
-            conn.commit()
-        finally:
-            conn.close()
+        data = sqlite3.Binary(pickle.dumps(layout, pickle.HIGHEST_PROTOCOL))
+        return data, os.path.basename(blob_fpath)
+
+    def __load(self, data, blob, compression):
+        """Unpickle an object from its `data` column, side file `blob`, and
+        `compression`"""
+        if blob is None:
+            return pickle.loads(_decompress(bytes(data), compression))
+        blob_fpath = os.path.join(self.__blob_dirpath, blob)
+        if compression is not None:
+            with open(blob_fpath, 'rb') as fobj:
+                return pickle.loads(_decompress(fobj.read(), compression))
+        payload_nbytes, buffer_extents = pickle.loads(bytes(data))
+        with open(blob_fpath, 'rb') as fobj:
+            # Copy-on-write, so arrays are writable but the file is never
+            # modified; the mapping outlives the file object (and the file)
+            view = memoryview(mmap.mmap(fobj.fileno(), 0,
+                                        access=mmap.ACCESS_COPY))
+        if not buffer_extents:
+            return pickle.loads(view[:payload_nbytes])
+        return pickle.loads(
+            view[:payload_nbytes],
+            buffers=[view[offset:offset+n] for offset, n in buffer_extents]
+        )
+
+    def __remove_blobs(self, blobs):
+        for blob in blobs:
+            if blob is None:
+                continue
+            try:
+                os.remove(os.path.join(self.__blob_dirpath, blob))
+            except FileNotFoundError:
+                pass
+
+    def __delitem__(self, key):
+        with self.__transaction() as conn:
+            sql = "SELECT blob FROM cache WHERE hash = ?"
+            row = conn.execute(sql, (key,)).fetchone()
+            if row is None:
+                return
+            sql = "DELETE FROM cache WHERE hash = ?"
+            conn.execute(sql, (key,))
+            conn.execute('UPDATE meta SET count = count - 1')
+        self.__remove_blobs(row)
 
     def __len__(self):
-        conn = self.__connect()
-        try:
-            cursor = conn.execute('SELECT COUNT (*) FROM cache')
-            count, = cursor.fetchone()
-        finally:
-            conn.close()
+        count, = self.__connection.execute(
+            'SELECT count FROM meta'
+        ).fetchone()
         return count
 
     def get(self, key, dflt=None):
@@ -427,53 +738,72 @@ class DiskCache(object):
         return rslt
 
     def clear(self):
-        conn = self.__connect()
-        try:
+        with self.__transaction() as conn:
+            rows = conn.execute('SELECT blob FROM cache').fetchall()
             conn.execute('DELETE FROM cache')
-        except:
-            conn.rollback()
-            raise
-        else:
-            conn.commit()
-        finally:
-            conn.close()
+            conn.execute('UPDATE meta SET count = 0')
+        self.__remove_blobs([blob for blob, in rows])
 
     def keys(self):
-        conn = self.__connect()
-        try:
-            sql = "SELECT hash FROM cache ORDER BY accesstime ASC"
-            cursor = conn.execute(sql)
-            k = [k[0] for k in cursor.fetchall()]
-        finally:
-            conn.close()
-        return k
+        sql = "SELECT hash FROM cache ORDER BY accesstime ASC"
+        cursor = self.__connection.execute(sql)
+        return [k[0] for k in cursor.fetchall()]
+
+    def close(self):
+        """Close this process's connection to the database (it is reopened
+        as needed)"""
+        if self.__conn is not None and self.__conn_pid == os.getpid():
+            self.__conn.close()
+        self.__conn = None
 
     def __connect(self):
         conn = sqlite3.connect(
             self.__db_fpath,
-            isolation_level=None, check_same_thread=False, timeout=10,
+            isolation_level=None, check_same_thread=False, timeout=60,
         )
 
-        # Trust journaling to memory
-        sql = "PRAGMA journal_mode=MEMORY"
-        conn.execute(sql)
-
-        # Trust OS to complete transaction
-        sql = "PRAGMA synchronous=0"
+        # Readers and writer(s) in several processes proceed concurrently
+        sql = "PRAGMA journal_mode=WAL"
         conn.execute(sql)
 
-        # Make file size shrink when items are removed
-        sql = "PRAGMA auto_vacuum=FULL"
+        # Transactions can be lost, but the database not corrupted, upon power
+        # loss
+        sql = "PRAGMA synchronous=NORMAL"
         conn.execute(sql)
 
         return conn
 
-    def __contains__(self, key):
+    @property
+    def __connection(self):
+        """Persistent connection of the current process"""
+        pid = os.getpid()
+        if self.__conn is None or self.__conn_pid != pid:
+            if self.__conn is not None:
+                # Connection inherited from the parent process: neither use
+                # it nor let it be closed (which could remove the parent's
+                # WAL file), just keep it around
+                self.__forked_conns.append(self.__conn)
+            self.__conn = self.__connect()
+            self.__conn_pid = pid
+        return self.__conn
+
+    @contextmanager
+    def __transaction(self):
+        """Immediate (i.e., write-locking) transaction on the persistent
+        connection"""
+        conn = self.__connection
+        conn.execute('BEGIN IMMEDIATE')
         try:
-            _ = self[key]
-            return True 
-        except KeyError:
-            return False
+            yield conn
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def __contains__(self, key):
+        sql = "SELECT 1 FROM cache WHERE hash = ?"
+        return self.__connection.execute(sql, (key,)).fetchone() is not None
 
     @property
     def now(self):
@@ -481,6 +811,110 @@ class DiskCache(object):
         return int(time.time() * 1e6)
 
 
+class ArrayDiskCache(object):
+    """
+    Content-addressed on-disk store for sets of numpy arrays.
+
+    Each entry is a directory `<path>/<hash of key>/` holding one `.npy` file
+    per array, such that entries can be memory-mapped upon loading rather than
+    read (and unpickled) in full, as is the case for DiskCache.
+
+    Parameters
+    ----------
+    path : str
+        Directory under which entries are stored; created if it does not
+        exist.
+
+    mmap_mode : None or str
+        Passed to `numpy.load` when retrieving arrays. The default, 'r',
+        returns read-only memory maps; use None to read arrays into memory.
+
+    Notes
+    -----
+    Entries are written to a temporary directory which is then atomically
+    renamed into place, so the cache is safe to populate from many processes
+    (e.g. cluster jobs sharing a CACHE_DIR) simultaneously; readers never see
+    a partially-written entry. No pruning is performed.
+
+    Examples
+    --------
+    >>> cache = ArrayDiskCache('/tmp/arraycache')
+    >>> cache[('abc', 1)] = {'x': np.arange(3)}
+    >>> ('abc', 1) in cache
+    True
+    >>> cache[('abc', 1)]['x']
+    memmap([0, 1, 2])
+
+    """
+    def __init__(self, path, mmap_mode='r'):
+        self.__path = os.path.expandvars(os.path.expanduser(path))
+        if not os.path.isdir(self.__path):
+            os.makedirs(self.__path, exist_ok=True)
+        self.__mmap_mode = mmap_mode
+
+    @property
+    def path(self):
+        return self.__path
+
+    def __str__(self):
+        return 'ArrayDiskCache(path=%s, mmap_mode=%s)' % (self.__path,
+                                                          self.__mmap_mode)
+
+    def __repr__(self):
+        return str(self)
+
+    def _entry_path(self, key):
+        return os.path.join(self.__path, hash_obj(key, hash_to='hex'))
+
+    def __contains__(self, key):
+        return os.path.isdir(self._entry_path(key))
+
+    def __getitem__(self, key):
+        entry_path = self._entry_path(key)
+        if not os.path.isdir(entry_path):
+            raise KeyError(str(key))
+        arrays = OrderedDict()
+        for fname in sorted(os.listdir(entry_path)):
+            name, ext = os.path.splitext(fname)
+            if ext != '.npy':
+                continue
+            arrays[name] = np.load(os.path.join(entry_path, fname),
+                                   mmap_mode=self.__mmap_mode)
+        return arrays
+
+    def __setitem__(self, key, arrays):
+        entry_path = self._entry_path(key)
+        if os.path.isdir(entry_path):
+            return
+        tmp_path = tempfile.mkdtemp(dir=self.__path, prefix='.tmp_')
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, name + '.npy'),
+                        np.ascontiguousarray(array))
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            # Another process may have stored the same entry in the meantime
+            if not os.path.isdir(entry_path):
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def __delitem__(self, key):
+        entry_path = self._entry_path(key)
+        if not os.path.isdir(entry_path):
+            raise KeyError(str(key))
+        shutil.rmtree(entry_path)
+
+    def get(self, key, dflt=None):
+        if key in self:
+            return self[key]
+        return dflt
+
+    def clear(self):
+        for dname in os.listdir(self.__path):
+            shutil.rmtree(os.path.join(self.__path, dname), ignore_errors=True)
+
+
 # TODO: augment test
 def test_MemoryCache():
     """Unit tests for MemoryCache class"""
@@ -504,6 +938,52 @@ def test_MemoryCache():
         y = mc[4]
         assert (y == x_ref) == deepcopy
 
+    # Hit / miss / eviction counters
+    mc = MemoryCache(max_depth=2)
+    mc[0] = 'zero'
+    mc[1] = 'one'
+    assert mc[0] == 'zero'
+    assert 5 not in mc
+    assert mc.get(6) is None
+    mc[2] = 'two'
+    assert 1 not in mc
+    assert mc.hits == 1 and mc.misses == 3 and mc.evictions == 1, \
+            (mc.hits, mc.misses, mc.evictions)
+
+    # Byte budget: least-recently used entries go first
+    array = np.zeros(1000)
+    nbytes = get_nbytes(array)
+    assert nbytes >= array.nbytes
+    mc = MemoryCache(max_depth=100, max_bytes=int(2.5*nbytes))
+    mc[0] = array
+    mc[1] = array.copy()
+    assert mc[0] is array
+    mc[2] = array.copy()
+    assert len(mc) == 2 and 0 in mc and 1 not in mc and 2 in mc
+    assert mc.nbytes == 2*nbytes and mc.evictions == 1
+
+    # Entries larger than the budget are not stored at all
+    mc[3] = np.zeros(3000)
+    assert 3 not in mc and len(mc) == 2
+    del mc[0]
+    assert mc.nbytes == nbytes
+    key, _ = mc.popitem()
+    assert key == 2 and mc.nbytes == 0
+
+    # Global byte budget shared by all caches evicts the globally oldest entry
+    orig_global_max_bytes = MemoryCache.GLOBAL_MEMCACHE_MAX_BYTES
+    try:
+        MemoryCache.GLOBAL_MEMCACHE_MAX_BYTES = int(2.5*nbytes)
+        mc0 = MemoryCache(max_depth=100)
+        mc1 = MemoryCache(max_depth=100)
+        mc0['a'] = array.copy()
+        mc1['b'] = array.copy()
+        mc1['c'] = array.copy()
+        assert 'a' not in mc0 and 'b' in mc1 and 'c' in mc1
+        assert mc0.nbytes == 0 and mc1.nbytes == 2*nbytes
+    finally:
+        MemoryCache.GLOBAL_MEMCACHE_MAX_BYTES = orig_global_max_bytes
+
     logging.info('<< PASS : test_MemoryCache >>')
 
 
@@ -525,13 +1005,79 @@ def test_DiskCache():
         dc[3] = 'three'
         assert 0 not in dc
         assert dc[3] == 'three'
+
+        # Large arrays go to (memory-mapped) side files, which are removed
+        # along with their entries; with batch eviction, entries beyond
+        # `max_depth` are pruned `evict_batch` at a time
+        blob_dirpath = tmp_fname + '.blobs'
+        for compression in [None, 'zlib']:
+            dc = DiskCache(db_fpath=tmp_fname, max_depth=4, is_lru=True,
+                           compression=compression, blob_threshold=1000,
+                           evict_batch=2)
+            dc.clear()
+            x = {'small': np.arange(3), 'large': np.arange(1000.)}
+            for key in range(4):
+                dc[key] = x
+            assert len(dc) == 4 and len(os.listdir(blob_dirpath)) == 4
+            y = dc[0]
+            assert np.all(y['large'] == x['large'])
+            base = y['large']
+            while isinstance(base, np.ndarray):
+                base = base.base
+            assert isinstance(base.obj, mmap.mmap) == (compression is None)
+            y['large'][0] = -1
+            assert dc[0]['large'][0] == 0
+            dc[4] = x
+            assert dc.keys() == [3, 0, 4]
+            assert len(os.listdir(blob_dirpath)) == 3
+            del dc[3]
+            dc[5] = 'five'
+            assert len(dc) == 3 and len(os.listdir(blob_dirpath)) == 2
+
+        # Another connection (e.g. another process) sees the same entries
+        dc2 = DiskCache(db_fpath=tmp_fname, max_depth=4)
+        assert dc2.keys() == dc.keys() and dc2[5] == 'five'
+        dc2.clear()
+        assert len(dc) == 0 and not os.listdir(blob_dirpath)
     finally:
         shutil.rmtree(testdir, ignore_errors=True)
 
     logging.info('<< PASS : test_DiskCache >>')
 
 
+def test_ArrayDiskCache():
+    """Unit tests for ArrayDiskCache class"""
+    testdir = tempfile.mkdtemp()
+    try:
+        ac = ArrayDiskCache(os.path.join(testdir, 'subfolder'))
+        key = ('events', 1234, 'flux.d')
+        assert key not in ac
+        x = np.linspace(0, 1, 11)
+        y = np.arange(12, dtype=np.float32).reshape(4, 3)
+        ac[key] = OrderedDict([('x', x), ('y', y)])
+        assert key in ac
+        assert ('events', 1235, 'flux.d') not in ac
+        arrays = ac[key]
+        assert list(arrays.keys()) == ['x', 'y']
+        assert np.all(arrays['x'] == x)
+        assert arrays['y'].dtype == y.dtype and arrays['y'].shape == y.shape
+        assert np.all(arrays['y'] == y)
+        assert isinstance(arrays['x'], np.memmap)
+        # Storing the same key again is a no-op
+        ac[key] = {'z': x}
+        assert list(ac[key].keys()) == ['x', 'y']
+        # No temporary directories are left behind
+        assert len(os.listdir(ac.path)) == 1
+        del ac[key]
+        assert key not in ac
+    finally:
+        shutil.rmtree(testdir, ignore_errors=True)
+
+    logging.info('<< PASS : test_ArrayDiskCache >>')
+
+
 if __name__ == "__main__":
     set_verbosity(1)
     test_MemoryCache()
     test_DiskCache()
+    test_ArrayDiskCache()
@@ -47,7 +47,10 @@ required, in addition to a ``[binning]`` section:
 * ``#include resource as xyz`` statements behave similarly, but prepend the
   included file's text with a setion header containing ``xyz`` in this case.
 * ``pipeline`` is the top-most section that defines the hierarchy of stages and
-  what services to be instantiated.
+  what services to be instantiated. For PISA Pi pipelines, setting
+  ``incremental = True`` in this section re-applies only those stages whose
+  params or input keys changed since the last evaluation (see
+  :class:`pisa.core.pipeline.Pipeline`).
 * ``binning`` can contain different binning definitions, that are then later
   referred to from within the ``stage.service`` sections.
 * ``stage.service`` one such section per stage.service is necessary. It
@@ -603,6 +606,10 @@ def parse_pipeline_config(config):
     detector_name = None
     if config.has_option(section, 'detector_name'):
         detector_name = config.get(section, 'detector_name')    
+
+    incremental = False
+    if config.has_option(section, 'incremental'):
+        incremental = config.getboolean(section, 'incremental')
         
     # Parse [stage.<stage_name>] sections and store to stage_dicts
     stage_dicts = OrderedDict()
@@ -740,6 +747,7 @@ def parse_pipeline_config(config):
         stage_dicts[(stage, service)] = service_kwargs
 
     stage_dicts['detector_name'] = detector_name    
+    stage_dicts['incremental'] = incremental
     return stage_dicts
 
 
@@ -20,7 +20,7 @@ from pisa.utils.resources import open_resource
 
 __all__ = ['load_2d_honda_table', 'load_2d_bartol_table', 'load_2d_table',
            'calculate_2d_flux_weights', 'load_3d_honda_table', 'load_3d_table',
-           'calculate_3d_flux_weights', ]
+           'calculate_3d_flux_weights', 'test_calculate_2d_flux_weights']
 
 __author__ = 'S. Wren'
 
@@ -40,6 +40,8 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
 
 
 PRIMARIES = ['numu', 'numubar', 'nue', 'nuebar']
+FLUX_WEIGHTS_CHUNK_SIZE = 1000000
+"""Number of events processed at once in `calculate_2d_flux_weights`"""
 TEXPRIMARIES = [r'$\nu_{\mu}$', r'$\bar{\nu}_{\mu}$', r'$\nu_{e}$',
                 r'$\bar{\nu}_{e}$']
 
@@ -314,23 +316,57 @@ def calculate_2d_flux_weights(true_energies, true_coszens, en_splines,
     if out is None:
         out = np.empty_like(true_energies)
 
-    spline_vals = np.zeros(num_cz_points+1)
-    for i in range(len(true_energies)):
-        true_log_energy = np.log10(true_energies[i])
+    true_log_energies = np.log10(true_energies)
+
+    # The integral-preserving cubic spline in coszen is interpolating at fixed
+    # knots, so its derivative is a linear combination of the integrated
+    # values at the knots; hence all events can be processed at once. Work
+    # through the events in chunks to limit the memory footprint.
+    for start in range(0, len(true_energies), FLUX_WEIGHTS_CHUNK_SIZE):
+        chunk = slice(start, start + FLUX_WEIGHTS_CHUNK_SIZE)
+        log_energies = true_log_energies[chunk]
+
+        spline_vals = np.zeros((num_cz_points+1, len(log_energies)))
         for j in range(num_cz_points):
-            spline_vals[j+1] = interpolate.splev(true_log_energy,
+            spline_vals[j+1] = interpolate.splev(log_energies,
                                                  en_splines[czkeys[j]],
                                                  der=1)
+        int_spline_vals = np.cumsum(spline_vals, axis=0)*0.1
 
-        int_spline_vals = np.cumsum(spline_vals)*0.1
-        spline = interpolate.splrep(cz_spline_points,
-                                    int_spline_vals, s=0)
+        cz_weights = _spline_derivative_weights(cz_spline_points,
+                                                true_coszens[chunk])
 
-        out[i] = interpolate.splev(true_coszens[i], spline, der=1) / np.power(true_energies[i], enpow)
+        out[chunk] = (np.sum(cz_weights * int_spline_vals, axis=0)
+                      / np.power(true_energies[chunk], enpow))
 
     return out
 
 
+def _spline_derivative_weights(knots, x):
+    """Weights `w` such that the derivative at `x` of the interpolating cubic
+    spline (as obtained with `splrep(knots, y, s=0)`) through any `y` is given
+    by `np.sum(w * y[:, None], axis=0)`.
+
+    Parameters
+    ----------
+    knots : numpy array of length n
+    x : numpy array of length m
+
+    Returns
+    -------
+    weights : numpy array of shape (n, m)
+
+    """
+    weights = np.empty((len(knots), len(x)))
+    unit_vals = np.zeros(len(knots))
+    for j in range(len(knots)):
+        unit_vals[:] = 0.
+        unit_vals[j] = 1.
+        spline = interpolate.splrep(knots, unit_vals, s=0)
+        weights[j] = interpolate.splev(x, spline, der=1)
+    return weights
+
+
 def load_3d_honda_table(flux_file, enpow=1, return_table=False):
 
     logging.debug("Loading atmospheric flux table %s", flux_file)
@@ -599,6 +635,49 @@ def calculate_3d_flux_weights(true_energies, true_coszens, true_azimuths,
     return flux_weights
 
 
+def test_calculate_2d_flux_weights():
+    """Compare `calculate_2d_flux_weights` to a straightforward event-by-event
+    evaluation of the integral-preserving splines"""
+    spline_dict = load_2d_table('flux/honda-2015-spl-solmin-aa.d')
+
+    random_state = np.random.RandomState(0)
+    true_energies = np.power(10, random_state.uniform(0, 3, 1000))
+    true_coszens = random_state.uniform(-1, 1, 1000)
+    # include the edges of the coszen range
+    true_coszens[:2] = [-1., 1.]
+
+    num_cz_points = 20
+    czkeys = ['%.2f'%x for x in np.linspace(-0.95, 0.95, num_cz_points)]
+    cz_spline_points = np.linspace(-1, 1, num_cz_points+1)
+
+    for prim in PRIMARIES:
+        en_splines = spline_dict[prim]
+        ref = np.empty_like(true_energies)
+        spline_vals = np.zeros(num_cz_points+1)
+        for i in range(len(true_energies)):
+            true_log_energy = np.log10(true_energies[i])
+            for j in range(num_cz_points):
+                spline_vals[j+1] = interpolate.splev(true_log_energy,
+                                                     en_splines[czkeys[j]],
+                                                     der=1)
+            int_spline_vals = np.cumsum(spline_vals)*0.1
+            spline = interpolate.splrep(cz_spline_points,
+                                        int_spline_vals, s=0)
+            ref[i] = interpolate.splev(true_coszens[i], spline, der=1) / true_energies[i]
+
+        test = calculate_2d_flux_weights(true_energies, true_coszens,
+                                         en_splines)
+        assert np.allclose(test, ref, rtol=1e-10, atol=0), prim
+
+        # writing to a (non-contiguous) output array
+        out = np.zeros((len(true_energies), 2))
+        calculate_2d_flux_weights(true_energies, true_coszens, en_splines,
+                                  out=out[:, 1])
+        assert np.array_equal(out[:, 1], test), prim
+
+    logging.info('<< PASS : test_calculate_2d_flux_weights >>')
+
+
 def main():
     """This is a slightly longer example than that given in the docstring of
     the calculate_flux_weights function. This will make a quick plot of the
@@ -637,4 +716,5 @@ def main():
 
 
 if __name__ == '__main__':
+    test_calculate_2d_flux_weights()
     main()
@@ -10,10 +10,12 @@ reproducible manner.
 from __future__ import division
 
 from collections.abc import Sequence
+import time
 
 import numpy as np
+from scipy.stats import poisson
 
-from pisa.utils.log import set_verbosity
+from pisa.utils.log import logging, set_verbosity
 
 
 __all__ = ['get_random_state',
@@ -42,12 +44,16 @@ def get_random_state(random_state, jumpahead=0):
 
     Parameters
     ----------
-    random_state : None, RandomState, string, int, state vector, or seq of int
+    random_state : None, RandomState, SeedSequence, string, int, state vector, or seq of int
         Note for all of the below cases, `jumpahead` is applied _after_ the
         RansomState is initialized using the `random_state` (except for
         `random_state` indicating a truly-random number, in which case
         `jumpahead` is ignored).
         * If instantiated RandomState object is passed, it is used directly
+        * If `numpy.random.SeedSequence`: random numbers are drawn from a
+          counter-based Philox generator initialized from it. Use e.g.
+          `SeedSequence([flag, trial, subtrial])` to get independent,
+          reproducible streams for any number of trials.
         * If string : must be either 'rand' or 'random'; random state is
           instantiated at random from either /dev/urandom or (if that is not
           present) the clock. This creates an irreproducibly-random number.
@@ -66,12 +72,21 @@ def get_random_state(random_state, jumpahead=0):
           this method.
 
     jumpahead : int >= 0
-        Starting with the random state specified by `random_state`, produce
-        `jumpahead` random numbers to move this many states forward in the
-        random number generator's finite state machine. Note that this is
-        ignored if `random_state`="random" since jumping ahead any number of
-        states from a truly-random point merely yields another truly-random
-        point, but takes additional computational time.
+        Select the independent stream number `jumpahead` derived from the
+        seed given by `random_state`. For a seed (int, sequence of int, or
+        SeedSequence) and `jumpahead` > 0, this takes constant time: a Philox
+        generator initialized from the seed is jumped ahead by `jumpahead`
+        times 2**128 draws, so streams cannot overlap. `jumpahead` = 0 yields
+        the same random state as without jumping ahead (i.e. the Mersenne
+        twister for int and sequence seeds, as before).
+
+        For a RandomState object or None (the global state), `jumpahead`
+        random numbers are produced to move this many states forward in
+        the random number generator's finite state machine.
+
+        Note that this is ignored if `random_state`="random" since jumping
+        ahead any number of states from a truly-random point merely yields
+        another truly-random point, but takes additional computational time.
 
     Returns
     -------
@@ -87,6 +102,9 @@ def get_random_state(random_state, jumpahead=0):
     elif isinstance(random_state, np.random.RandomState):
         new_random_state = random_state
 
+    elif isinstance(random_state, np.random.SeedSequence):
+        return _random_state_stream(random_state, jumpahead)
+
     elif isinstance(random_state, str):
         allowed_strings = ['rand', 'random']
         rs = random_state.lower().strip()
@@ -99,11 +117,19 @@ def get_random_state(random_state, jumpahead=0):
         jumpahead = 0
 
     elif isinstance(random_state, int):
+        if jumpahead > 0:
+            return _random_state_stream(
+                np.random.SeedSequence(random_state), jumpahead
+            )
         new_random_state = np.random.RandomState(seed=random_state)
 
     elif isinstance(random_state, Sequence):
         new_random_state = np.random.RandomState()
         if all([isinstance(x, int) for x in random_state]):
+            if jumpahead > 0:
+                return _random_state_stream(
+                    np.random.SeedSequence(list(random_state)), jumpahead
+                )
             if len(random_state) == 1:
                 seed = random_state[0]
                 assert seed >= 0 and seed < 2**32
@@ -146,11 +172,60 @@ def get_random_state(random_state, jumpahead=0):
     return new_random_state
 
 
+def _random_state_stream(seed_sequence, stream):
+    """RandomState drawing from stream number `stream` of a Philox generator
+    initialized from `seed_sequence`"""
+    bit_generator = np.random.Philox(seed_sequence)
+    if stream > 0:
+        bit_generator = bit_generator.jumped(stream)
+    return np.random.RandomState(bit_generator)
+
+
 def test_get_random_state():
     """Unit tests for get_random_state function"""
-    raise NotImplementedError()
+    # Seeds without jumping ahead are unchanged
+    assert np.all(get_random_state(1).rand(5)
+                  == np.random.RandomState(1).rand(5))
+    assert np.all(get_random_state([1]).rand(5)
+                  == np.random.RandomState(1).rand(5))
+    assert np.all(get_random_state([1, 2]).rand(5)
+                  == np.random.RandomState((1 << 17) + 2).rand(5))
+
+    # Jumping ahead on a RandomState object or the global state still
+    # produces (and discards) the numbers
+    random_state = np.random.RandomState(0)
+    values = random_state.rand(10)
+    assert get_random_state(np.random.RandomState(0), jumpahead=9).rand() \
+            == values[9]
+
+    # Streams are reproducible, independent, and take constant time even for
+    # large trial numbers
+    for seed in [0, [0, 1], [1, 2, 3], np.random.SeedSequence(0)]:
+        stream = get_random_state(seed, jumpahead=50000).rand(100)
+        assert np.all(stream == get_random_state(seed, jumpahead=50000)
+                      .rand(100))
+        assert not np.any(stream == get_random_state(seed, jumpahead=50001)
+                          .rand(100))
+        assert not np.any(stream == get_random_state(seed, jumpahead=0)
+                          .rand(100))
+
+    t0 = time.time()
+    get_random_state(0, jumpahead=10**12).rand()
+    assert time.time() - t0 < 1
+
+    # Distinct seed sequences yield distinct streams, beyond the bit limits of
+    # the int-sequence seeds
+    trials = [get_random_state(np.random.SeedSequence([0, i, 0])).rand()
+              for i in range(10000)]
+    assert len(set(trials)) == len(trials)
+
+    # Usable by scipy.stats like any RandomState
+    assert poisson.rvs(10, size=3,
+                       random_state=get_random_state(0, jumpahead=3)).size == 3
+
+    logging.info('<< PASS : test_get_random_state >>')
 
 
 if __name__ == '__main__':
     set_verbosity(1)
-    #test_get_random_state()
+    test_get_random_state()
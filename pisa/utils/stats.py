@@ -5,7 +5,10 @@ Statistical functions
 
 from __future__ import absolute_import, division
 
+import math
+
 import numpy as np
+from numba import jit
 from scipy.special import gammaln
 from uncertainties import unumpy as unp
 
@@ -15,9 +18,12 @@ from pisa.utils.log import logging
 from pisa.utils import likelihood_functions
 
 __all__ = ['SMALL_POS', 'CHI2_METRICS', 'LLH_METRICS', 'ALL_METRICS',
-           'maperror_logmsg',
+           'FAST_METRICS', 'GRADIENT_METRICS', 'maperror_logmsg', 'total',
+           'fast_metric', 'metric_batch', 'metric_gradient',
            'chi2', 'llh', 'log_poisson', 'log_smear', 'conv_poisson',
-           'norm_conv_poisson', 'conv_llh', 'barlow_llh', 'mod_chi2', 'mcllh_mean', 'mcllh_eff']
+           'norm_conv_poisson', 'conv_llh', 'barlow_llh', 'mod_chi2', 'mcllh_mean', 'mcllh_eff',
+           'test_mixed_precision', 'test_fast_metric', 'test_conv_llh',
+           'test_metric_batch', 'test_metric_gradient']
 
 __author__ = 'P. Eller, T. Ehrhardt, J.L. Lanfranchi'
 
@@ -54,6 +60,13 @@ METRICS_TO_MAXIMIZE = LLH_METRICS
 METRICS_TO_MINIMIZE = CHI2_METRICS
 """Metrics that must be minimized to obtain a better fit"""
 
+FAST_METRICS = ['llh', 'mcllh_mean', 'mcllh_eff', 'mod_chi2']
+"""Metrics that `fast_metric` evaluates with fused, compiled kernels"""
+
+GRADIENT_METRICS = ['llh', 'chi2']
+"""Metrics whose derivatives w.r.t. the expectation `metric_gradient` can
+compute (i.e. which do not depend on the uncertainties of the expectation)"""
+
 
 # TODO(philippeller):
 # * unit tests to ensure these don't break
@@ -73,13 +86,51 @@ def maperror_logmsg(m):
     return msg
 
 
+def total(values):
+    """Sum `values` in double precision using compensated (exact) summation,
+    such that the total of a metric does not depend on FTYPE or on the number
+    of bins beyond the precision of the individual terms.
+
+    Parameters
+    ----------
+    values : scalar, sequence, numpy.ndarray, or numpy.ma.MaskedArray
+        Masked elements are ignored, as in `numpy.sum`
+
+    Returns
+    -------
+    total : float
+
+    """
+    if np.ma.isMaskedArray(values):
+        values = values.compressed()
+    return math.fsum(np.asarray(values, dtype=np.float64).ravel())
+
+
+def _float64(values):
+    """Nominal values of an array (incl. `uncertainties` arrays) or of a Map
+    as a double precision array"""
+    if hasattr(values, 'variances'):
+        values = values.nominal_values
+    elif not isbarenumeric(values):
+        values = unp.nominal_values(values)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _variances(values):
+    """Squared uncertainties of an array or of a Map as a double precision
+    array"""
+    if hasattr(values, 'variances'):
+        return np.asarray(values.variances, dtype=np.float64)
+    return np.square(np.asarray(unp.std_devs(values), dtype=np.float64))
+
+
 def chi2(actual_values, expected_values):
     """Compute the chi-square between each value in `actual_values` and
     `expected_values`.
 
     Parameters
     ----------
-    actual_values, expected_values : numpy.ndarrays of same shape
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
 
     Returns
     -------
@@ -100,11 +151,9 @@ def chi2(actual_values, expected_values):
             % (actual_values.shape, expected_values.shape)
         )
 
-    # Convert to simple numpy arrays containing floats
-    if not isbarenumeric(actual_values):
-        actual_values = unp.nominal_values(actual_values)
-    if not isbarenumeric(expected_values):
-        expected_values = unp.nominal_values(expected_values)
+    # Convert to simple numpy arrays containing doubles
+    actual_values = _float64(actual_values)
+    expected_values = _float64(expected_values)
 
     with np.errstate(invalid='ignore'):
         # Mask off any nan expected values (these are assumed to be ok)
@@ -135,7 +184,7 @@ def chi2(actual_values, expected_values):
         delta = actual_values - expected_values
 
     if np.all(np.abs(delta) < 5*FTYPE_PREC):
-        return np.zeros_like(delta, dtype=FTYPE)
+        return np.zeros_like(delta, dtype=np.float64)
 
     assert np.all(actual_values > 0), str(actual_values)
     #chi2_val = np.square(delta) / actual_values
@@ -150,7 +199,7 @@ def llh(actual_values, expected_values):
 
     Parameters
     ----------
-    actual_values, expected_values : numpy.ndarrays of same shape
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
 
     Returns
     -------
@@ -167,11 +216,9 @@ def llh(actual_values, expected_values):
     """
     assert actual_values.shape == expected_values.shape
 
-    # Convert to simple numpy arrays containing floats
-    if not isbarenumeric(actual_values):
-        actual_values = unp.nominal_values(actual_values)
-    if not isbarenumeric(expected_values):
-        expected_values = unp.nominal_values(expected_values)
+    # Convert to simple numpy arrays containing doubles
+    actual_values = _float64(actual_values)
+    expected_values = _float64(expected_values)
 
     with np.errstate(invalid='ignore'):
         # Mask off any nan expected values (these are assumed to be ok)
@@ -218,7 +265,7 @@ def mcllh_mean(actual_values, expected_values):
 
     Parameters
     ----------
-    actual_values, expected_values : numpy.ndarrays of same shape
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
 
     Returns
     -------
@@ -233,9 +280,9 @@ def mcllh_mean(actual_values, expected_values):
     assert actual_values.shape == expected_values.shape
 
     # Convert to simple numpy arrays containing floats
-    actual_values = unp.nominal_values(actual_values).ravel()
-    sigma = unp.std_devs(expected_values).ravel()
-    expected_values = unp.nominal_values(expected_values).ravel() 
+    actual_values = _float64(actual_values).ravel()
+    variances = _variances(expected_values).ravel()
+    expected_values = _float64(expected_values).ravel()
     
     with np.errstate(invalid='ignore'):
         # Mask off any nan expected values (these are assumed to be ok)
@@ -264,7 +311,7 @@ def mcllh_mean(actual_values, expected_values):
                    + maperror_logmsg(expected_values))
             raise ValueError(msg)
 
-    llh_val = likelihood_functions.poisson_gamma(actual_values, expected_values, sigma**2, a=0, b=0)
+    llh_val = likelihood_functions.poisson_gamma(actual_values, expected_values, variances, a=0, b=0)
     return llh_val
 
 
@@ -275,7 +322,7 @@ def mcllh_eff(actual_values, expected_values):
 
     Parameters
     ----------
-    actual_values, expected_values : numpy.ndarrays of same shape
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
 
     Returns
     -------
@@ -290,9 +337,9 @@ def mcllh_eff(actual_values, expected_values):
     assert actual_values.shape == expected_values.shape
 
     # Convert to simple numpy arrays containing floats
-    actual_values = unp.nominal_values(actual_values).ravel()
-    sigma = unp.std_devs(expected_values).ravel()
-    expected_values = unp.nominal_values(expected_values).ravel() 
+    actual_values = _float64(actual_values).ravel()
+    variances = _variances(expected_values).ravel()
+    expected_values = _float64(expected_values).ravel()
     
     with np.errstate(invalid='ignore'):
         # Mask off any nan expected values (these are assumed to be ok)
@@ -321,7 +368,7 @@ def mcllh_eff(actual_values, expected_values):
                    + maperror_logmsg(expected_values))
             raise ValueError(msg)
 
-    llh_val = likelihood_functions.poisson_gamma(actual_values, expected_values, sigma**2, a=1, b=0)
+    llh_val = likelihood_functions.poisson_gamma(actual_values, expected_values, variances, a=1, b=0)
     return llh_val
 
 
@@ -375,9 +422,9 @@ def conv_poisson(k, l, s, nsigma=3, steps=50):
 
     Parameters
     ----------
-    k : float
-    l : float
-    s : float
+    k : float or numpy.ndarray
+    l : float or numpy.ndarray
+    s : float or numpy.ndarray
         sigma for smearing term (= the uncertainty to be accounted for)
     nsigma : int
         The ange in sigmas over which to do the convolution, 3 sigmas is > 99%,
@@ -388,32 +435,66 @@ def conv_poisson(k, l, s, nsigma=3, steps=50):
 
     Returns
     -------
-    float
-        convoluted poissson likelihood
+    float or numpy.ndarray
+        convoluted poissson likelihood, evaluated element-wise for the
+        broadcast `k`, `l` and `s`
 
     """
-    # Replace 0's with small positive numbers to avoid inf in log
-    l = max(SMALL_POS, l)
+    k, l, s = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64)
+                                    for v in (k, l, s)])
+    shape = k.shape
     st = 2*(steps + 1)
-    conv_x = np.linspace(-nsigma*s, +nsigma*s, st)[:-1]+nsigma*s/(st-1.)
-    conv_y = log_smear(conv_x, s)
-    f_x = conv_x + l
-    #f_x = conv_x + k
-    # Avoid zero values for lambda
-    idx = np.argmax(f_x > 0)
-    f_y = log_poisson(k, f_x[idx:])
-    #f_y = log_poisson(f_x[idx:], l)
-    if np.isnan(f_y).any():
+    # The smearing quadrature in units of sigma is the same for all bins
+    offsets = np.linspace(-nsigma, +nsigma, st)[:-1] + nsigma/(st-1.)
+    conv = np.empty(k.size, dtype=np.float64)
+    nan_bins = np.zeros(k.size, dtype=np.bool_)
+    _conv_poisson_kernel(k.ravel(), l.ravel(), s.ravel(), offsets, conv,
+                         nan_bins)
+    if np.any(nan_bins):
         logging.error('`NaN values`:')
-        logging.error('idx = %d', idx)
-        logging.error('s = %s', s)
-        logging.error('l = %s', l)
-        logging.error('f_x = %s', f_x)
-        logging.error('f_y = %s', f_y)
-    f_y = np.nan_to_num(f_y)
-    conv = np.exp(conv_y[idx:] + f_y)
-    norm = np.sum(np.exp(conv_y))
-    return conv.sum()/norm
+        logging.error('k = %s', k.ravel()[nan_bins])
+        logging.error('l = %s', l.ravel()[nan_bins])
+        logging.error('s = %s', s.ravel()[nan_bins])
+    return conv.reshape(shape)[()]
+
+
+@jit(nopython=True, nogil=True, error_model='numpy')
+def _conv_poisson_kernel(k, l, s, offsets, conv, nan_bins):
+    """Compiled `conv_poisson` for flat arrays `k`, `l` and `s`, using the
+    smearing quadrature `offsets` (in units of sigma)"""
+    log_sqrt_2pi = 0.5*math.log(2*math.pi)
+    max_float = np.finfo(np.float64).max
+    for i in range(k.size):
+        k_i = k[i]
+        s_i = s[i]
+        # Replace 0's with small positive numbers to avoid inf in log
+        l_i = l[i] if l[i] > SMALL_POS else SMALL_POS
+        log_gamma_k = math.lgamma(k_i + 1)
+
+        # Avoid zero values for lambda
+        idx = 0
+        for m in range(offsets.size):
+            if s_i*offsets[m] + l_i > 0:
+                idx = m
+                break
+
+        conv_sum = 0.
+        norm = 0.
+        for m in range(offsets.size):
+            x = s_i*offsets[m]
+            conv_y = -math.log(s_i) - log_sqrt_2pi - x**2 / (2*s_i**2)
+            norm += math.exp(conv_y)
+            if m < idx:
+                continue
+            f_x = x + l_i
+            f_y = k_i*math.log(f_x) - f_x - log_gamma_k
+            if math.isnan(f_y):
+                nan_bins[i] = True
+                f_y = 0.
+            elif math.isinf(f_y):
+                f_y = max_float if f_y > 0 else -max_float
+            conv_sum += math.exp(conv_y + f_y)
+        conv[i] = conv_sum / norm
 
 
 def norm_conv_poisson(k, l, s, nsigma=3, steps=50):
@@ -422,9 +503,9 @@ def norm_conv_poisson(k, l, s, nsigma=3, steps=50):
 
     Parameters
     ----------
-    k : float
-    l : float
-    s : float
+    k : float or numpy.ndarray
+    l : float or numpy.ndarray
+    s : float or numpy.ndarray
         sigma for smearing term (= the uncertainty to be accounted for)
     nsigma : int
         The range in sigmas over which to do the convolution, 3 sigmas is >
@@ -452,30 +533,31 @@ def conv_llh(actual_values, expected_values):
 
     Parameters
     ----------
-    actual_values, expected_values : numpy.ndarrays of same shape
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
 
     Returns
     -------
-    total log of convoluted poisson likelihood
+    conv_llh : numpy.ndarray
+        log of convoluted poisson likelihood in each bin
 
     """
-    actual_values = unp.nominal_values(actual_values).ravel()
-    sigma = unp.std_devs(expected_values).ravel()
-    expected_values = unp.nominal_values(expected_values).ravel()
-    triplets = np.array([actual_values, expected_values, sigma]).T
-    norm_triplets = np.array([actual_values, actual_values, sigma]).T
-    total = 0
-    for i in range(len(triplets)):
-        total += np.log(max(SMALL_POS, norm_conv_poisson(*triplets[i])))
-        total -= np.log(max(SMALL_POS, norm_conv_poisson(*norm_triplets[i])))
-    return total
+    actual_values = _float64(actual_values).ravel()
+    sigma = np.sqrt(_variances(expected_values)).ravel()
+    expected_values = _float64(expected_values).ravel()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (
+            np.log(np.fmax(SMALL_POS, norm_conv_poisson(
+                actual_values, expected_values, sigma)))
+            - np.log(np.fmax(SMALL_POS, norm_conv_poisson(
+                actual_values, actual_values, sigma)))
+        )
 
 def barlow_llh(actual_values, expected_values):
     """Compute the Barlow LLH taking into account finite statistics.
     The likelihood is described in this paper: https://doi.org/10.1016/0010-4655(93)90005-W
     Parameters
     ----------
-    actual_values, expected_values : numpy.ndarrays of same shape
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
 
     Returns
     -------
@@ -483,9 +565,9 @@ def barlow_llh(actual_values, expected_values):
 
     """
      
-    actual_values = unp.nominal_values(actual_values).ravel()
-    sigmas = unp.std_devs(expected_values).ravel()
-    expected_values = unp.nominal_values(expected_values).ravel()
+    actual_values = _float64(actual_values).ravel()
+    sigmas = np.sqrt(_variances(expected_values)).ravel()
+    expected_values = _float64(expected_values).ravel()
 
     with np.errstate(invalid='ignore'):
         # Mask off any nan expected values (these are assumed to be ok)
@@ -516,8 +598,10 @@ def barlow_llh(actual_values, expected_values):
     
     # TODO(tahmid): Run checks in case expected_values and/or corresponding sigma == 0
     # and handle these appropriately. If sigma/ev == 0 the code below will fail.
-    unweighted = np.array([(ev/s)**2 for ev, s in zip(expected_values, sigmas)])
-    weights = np.array([s**2/ev for ev, s in zip(expected_values, sigmas)])
+    expected_values = np.ma.filled(expected_values, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unweighted = (expected_values / sigmas)**2
+        weights = sigmas**2 / expected_values
 
     llh = likelihood_functions.barlowLLH(actual_values, unweighted, weights)
     return llh
@@ -528,7 +612,7 @@ def mod_chi2(actual_values, expected_values):
 
     Parameters
     ----------
-    actual_values, expected_values : numpy.ndarrays of same shape
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
 
     Returns
     -------
@@ -537,13 +621,520 @@ def mod_chi2(actual_values, expected_values):
         the inputs
 
     """
-    # Replace 0's with small positive numbers to avoid inf in log
-    np.clip(expected_values, a_min=SMALL_POS, a_max=np.inf,
-            out=expected_values)
-    actual_values = unp.nominal_values(actual_values).ravel()
-    sigma = unp.std_devs(expected_values).ravel()
-    expected_values = unp.nominal_values(expected_values).ravel()
+    actual_values = _float64(actual_values).ravel()
+    variances = _variances(expected_values).ravel()
+    expected_values = _float64(expected_values).ravel()
+    # Replace 0's with small positive numbers to avoid division by zero
+    expected_values = np.clip(expected_values, a_min=SMALL_POS, a_max=np.inf)
     m_chi2 = (
-        (actual_values - expected_values)**2 / (sigma**2 + expected_values)
+        (actual_values - expected_values)**2 / (variances + expected_values)
     )
     return m_chi2
+
+
+def fast_metric(metric, actual_values, expected_values, binned=False):
+    """Evaluate one of the `FAST_METRICS` in a single compiled pass over the
+    bins, including the validation of the inputs.
+
+    Results agree with those of the functions of the same name (summed with
+    `total`), but without creating intermediate (masked) arrays. Bins with nan
+    expectation are skipped by all metrics (as they are masked by `llh`).
+
+    Parameters
+    ----------
+    metric : str
+        One of `FAST_METRICS`
+
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
+        Variances of `expected_values` are used by the metrics accounting for
+        finite MC statistics.
+
+    binned : bool
+        Whether to return the per-bin values instead of the total
+
+    Returns
+    -------
+    total : float, or binned values : numpy.ndarray if `binned=True`
+        Skipped bins (with nan expectation) and those ignored by the reference
+        implementation (e.g. empty data bins for `llh`) contribute zero.
+
+    """
+    actual = _float64(actual_values)
+    expected = _float64(expected_values)
+    if actual.shape != expected.shape:
+        raise ValueError(
+            'Shape mismatch: actual_values.shape = %s,'
+            ' expected_values.shape = %s' % (actual.shape, expected.shape)
+        )
+    shape = actual.shape
+    actual = actual.ravel()
+    expected = expected.ravel()
+    binned_values = np.empty_like(expected)
+
+    if metric == 'llh':
+        total_value = _llh_kernel(actual, expected, binned_values)
+    elif metric in ('mcllh_mean', 'mcllh_eff'):
+        # prior hyperparameters as in `mcllh_mean` and `mcllh_eff`
+        a = 0. if metric == 'mcllh_mean' else 1.
+        total_value = _poisson_gamma_kernel(
+            actual, expected, _variances(expected_values).ravel(), a, 0.,
+            binned_values
+        )
+    elif metric == 'mod_chi2':
+        total_value = _mod_chi2_kernel(
+            actual, expected, _variances(expected_values).ravel(),
+            binned_values
+        )
+    else:
+        raise ValueError('`metric` "%s" has no fast implementation; use one'
+                         ' of %s.' % (metric, FAST_METRICS))
+
+    if binned:
+        return binned_values.reshape(shape)
+    return total_value
+
+
+def metric_batch(metric, actual_values, expected_values, variances=None):
+    """Evaluate the total of `metric` for each of a batch of pseudo-data
+    distributions against one fixed expectation.
+
+    `FAST_METRICS` are evaluated for all trials in a single compiled loop;
+    other metrics fall back to calling the metric function for each trial.
+
+    Parameters
+    ----------
+    metric : str
+        One of `ALL_METRICS`
+
+    actual_values : numpy.ndarray of shape (n_trials, n_bins)
+        One (flattened) pseudo-data distribution per row
+
+    expected_values : numpy.ndarray or Map with `n_bins` elements
+
+    variances : None or numpy.ndarray with `n_bins` elements
+        Variances of the expectation; if None, these are taken from
+        `expected_values`
+
+    Returns
+    -------
+    totals : numpy.ndarray of shape (n_trials,)
+        Bins where the expectation is nan are skipped
+
+    """
+    if variances is None:
+        variances = _variances(expected_values)
+    expected = _float64(expected_values).ravel()
+    variances = np.asarray(variances, dtype=np.float64).ravel()
+    actual = np.asarray(actual_values, dtype=np.float64)
+    actual = actual.reshape(actual.shape[0], -1)
+    if actual.shape[1] != expected.size:
+        raise ValueError(
+            'Shape mismatch: actual_values.shape = %s, expected_values.size'
+            ' = %s' % (actual.shape, expected.size)
+        )
+
+    # Skip bins with nan expectation along with the (nan) pseudo-data drawn
+    # from them (see `MapSet.fluctuate_batch`), as `llh` masks these
+    valid = ~np.isnan(expected)
+    if not np.all(valid):
+        actual = actual[:, valid]
+        expected = expected[valid]
+        variances = variances[valid]
+
+    totals = np.empty(actual.shape[0], dtype=np.float64)
+    if metric == 'llh':
+        _llh_batch_kernel(actual, expected, totals)
+    elif metric in ('mcllh_mean', 'mcllh_eff'):
+        a = 0. if metric == 'mcllh_mean' else 1.
+        _poisson_gamma_batch_kernel(actual, expected, variances, a, 0.,
+                                    totals)
+    elif metric == 'mod_chi2':
+        _mod_chi2_batch_kernel(actual, expected, variances, totals)
+    elif metric in ALL_METRICS:
+        expected = unp.uarray(expected, np.sqrt(variances))
+        metric_func = globals()[metric]
+        for trial, trial_values in enumerate(actual):
+            totals[trial] = total(metric_func(trial_values, expected))
+    else:
+        raise ValueError('`metric` "%s" not recognized; use one of %s.'
+                         % (metric, ALL_METRICS))
+    return totals
+
+
+def metric_gradient(metric, actual_values, expected_values):
+    """Derivative of `metric` in each bin w.r.t. the expected value in that
+    bin. Together with the derivatives of the expectation w.r.t. params, this
+    gives the gradient of the metric total via the chain rule.
+
+    Parameters
+    ----------
+    metric : str
+        One of `GRADIENT_METRICS`
+
+    actual_values, expected_values : numpy.ndarrays or Maps of same shape
+
+    Returns
+    -------
+    gradient : numpy.ndarray of same shape as the inputs
+        Zero in bins where the expected value is nan or below `SMALL_POS`
+        (where it is clipped, and so does not affect the metric) and, for
+        `llh`, in bins where the actual value is zero (which `llh` skips)
+
+    """
+    if metric not in GRADIENT_METRICS:
+        raise ValueError('Gradient of metric "%s" not available; must be one'
+                         ' of %s' % (metric, GRADIENT_METRICS))
+    actual = _float64(actual_values)
+    expected = _float64(expected_values)
+    assert actual.shape == expected.shape
+
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(expected) & (expected > SMALL_POS)
+    expected = np.where(valid, expected, 1.)
+    if metric == 'llh':
+        # `llh` skips empty data bins, so these do not depend on `expected`
+        valid &= actual != 0
+        gradient = actual / expected - 1.
+    else:
+        # `chi2` clips the actual values as well
+        actual = np.clip(actual, a_min=SMALL_POS, a_max=np.inf)
+        gradient = 1. - np.square(actual / expected)
+    return np.where(valid, gradient, 0.)
+
+
+@jit(nopython=True, nogil=True)
+def _compensated_add(total_value, compensation, value):
+    """One step of Neumaier's compensated summation"""
+    new_total = total_value + value
+    if math.isfinite(new_total):
+        if abs(total_value) >= abs(value):
+            compensation += (total_value - new_total) + value
+        else:
+            compensation += (value - new_total) + total_value
+    return new_total, compensation
+
+
+@jit(nopython=True, nogil=True)
+def _check_actual(k):
+    """Validation of a data bin as in the reference implementations"""
+    if not (k >= 0 and math.isfinite(k)):
+        raise ValueError(
+            '`actual_values` must be >= 0 and neither inf nor nan'
+        )
+
+
+@jit(nopython=True, nogil=True)
+def _llh_kernel(actual, expected, binned_values):
+    """Fused version of `llh`"""
+    total_value = 0.
+    compensation = 0.
+    for i in range(actual.size):
+        k = actual[i]
+        lam = expected[i]
+        value = 0.
+        # nan expectations are masked in `llh` (along with the data in those
+        # bins), as are empty data bins (by the log of the centering term)
+        if not math.isnan(lam):
+            _check_actual(k)
+            if lam < 0:
+                raise ValueError('`expected_values` must all be >= 0')
+            if k > 0:
+                lam = max(lam, SMALL_POS)
+                value = k * math.log(lam) - lam - (k * math.log(k) - k)
+        binned_values[i] = value
+        total_value, compensation = _compensated_add(total_value,
+                                                     compensation, value)
+    return total_value + compensation
+
+
+@jit(nopython=True, nogil=True)
+def _poisson_gamma_kernel(actual, expected, variances, a, b, binned_values):
+    """Fused version of `likelihood_functions.poisson_gamma` (as used by
+    `mcllh_mean` and `mcllh_eff`)"""
+    total_value = 0.
+    compensation = 0.
+    for i in range(actual.size):
+        k = actual[i]
+        sum_w = expected[i]
+        sum_w2 = variances[i]
+        value = 0.
+        # bins with nan expectation are skipped, as in `_llh_kernel`
+        if not math.isnan(sum_w):
+            _check_actual(k)
+            if sum_w < 0:
+                raise ValueError('`expected_values` must all be >= 0')
+            if sum_w <= 0 or sum_w2 < 0:
+                value = 0. if k == 0 else -np.inf
+            elif sum_w2 == 0:
+                # Poisson limit
+                value = k * math.log(sum_w) - sum_w - math.lgamma(k + 1.)
+            else:
+                alpha = sum_w**2 / sum_w2 + a
+                beta = sum_w / sum_w2 + b
+                value = (alpha * math.log(beta) + math.lgamma(k + alpha)
+                         - math.lgamma(k + 1.)
+                         - (k + alpha) * math.log1p(beta)
+                         - math.lgamma(alpha))
+        binned_values[i] = value
+        total_value, compensation = _compensated_add(total_value,
+                                                     compensation, value)
+    return total_value + compensation
+
+
+@jit(nopython=True, nogil=True)
+def _mod_chi2_kernel(actual, expected, variances, binned_values):
+    """Fused version of `mod_chi2`"""
+    total_value = 0.
+    compensation = 0.
+    for i in range(actual.size):
+        lam = expected[i]
+        value = 0.
+        # bins with nan expectation are skipped, as in `_llh_kernel`
+        if not math.isnan(lam):
+            lam = max(lam, SMALL_POS)
+            value = (actual[i] - lam)**2 / (variances[i] + lam)
+        binned_values[i] = value
+        total_value, compensation = _compensated_add(total_value,
+                                                     compensation, value)
+    return total_value + compensation
+
+
+@jit(nopython=True, nogil=True)
+def _llh_batch_kernel(actual, expected, totals):
+    """`_llh_kernel` for each row of `actual`"""
+    binned_values = np.empty_like(expected)
+    for trial in range(actual.shape[0]):
+        totals[trial] = _llh_kernel(actual[trial], expected, binned_values)
+
+
+@jit(nopython=True, nogil=True)
+def _poisson_gamma_batch_kernel(actual, expected, variances, a, b, totals):
+    """`_poisson_gamma_kernel` for each row of `actual`"""
+    binned_values = np.empty_like(expected)
+    for trial in range(actual.shape[0]):
+        totals[trial] = _poisson_gamma_kernel(actual[trial], expected,
+                                              variances, a, b, binned_values)
+
+
+@jit(nopython=True, nogil=True)
+def _mod_chi2_batch_kernel(actual, expected, variances, totals):
+    """`_mod_chi2_kernel` for each row of `actual`"""
+    binned_values = np.empty_like(expected)
+    for trial in range(actual.shape[0]):
+        totals[trial] = _mod_chi2_kernel(actual[trial], expected, variances,
+                                         binned_values)
+
+
+def test_mixed_precision():
+    """Fit results from single precision event weights, histogrammed and
+    reduced in double precision, must agree with those of an all-double
+    precision calculation"""
+    from scipy.optimize import minimize_scalar
+    from pisa.core.translation import fill_hist
+
+    rand = np.random.RandomState(0)
+    n_events, n_bins = 10**6, 50
+    flat_index = rand.randint(0, n_bins, n_events)
+    weights = rand.exponential(1e-3, (n_events, 1))
+
+    def histogram(weights):
+        hist = np.zeros((n_bins, 1))
+        sumw2 = np.zeros((n_bins, 1))
+        fill_hist(flat_index, weights, hist, np.zeros(n_bins), sumw2)
+        return unp.uarray(hist.ravel(), np.sqrt(sumw2.ravel()))
+
+    hist64 = histogram(weights)
+    hist32 = histogram(weights.astype(np.float32))
+    data = rand.poisson(1.1 * unp.nominal_values(hist64))
+
+    for metric in [llh, mcllh_eff]:
+        def neg_total(scale, hist, metric=metric):
+            return -total(metric(data, scale * hist))
+        fits = [minimize_scalar(neg_total, bounds=(0.5, 2.), args=(hist,),
+                                method='bounded', options=dict(xatol=1e-10))
+                for hist in (hist64, hist32)]
+        assert np.isclose(fits[0].x, fits[1].x, rtol=1e-6, atol=0), \
+            (metric.__name__, fits[0].x, fits[1].x)
+        assert np.isclose(fits[0].fun, fits[1].fun, rtol=1e-6, atol=0), \
+            (metric.__name__, fits[0].fun, fits[1].fun)
+
+    logging.info('<< PASS : test_mixed_precision >>')
+
+
+def test_fast_metric():
+    """Fused kernels must reproduce the reference implementations"""
+    rand = np.random.RandomState(0)
+    shape = (20, 10)
+    expected = rand.uniform(0, 20, shape)
+    sigma = rand.uniform(0, 3, shape)
+    # include edge cases: empty data bins, zero and nan expectation, and
+    # zero uncertainty
+    expected[0, :3] = 0
+    expected[1, 0] = np.nan
+    sigma[2, :3] = 0
+    actual = rand.poisson(np.nan_to_num(expected) + 1).astype(np.float64)
+    actual[3, :3] = 0
+    expected_u = unp.uarray(expected, sigma)
+
+    for metric in FAST_METRICS:
+        ref_binned = globals()[metric](actual, expected_u)
+        test_binned = fast_metric(metric, actual, expected_u, binned=True)
+        if metric != 'llh':
+            # unlike `llh`, these do not mask the bin with nan expectation,
+            # which the fused kernels skip for all metrics
+            ok = np.isfinite(expected)
+            assert np.all(test_binned[~ok] == 0), metric
+            ref_binned = globals()[metric](actual[ok], expected_u[ok])
+            test_binned = test_binned[ok]
+        # (the gamma function terms cancel to a large degree for small
+        # uncertainties, where scipy's and the math module's differ in the
+        # last digits)
+        assert np.allclose(np.ma.filled(ref_binned, 0).ravel(),
+                           test_binned.ravel(), rtol=1e-10, atol=1e-8), metric
+        assert np.isclose(total(ref_binned), np.sum(test_binned),
+                          rtol=1e-10, atol=0), metric
+
+    for bad_actual in [-1, np.inf, np.nan]:
+        actual_ = actual.copy()
+        actual_[5, 5] = bad_actual
+        try:
+            fast_metric('llh', actual_, expected)
+        except ValueError:
+            pass
+        else:
+            assert False, bad_actual
+
+    # data in bins with nan expectation is not validated, and single and
+    # batched totals agree
+    actual_ = actual.copy()
+    actual_[1, 0] = np.nan
+    for metric in FAST_METRICS:
+        assert np.isclose(fast_metric(metric, actual_, expected_u),
+                          metric_batch(metric, actual_[np.newaxis],
+                                       expected_u)[0],
+                          rtol=1e-12, atol=0), metric
+
+    logging.info('<< PASS : test_fast_metric >>')
+
+
+def test_conv_llh():
+    """Batched `conv_llh` must reproduce the original bin-by-bin
+    implementation"""
+    import time
+
+    def ref_conv_poisson(k, l, s, nsigma=3, steps=50):
+        l = max(SMALL_POS, l)
+        st = 2*(steps + 1)
+        conv_x = np.linspace(-nsigma*s, +nsigma*s, st)[:-1]+nsigma*s/(st-1.)
+        conv_y = log_smear(conv_x, s)
+        f_x = conv_x + l
+        idx = np.argmax(f_x > 0)
+        f_y = np.nan_to_num(log_poisson(k, f_x[idx:]))
+        return np.exp(conv_y[idx:] + f_y).sum() / np.sum(np.exp(conv_y))
+
+    def ref_norm_conv_poisson(k, l, s):
+        return (ref_conv_poisson(k, l, s) * np.exp(log_poisson(l, l))
+                / ref_conv_poisson(l, l, s))
+
+    rand = np.random.RandomState(0)
+    n_bins = 2000
+    expected = rand.uniform(0, 30, n_bins)
+    sigma = rand.uniform(0.1, 10, n_bins)
+    actual = rand.poisson(expected).astype(np.float64)
+    # empty bins and uncertainties larger than the expectation
+    expected[:5] = 0
+    actual[5:10] = 0
+    sigma[10:15] = 50
+    expected_u = unp.uarray(expected, sigma)
+
+    conv_llh(actual[:10], expected_u[:10]) # compile before timing
+    t0 = time.time()
+    ref = np.array([
+        np.log(max(SMALL_POS, ref_norm_conv_poisson(d, e, s)))
+        - np.log(max(SMALL_POS, ref_norm_conv_poisson(d, d, s)))
+        for d, e, s in zip(actual, expected, sigma)
+    ])
+    t1 = time.time()
+    test = conv_llh(actual, expected_u)
+    t2 = time.time()
+
+    assert np.allclose(test, ref, rtol=1e-10, atol=1e-10)
+    assert np.isclose(total(test), np.sum(ref), rtol=1e-10)
+    assert np.isclose(conv_poisson(actual[20], expected[20], sigma[20]),
+                      ref_conv_poisson(actual[20], expected[20], sigma[20]),
+                      rtol=1e-12)
+
+    logging.info('conv_llh with %d bins: bin by bin %.3f s, batched %.6f s',
+                 n_bins, t1 - t0, t2 - t1)
+    logging.info('<< PASS : test_conv_llh >>')
+
+
+def test_metric_batch():
+    """Batched evaluation must agree with evaluating each trial in turn"""
+    import time
+
+    rand = np.random.RandomState(0)
+    n_trials, n_bins = 500, 200
+    expected = rand.uniform(0, 20, n_bins)
+    sigma = rand.uniform(0, 2, n_bins)
+    expected[0] = 0
+    sigma[1] = 0
+    expected_u = unp.uarray(expected, sigma)
+    actual = rand.poisson(expected, (n_trials, n_bins))
+
+    for metric in FAST_METRICS + ['chi2']:
+        n = n_trials if metric in FAST_METRICS else 10
+        totals = metric_batch(metric, actual[:n], expected_u)
+        t0 = time.time()
+        totals = metric_batch(metric, actual[:n], expected_u)
+        t1 = time.time()
+        ref = [total(globals()[metric](a, expected_u)) for a in actual[:n]]
+        t2 = time.time()
+        assert np.allclose(totals, ref, rtol=1e-10, atol=1e-8), metric
+        logging.info('%s for %d trials: per trial %.3f s, batched %.4f s',
+                     metric, n, t2 - t1, t1 - t0)
+
+    try:
+        metric_batch('llh', actual[:, :-1], expected_u)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+    logging.info('<< PASS : test_metric_batch >>')
+
+
+def test_metric_gradient():
+    """Per-bin gradients must agree with finite differences of the metrics"""
+    rand = np.random.RandomState(0)
+    n_bins = 100
+    expected = rand.uniform(0.5, 20, n_bins)
+    actual = rand.poisson(expected).astype(np.float64)
+    actual[0] = 0
+    step = 1e-6
+
+    for metric in GRADIENT_METRICS:
+        gradient = metric_gradient(metric, actual, expected)
+        upper = globals()[metric](actual, expected + step)
+        lower = globals()[metric](actual, expected - step)
+        numerical = np.ma.filled((upper - lower) / (2*step), 0)
+        assert np.allclose(gradient, numerical, rtol=1e-5), metric
+        empty = metric_gradient(metric, actual[:2], [0., np.nan])
+        assert np.all(empty == 0), metric
+
+    try:
+        metric_gradient('mod_chi2', actual, expected)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+    logging.info('<< PASS : test_metric_gradient >>')
+
+
+if __name__ == '__main__':
+    test_mixed_precision()
+    test_fast_metric()
+    test_conv_llh()
+    test_metric_batch()
+    test_metric_gradient()
@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+
+"""
+Benchmark applying transforms that share a kernel to the sum of their inputs
+(see `pisa.core.transform.TransformSet.apply`) against applying each of them
+separately, for the transform-based ("cake") stages of a pipeline.
+"""
+
+
+from __future__ import absolute_import, division
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+import time
+
+import numpy as np
+
+from pisa.core.pipeline import Pipeline
+from pisa.core.transform import TransformSet
+from pisa.utils.log import logging, set_verbosity
+
+
+__all__ = ['count_multiplies', 'benchmark_shared_kernels', 'parse_args',
+           'main']
+
+__author__ = 'J.L. Lanfranchi, P. Eller'
+
+__license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.'''
+
+
+def count_multiplies(transforms, grouped):
+    """Number of kernel multiplications needed to apply `transforms` once.
+
+    Parameters
+    ----------
+    transforms : TransformSet
+
+    grouped : bool
+        Whether transforms sharing a kernel are applied once to their summed
+        inputs
+
+    Returns
+    -------
+    num_multiplies : int
+
+    """
+    if grouped:
+        applied = [group[0] for group in transforms.shared_kernel_groups]
+    else:
+        applied = list(transforms)
+    num_multiplies = 0
+    for xform in applied:
+        # sparse kernels only multiply their stored entries
+        nnz = getattr(xform, 'nnz', None)
+        num_multiplies += np.size(xform.xform_array) if nnz is None else nnz
+    return num_multiplies
+
+
+def benchmark_shared_kernels(pipeline, num_iterations=10):
+    """Time `get_outputs` and count kernel multiplications per call with and
+    without summing the inputs of transforms sharing a kernel.
+
+    Parameters
+    ----------
+    pipeline : Pipeline or convertible thereto
+        Pipeline whose transform-based stages are benchmarked; their output
+        caches are disabled
+
+    num_iterations : int > 0
+        Number of `get_outputs` calls to average the time over
+
+    Returns
+    -------
+    results : OrderedDict
+        Maps `grouped` (False, True) to an OrderedDict with the time per
+        `get_outputs` call ('time') and the number of kernel multiplications
+        per call ('multiplies')
+
+    """
+    if not isinstance(pipeline, Pipeline):
+        pipeline = Pipeline(pipeline)
+    for stage in pipeline.stages:
+        if hasattr(stage, 'outputs_cache'):
+            stage.outputs_cache = None
+
+    orig_grouping = TransformSet.group_shared_kernels
+    results = OrderedDict()
+    outputs = OrderedDict()
+    try:
+        for grouped in (False, True):
+            TransformSet.group_shared_kernels = grouped
+            # Compute transforms (and fill caches) outside of the timing
+            pipeline.get_outputs()
+            t0 = time.time()
+            for _ in range(num_iterations):
+                outputs[grouped] = pipeline.get_outputs()
+            elapsed = (time.time() - t0) / num_iterations
+
+            multiplies = 0
+            for stage in pipeline.stages:
+                transforms = getattr(stage, 'transforms', None)
+                if isinstance(transforms, TransformSet):
+                    multiplies += count_multiplies(transforms, grouped)
+            results[grouped] = OrderedDict([('time', elapsed),
+                                            ('multiplies', multiplies)])
+            logging.info(
+                'grouped=%s: %.3f ms and %d kernel multiplications per'
+                ' get_outputs', grouped, elapsed*1e3, multiplies
+            )
+    finally:
+        TransformSet.group_shared_kernels = orig_grouping
+
+    for ungrouped_map, grouped_map in zip(outputs[False], outputs[True]):
+        assert np.allclose(ungrouped_map.nominal_values,
+                           grouped_map.nominal_values, rtol=1e-10), \
+                ungrouped_map.name
+
+    return results
+
+
+def parse_args():
+    """Get command line arguments"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-p', '--pipeline', metavar='CONFIGFILE', type=str,
+        default='settings/pipeline/example_cake_nusquids.cfg',
+        help='Settings file for the pipeline to benchmark'
+    )
+    parser.add_argument(
+        '-n', '--num-iterations', type=int, default=10,
+        help='Number of get_outputs calls to time'
+    )
+    parser.add_argument(
+        '-v', action='count', default=1,
+        help='set verbosity level'
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Run `benchmark_shared_kernels` with arguments from command line"""
+    args = parse_args()
+    set_verbosity(args.v)
+    results = benchmark_shared_kernels(pipeline=args.pipeline,
+                                       num_iterations=args.num_iterations)
+    if results[False]['multiplies'] == 0:
+        logging.info('No transforms applied by the pipeline.')
+        return
+    saved = 1 - results[True]['multiplies'] / results[False]['multiplies']
+    logging.info('Summing shared-kernel inputs saves %.1f%% of kernel'
+                 ' multiplications and %.1f%% of get_outputs time',
+                 100*saved,
+                 100*(1 - results[True]['time'] / results[False]['time']))
+
+
+if __name__ == '__main__':
+    main()